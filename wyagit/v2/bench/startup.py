@@ -0,0 +1,110 @@
+"""
+Cold start benchmark: how long wyag spends importing modules before it
+does anything, measured with `python -X importtime`.
+
+    python bench/startup.py [--repo PATH] [--runs N] [--budget-ms MS]
+
+Each command is run once to warm the bytecode cache, then --runs times.
+The best run's total import time is compared to the budget, and none of
+the modules in HEAVY_MODULES may be imported at all. Exits 1 on a
+regression, so it can gate CI.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+WYAG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "libwyag.py")
+
+# Commands a script would call in a loop. "{branch}" and "{short}" stand
+# for the current branch and HEAD's abbreviated sha in the benchmarked repo:
+# a name other than HEAD goes through the tag/branch/sha lookups
+STARTUP_COMMANDS = [
+    ["rev-parse", "HEAD"],
+    ["rev-parse", "{branch}"],
+    ["rev-parse", "{short}"],
+    ["cat-file", "commit", "HEAD"],
+    ["ls-tree", "HEAD"],
+    ["show-ref"],
+]
+
+STARTUP_BUDGET_MS = 100
+STARTUP_RUNS = 5
+
+# Only ever imported when something needs them, never at startup
+HEAVY_MODULES = ("loguru", "asyncio", "concurrent.futures", "tempfile")
+
+
+class ImportTime:
+    def __init__(self, stderr: str):
+        self.total_us = 0
+        self.modules = dict()  # name -> cumulative us
+        for line in stderr.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            _, cumulative, name = line[len("import time:") :].split("|")
+            self.modules[name.strip()] = int(cumulative)
+            if not name.startswith("  "):
+                self.total_us += int(cumulative)  # Top level import
+
+
+def startup_run(repo: str, command: list[str]) -> tuple[ImportTime, float]:
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", WYAG, *command],
+        cwd=repo, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+    )
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise Exception(f"wyag {' '.join(command)} failed:\n{result.stderr[-2000:]}")
+    return ImportTime(result.stderr), wall
+
+
+def startup_names(repo: str) -> dict[str, str]:
+    """
+    Values for the placeholders of STARTUP_COMMANDS, found with wyag itself
+    """
+    env = dict(os.environ, LOGURU_LEVEL="ERROR")
+    head = subprocess.run(
+        [sys.executable, WYAG, "rev-parse", "HEAD"], cwd=repo, env=env, capture_output=True, text=True, check=True,
+    ).stdout.strip()
+    with open(os.path.join(repo, ".git", "HEAD")) as f:
+        ref = f.read().strip()
+    branch = ref[len("ref: refs/heads/") :] if ref.startswith("ref: refs/heads/") else head
+    return {"branch": branch, "short": head[:7]}
+
+
+def main(argv=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repo", default=".", help="Repository to run the commands in")
+    parser.add_argument("--runs", type=int, default=STARTUP_RUNS)
+    parser.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS)
+    args = parser.parse_args(argv)
+
+    names = startup_names(args.repo)
+    failed = False
+    for command in STARTUP_COMMANDS:
+        command = [arg.format(**names) for arg in command]
+        startup_run(args.repo, command)  # Warm up
+        runs = [startup_run(args.repo, command) for _ in range(args.runs)]
+        imports, _ = min(runs, key=lambda run: run[0].total_us)
+        wall = min(run[1] for run in runs)
+
+        heavy = [m for m in HEAVY_MODULES if m in imports.modules]
+        over = imports.total_us / 1000 > args.budget_ms
+        status = "FAIL" if over or heavy else "ok"
+        failed = failed or status == "FAIL"
+        print(f"{status:4} {' '.join(command):24} imports {imports.total_us / 1000:6.1f}ms"
+              f"  wall {wall * 1000:6.1f}ms" + (f"  imported {', '.join(heavy)}" if heavy else ""))
+
+    print(f"budget: {args.budget_ms:.0f}ms of imports per command")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import sys
+from datetime import datetime, timedelta, timezone
+from common.parser import sub_parsers
+from common.helper_classes import repo_root_finder, object_find, object_read
+from common.blame import Blamer, blame
+from common.revision import commit_info
+from common.linediff import split_lines
+
+wyag_blame = sub_parsers.add_parser(
+    "blame", help="Show which commit last changed each line of a file."
+)
+
+wyag_blame.add_argument("rev", nargs="?", default="HEAD", help="Blame the file as of this commit")
+
+wyag_blame.add_argument("path", help="The file, relative to the top of the worktree")
+
+
+def blame_author(repo, sha: str) -> tuple[str, str]:
+    """
+    (name, date) of a commit's author, the date in the author's timezone
+    """
+    # author Name <email> 1700000000 +0100
+    author = object_read(repo, sha).kvlm[b"author"].decode("utf8")
+    name_email, timestamp, tz = author.rsplit(" ", 2)
+    name = name_email[: name_email.rfind(" <")] if " <" in name_email else name_email
+    sign = -1 if tz[0] == "-" else 1
+    offset = timedelta(hours=int(tz[1:3]), minutes=int(tz[3:5])) * sign
+    date = datetime.fromtimestamp(int(timestamp), timezone(offset))
+    return name, date.strftime("%Y-%m-%d %H:%M:%S ") + tz
+
+
+def cmd_blame(args):
+    repo = repo_root_finder()
+    commit = object_find(repo, args.rev, fmt=b"commit")
+    entries = blame(repo, commit, args.path)
+
+    authors = {e.commit: blame_author(repo, e.commit) for e in entries}
+    boundaries = {e.commit for e in entries if not object_read(repo, e.commit).kvlm.get(b"parent")}
+    name_width = max((len(name) for name, _ in authors.values()), default=0)
+
+    blob = Blamer(repo).tree_entry(commit_info(repo, commit).tree, args.path)
+    lines = split_lines(object_read(repo, blob).blobdata)
+    number_width = len(str(len(lines)))
+
+    out = sys.stdout.buffer
+    for e in entries:
+        name, date = authors[e.commit]
+        label = "^" + e.commit[:7] if e.commit in boundaries else e.commit[:8]
+        for i in range(e.final_start, e.final_start + e.length):
+            prefix = f"{label} ({name:<{name_width}} {date} {i + 1:>{number_width}}) "
+            line = lines[i] if lines[i].endswith(b"\n") else lines[i] + b"\n"
+            out.write(prefix.encode("utf8") + line)
@@ -0,0 +1,98 @@
+import os
+import sys
+from common.parser import sub_parsers
+from common.helper_classes import repo_root_finder
+from common.ignore import gitignore_read
+
+wyag_check_ignore = sub_parsers.add_parser(
+    "check-ignore", help="Check path(s) against ignore rules."
+)
+
+wyag_check_ignore.add_argument(
+    "--stdin", action="store_true", help="Read paths from standard input, one per line"
+)
+
+wyag_check_ignore.add_argument(
+    "-z", dest="nul", action="store_true", help="Paths (and output fields) are NUL-terminated"
+)
+
+wyag_check_ignore.add_argument(
+    "-v", "--verbose", action="store_true", help="Show the file, line and pattern deciding each path"
+)
+
+wyag_check_ignore.add_argument(
+    "-n", "--non-matching", dest="non_matching", action="store_true",
+    help="With --verbose, also show paths no pattern matches",
+)
+
+wyag_check_ignore.add_argument("path", nargs="*", help="Paths to check")
+
+STDIN_CHUNK_SIZE = 64 * 1024
+
+
+def check_ignore_is_dir(repo, path: str) -> bool:
+    return path.endswith("/") or os.path.isdir(os.path.join(repo.worktree, path))
+
+
+def stdin_paths(sep: bytes):
+    """
+    Paths from stdin as soon as each one is complete: with a co-process on
+    the other end, nothing more may come until we've answered
+    """
+    pending = b""
+    while True:
+        chunk = sys.stdin.buffer.read1(STDIN_CHUNK_SIZE)
+        if not chunk:
+            break
+        pending += chunk
+        *records, pending = pending.split(sep)
+        for record in records:
+            yield os.fsdecode(record.rstrip(b"\r") if sep == b"\n" else record)
+    if pending:
+        yield os.fsdecode(pending)
+
+
+def check_ignore_output(rule, path: str, args) -> str | None:
+    if not args.verbose:
+        if rule is None or rule.negated:
+            return None
+        return path + ("\0" if args.nul else "\n")
+
+    if rule is None:
+        if not args.non_matching:
+            return None
+        fields = ("", "", "")
+    else:
+        fields = (rule.source, str(rule.line_number), ("!" if rule.negated else "") + rule.pattern)
+    if args.nul:
+        return "\0".join(fields + (path,)) + "\0"
+    return ":".join(fields) + "\t" + path + "\n"
+
+
+def cmd_check_ignore(args):
+    if args.stdin and args.path:
+        raise Exception("Cannot specify path arguments with --stdin")
+    if args.non_matching and not args.verbose:
+        raise Exception("--non-matching is only valid with --verbose")
+    if args.nul and not args.stdin:
+        raise Exception("-z only makes sense with --stdin")
+    if not args.stdin and not args.path:
+        raise Exception("No path specified")
+
+    repo = repo_root_finder()
+    # Loaded once, then every path reuses the same compiled rules
+    rules = gitignore_read(repo)
+    paths = stdin_paths(b"\0" if args.nul else b"\n") if args.stdin else args.path
+
+    ignored = False
+    for path in paths:
+        rule = rules.match(path.rstrip("/"), check_ignore_is_dir(repo, path))
+        ignored = ignored or (rule is not None and not rule.negated)
+        out = check_ignore_output(rule, path, args)
+        if out is not None:
+            sys.stdout.write(out)
+            if args.stdin:
+                sys.stdout.flush()
+
+    if not ignored:
+        sys.exit(1)
@@ -1,7 +1,11 @@
 import os
+import sys
 from common.parser import sub_parsers
-from common.helper_classes import object_hash, repo_root_finder, object_find, object_read, tree_checkout
-from loguru import logger
+from common.helper_classes import object_hash, repo_root_finder, object_find, object_read, ref_backend, ref_resolve
+from common.checkout import tree_checkout, worktree_checkout, CHECKOUT_DEFAULT_JOBS
+from common.index import index_read, index_write
+from common.refs import lock_acquire, lock_commit, lock_release
+from common.sparse import sparse_read
 
 wyag_checkout = sub_parsers.add_parser(
     "checkout", help="Checkout a commit inside of a directory."
@@ -9,18 +13,38 @@ wyag_checkout = sub_parsers.add_parser(
 
 wyag_checkout.add_argument("commit", help="The commit or tree to checkout.")
 
-wyag_checkout.add_argument("path", help="The EMPTY directory to checkout on.")
+wyag_checkout.add_argument("path",
+                   nargs="?",
+                   help="The EMPTY directory to checkout on. Without it, switch the worktree to commit.")
+
+wyag_checkout.add_argument("-j", "--jobs",
+                   type=int,
+                   default=None,
+                   help="Number of blobs written in parallel (default: checkout.workers)")
+
+wyag_checkout.add_argument("--stats",
+                   action="store_true",
+                   help="Report files, bytes and throughput once done")
 
 def cmd_checkout(args):
   repo = repo_root_finder()
+  jobs = args.jobs or repo.conf.getint("checkout", "workers", fallback=CHECKOUT_DEFAULT_JOBS)
+
+  if args.path is None:
+      stats = checkout_switch(repo, args.commit, jobs)
+      if args.stats:
+          print(f"checkout: {stats}", file=sys.stderr)
+      return
+
   sha = object_find(repo, args.commit)
   obj = object_read(repo, sha)
 
-  logger.debug(f"repo: {repo} | sha: {sha} | obj: {obj}")
-
-  # If obj is a commit, we grab its tree
+  # If obj is a commit, we grab its tree. Only then do its paths line up
+  # with the sparse checkout cone.
+  sparse = None
   if obj.fmt == b'commit':
     obj = object_read(repo, obj.kvlm[b'tree'].decode('ascii'))
+    sparse = sparse_read(repo)
   
     # Verify that path is an empty directory
   if os.path.exists(args.path):
@@ -31,5 +55,40 @@ def cmd_checkout(args):
   else:
       os.makedirs(args.path)
 
-  tree_checkout(repo, obj, os.path.realpath(args.path))
-  
\ No newline at end of file
+  stats = tree_checkout(repo, obj, os.path.realpath(args.path), jobs=jobs, sparse=sparse)
+  if args.stats:
+      print(f"checkout: {stats}", file=sys.stderr)
+
+
+def checkout_switch(repo, name, jobs):
+  """
+  Switch the worktree, index and HEAD to a branch (or detach at a commit)
+  """
+  branch_ref = f"refs/heads/{name}"
+  is_branch = ref_backend(repo).read(branch_ref) is not None
+
+  new_tree = object_find(repo, name, fmt=b"tree")
+  head = ref_resolve(repo, "HEAD")
+  old_tree = object_find(repo, head, fmt=b"tree") if head else None
+
+  index = index_read(repo)
+  stats = worktree_checkout(repo, old_tree, new_tree, index, jobs=jobs, sparse=sparse_read(repo))
+  index_write(repo, index)
+
+  if is_branch:
+      head_value = f"ref: {branch_ref}"
+  else:
+      head_value = object_find(repo, name, fmt=b"commit")
+  head_path = os.path.join(repo.gitdir, "HEAD")
+  fd = lock_acquire(head_path)
+  try:
+      lock_commit(head_path, fd, f"{head_value}\n".encode("utf8"))
+  except BaseException:
+      lock_release(head_path, fd)
+      raise
+
+  if is_branch:
+      print(f"Switched to branch '{name}'")
+  else:
+      print(f"HEAD is now at {head_value[0:7]}")
+  return stats
@@ -0,0 +1,22 @@
+from common.parser import sub_parsers
+from common.helper_classes import OBJECT_CACHE_SIZE, repo_cache_enable, repo_root_finder
+from common.daemon import daemon_serve, daemon_socket_path
+
+wyag_daemon = sub_parsers.add_parser(
+    "daemon", help="Keep the repository open and answer read-only commands over a socket."
+)
+
+wyag_daemon.add_argument(
+    "--socket", default=None, help="Where to listen (default: .git/wyag.sock)"
+)
+
+wyag_daemon.add_argument(
+    "--cache-size", dest="cache_size", type=int, default=OBJECT_CACHE_SIZE,
+    help="Number of objects kept in memory",
+)
+
+
+def cmd_daemon(args):
+    repo = repo_root_finder()
+    repo_cache_enable(repo, args.cache_size)
+    daemon_serve(repo, args.socket or daemon_socket_path(repo.gitdir))
@@ -0,0 +1,227 @@
+import os
+import sys
+from common.parser import sub_parsers
+from common.helper_classes import repo_root_finder, object_find, object_read, oid_index
+from common.checkout import worktree_index
+from common.index import index_read, index_tree
+from common.linediff import DIFF_CONTEXT, diff_hunks, function_context, split_lines
+from common.renames import RENAME_LIMIT, RENAME_THRESHOLD, detect_renames
+from common.treediff import TreeChange, diff_trees
+
+wyag_diff = sub_parsers.add_parser(
+    "diff", help="Show changes between commits, the index and the worktree."
+)
+
+wyag_diff.add_argument(
+    "--cached",
+    "--staged",
+    dest="cached",
+    action="store_true",
+    help="Compare the index with a commit (default: HEAD) instead of the worktree",
+)
+
+wyag_diff.add_argument(
+    "--name-status",
+    dest="name_status",
+    action="store_true",
+    help="Only show the name and status (A, D, M) of each changed file",
+)
+
+wyag_diff.add_argument(
+    "-U",
+    "--unified",
+    type=int,
+    default=DIFF_CONTEXT,
+    help="Lines of context around each change",
+)
+
+wyag_diff.add_argument(
+    "-M",
+    "--find-renames",
+    dest="find_renames",
+    nargs="?",
+    const=str(RENAME_THRESHOLD),
+    default=None,
+    metavar="n",
+    help="Detect renames, of files at least n%% similar (default: %(const)s)",
+)
+
+wyag_diff.add_argument(
+    "--no-renames",
+    dest="no_renames",
+    action="store_true",
+    help="Show renames as a deletion and an addition",
+)
+
+wyag_diff.add_argument(
+    "-C",
+    "--find-copies",
+    dest="find_copies",
+    nargs="?",
+    const=str(RENAME_THRESHOLD),
+    default=None,
+    metavar="n",
+    help="Also detect copies of modified files",
+)
+
+wyag_diff.add_argument(
+    "-l",
+    dest="rename_limit",
+    type=int,
+    default=None,
+    help="Skip inexact rename detection above this many sources x destinations "
+    "(default: diff.renameLimit)",
+)
+
+wyag_diff.add_argument("commits", nargs="*", help="<commit> [<commit>]")
+
+
+NULL_SHA = "0" * 40
+
+# Like git, only the start of a file is looked at to decide it's binary
+BINARY_SNIFF_BYTES = 8000
+
+
+def rename_score_parse(value: str) -> int:
+    """
+    git's similarity syntax: "60%", or digits read as a fraction, so 6 and 60
+    both mean 60%
+    """
+    if value.endswith("%"):
+        return int(value[:-1])
+    if not value.isdigit():
+        raise Exception(f"Bad similarity score {value}")
+    # Only the first two digits matter: read as integers, never as a float
+    return int(value.ljust(2, "0")[:2])
+
+
+def diff_renames(repo, args, changes: list[TreeChange], new_is_worktree: bool) -> list[TreeChange]:
+    renames = repo.conf.getboolean("diff", "renames", fallback=True)
+    if args.no_renames or not (renames or args.find_renames or args.find_copies):
+        return changes
+
+    threshold = rename_score_parse(args.find_copies or args.find_renames or str(RENAME_THRESHOLD))
+    limit = args.rename_limit or repo.conf.getint("diff", "renamelimit", fallback=RENAME_LIMIT)
+    return detect_renames(
+        changes,
+        lambda c: diff_blob_data(repo, c.old_sha, c.path, False),
+        lambda c: diff_blob_data(repo, c.new_sha, c.path, new_is_worktree),
+        threshold=threshold,
+        limit=limit,
+        copies=args.find_copies is not None,
+    )
+
+
+def diff_sides(repo, args):
+    """
+    The two trees to compare, and whether the second one is the worktree
+    (its changed blobs are only on disk), following git:
+      diff                  index -> worktree
+      diff <a>              a -> worktree
+      diff --cached [<a>]   a (HEAD) -> index
+      diff <a> <b>          a -> b (also spelled a..b)
+    """
+    commits = args.commits
+    if len(commits) == 1 and ".." in commits[0]:
+        left, _, right = commits[0].partition("..")
+        commits = [left or "HEAD", right or "HEAD"]
+    if len(commits) > 2 or (args.cached and len(commits) > 1):
+        raise Exception("diff takes at most two commits, or one with --cached")
+
+    if len(commits) == 2:
+        return object_find(repo, commits[0], fmt=b"tree"), object_find(repo, commits[1], fmt=b"tree"), False
+
+    index = index_read(repo)
+    if args.cached:
+        return object_find(repo, commits[0] if commits else "HEAD", fmt=b"tree"), index_tree(index), False
+
+    worktree = index_tree(worktree_index(repo, index))
+    if commits:
+        return object_find(repo, commits[0], fmt=b"tree"), worktree, True
+    return index_tree(index), worktree, True
+
+
+def cmd_diff(args):
+    repo = repo_root_finder()
+    old, new, new_is_worktree = diff_sides(repo, args)
+
+    out = sys.stdout.buffer
+    changes = diff_renames(repo, args, list(diff_trees(repo, old, new)), new_is_worktree)
+    for change in changes:
+        if args.name_status and change.old_path:
+            out.write(f"{change.status}{change.score:03}\t{change.old_path}\t{change.path}\n".encode("utf8"))
+        elif args.name_status:
+            out.write(f"{change.status}\t{change.path}\n".encode("utf8"))
+        else:
+            diff_patch(repo, change, new_is_worktree, args.unified, out)
+        out.flush()
+
+
+def diff_blob_data(repo, sha: str | None, path: str, from_worktree: bool) -> bytes:
+    if sha is None:
+        return b""
+    if from_worktree:
+        full_path = os.path.join(repo.worktree, path)
+        if os.path.islink(full_path):
+            return os.readlink(full_path).encode("utf8")
+        with open(full_path, "rb") as f:
+            return f.read()
+    return object_read(repo, sha).blobdata
+
+
+def diff_abbrev(repo, sha: str | None) -> str:
+    if sha is None:
+        return NULL_SHA[:7]
+    return oid_index(repo).abbrev(sha)
+
+
+def diff_patch(repo, change: TreeChange, new_is_worktree: bool, context: int, out):
+    """
+    Write one file's patch, in git's format. Hunks go out as they're found.
+    """
+    path = change.path
+    old_path = change.old_path or path
+    header = [f"diff --git a/{old_path} b/{path}"]
+    old_mode = change.old_mode and change.old_mode.decode("ascii")
+    new_mode = change.new_mode and change.new_mode.decode("ascii")
+    index_line = f"index {diff_abbrev(repo, change.old_sha)}..{diff_abbrev(repo, change.new_sha)}"
+
+    if change.status == "A":
+        header += [f"new file mode {new_mode}", index_line]
+    elif change.status == "D":
+        header += [f"deleted file mode {old_mode}", index_line]
+    else:
+        if old_mode != new_mode:
+            header += [f"old mode {old_mode}", f"new mode {new_mode}"]
+        if change.old_path:
+            verb = "rename" if change.status == "R" else "copy"
+            header += [
+                f"similarity index {change.score}%",
+                f"{verb} from {change.old_path}",
+                f"{verb} to {path}",
+            ]
+        if change.old_sha != change.new_sha:
+            header.append(index_line if old_mode != new_mode else f"{index_line} {old_mode}")
+    out.write(("\n".join(header) + "\n").encode("utf8"))
+
+    if change.old_sha == change.new_sha:
+        return  # Only the mode or the name changed
+
+    old = diff_blob_data(repo, change.old_sha, old_path, False)
+    new = diff_blob_data(repo, change.new_sha, path, new_is_worktree)
+    old_name = f"a/{old_path}" if change.old_sha else "/dev/null"
+    new_name = f"b/{path}" if change.new_sha else "/dev/null"
+
+    if b"\x00" in old[:BINARY_SNIFF_BYTES] or b"\x00" in new[:BINARY_SNIFF_BYTES]:
+        out.write(f"Binary files {old_name} and {new_name} differ\n".encode("utf8"))
+        return
+
+    out.write(f"--- {old_name}\n+++ {new_name}\n".encode("utf8"))
+    old_lines = split_lines(old)
+    for hunk in diff_hunks(old_lines, split_lines(new), context):
+        out.write(hunk.header(function_context(old_lines, hunk.a_start)) + b"\n")
+        for op, line in hunk.lines:
+            out.write(op.encode("ascii") + line)
+            if not line.endswith(b"\n"):
+                out.write(b"\n\\ No newline at end of file\n")
+        out.flush()
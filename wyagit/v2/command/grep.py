@@ -0,0 +1,77 @@
+import re
+import sys
+from common.parser import sub_parsers
+from common.helper_classes import repo_root_finder, object_find
+from common.grep import GREP_DEFAULT_JOBS, GrepFile, grep_files, grep_tree_files
+from common.index import index_read
+
+wyag_grep = sub_parsers.add_parser(
+    "grep", help="Print lines matching a pattern, in a commit, the index or the worktree."
+)
+
+wyag_grep.add_argument("-i", "--ignore-case", dest="ignore_case", action="store_true", help="Ignore case")
+
+wyag_grep.add_argument(
+    "-F", "--fixed-strings", dest="fixed_strings", action="store_true", help="The pattern is a plain string"
+)
+
+wyag_grep.add_argument(
+    "-l", "--files-with-matches", dest="files_with_matches", action="store_true",
+    help="Only print the names of matching files",
+)
+
+wyag_grep.add_argument(
+    "-n", "--line-number", dest="line_number", action="store_true",
+    help="Accepted for git compatibility, line numbers are always shown",
+)
+
+wyag_grep.add_argument(
+    "--cached", action="store_true", help="Search the staged blobs instead of the worktree"
+)
+
+wyag_grep.add_argument(
+    "-j", "--jobs", type=int, default=None, help="Number of files scanned in parallel (default: grep.threads)"
+)
+
+wyag_grep.add_argument("pattern", help="A (Python) regular expression")
+
+wyag_grep.add_argument("tree", nargs="?", help="A tree-ish to search instead of the worktree")
+
+
+def grep_listing(repo, args):
+    if args.tree:
+        return grep_tree_files(repo, object_find(repo, args.tree, fmt=b"tree"))
+
+    # Regular files only, no symlinks or submodules
+    index = index_read(repo)
+    entries = [e for e in index.entries if e.mode_type == 0b1000 and not e.flag_stage]
+    if args.cached:
+        return (GrepFile(e.name, e.sha) for e in entries)
+    # The worktree: tracked files that are actually checked out
+    return (GrepFile(e.name, None) for e in entries if not e.flag_skip_worktree)
+
+
+def cmd_grep(args):
+    repo = repo_root_finder()
+
+    pattern = re.escape(args.pattern) if args.fixed_strings else args.pattern
+    flags = re.MULTILINE | (re.IGNORECASE if args.ignore_case else 0)
+    regex = re.compile(pattern.encode("utf8"), flags)
+    jobs = args.jobs or repo.conf.getint("grep", "threads", fallback=GREP_DEFAULT_JOBS)
+
+    out = sys.stdout.buffer
+    found = False
+    for file, matches in grep_files(repo, regex, grep_listing(repo, args), jobs):
+        if not matches:
+            continue
+        found = True
+        path = file.path.encode("utf8")
+        if args.files_with_matches:
+            out.write(path + b"\n")
+        else:
+            for match in matches:
+                out.write(b"%s:%d:%s\n" % (path, match.line_number, match.line))
+        out.flush()
+
+    if not found:
+        sys.exit(1)
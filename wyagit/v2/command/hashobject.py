@@ -1,5 +1,8 @@
+import sys
+
 from common.parser import sub_parsers
 from common.helper_classes import object_hash, repo_root_finder
+from common.objbatch import ObjectBatch
 
 hashobject = sub_parsers.add_parser(
     "hash-object", help="Compute object ID and optionally creates a blob from a file"
@@ -21,15 +24,32 @@ hashobject.add_argument(
     help="Actually write the object into the database",
 )
 
-hashobject.add_argument("path", help="Read object from <file>")
+hashobject.add_argument(
+    "--stdin-paths",
+    dest="stdin_paths",
+    action="store_true",
+    help="Read file names from the standard input, one per line",
+)
+
+hashobject.add_argument("path", nargs="*", help="Read object from <file>")
 
 
 def cmd_hash_object(args):
-    if args.write:
-        repo = repo_root_finder()
-    else:
-        repo = None
-
-    with open(args.path, "rb") as fd:
-        sha = object_hash(fd, args.type.encode(), repo)
-        print(sha)
+    paths = args.path
+    if args.stdin_paths:
+        paths = paths + [line.rstrip("\n") for line in sys.stdin]
+
+    if not args.write:
+        hash_objects(paths, args.type.encode(), None)
+        return
+
+    repo = repo_root_finder()
+    # Written as one batch: a single sync for all of them
+    with ObjectBatch(repo):
+        hash_objects(paths, args.type.encode(), repo)
+
+
+def hash_objects(paths: list[str], fmt: bytes, repo):
+    for path in paths:
+        with open(path, "rb") as fd:
+            print(object_hash(fd, fmt, repo))
@@ -1,10 +1,10 @@
 import os
 from common.parser import sub_parsers
 from common.helper_classes import repo_dir, repo_file, repo_default_config, GitRepository
-from loguru import logger
+from common.refs import REF_BACKENDS, REFTABLE_DIR, REFTABLE_LIST
 
 
-def repo_create(path: str):
+def repo_create(path: str, ref_format="files"):
     """
     Create a new repository at path
     """
@@ -26,6 +26,11 @@ def repo_create(path: str):
     assert repo_dir(repo, "refs", "tags", mkdir=True)
     assert repo_dir(repo, "refs", "heads", mkdir=True)
 
+    if ref_format == "reftable":
+        # .git/reftable/tables.list, an empty stack of tables
+        with open(repo_file(repo, REFTABLE_DIR, REFTABLE_LIST, mkdir=True), "w") as f:
+            f.write("")
+
     # .git/description
     with open(repo_file(repo, "description"), "w") as f:
         f.write(
@@ -38,6 +43,11 @@ def repo_create(path: str):
 
     with open(repo_file(repo, "config"), "w") as f:
         config = repo_default_config()
+        if ref_format != "files":
+            # Older readers must refuse a repo whose refs they can't see
+            config.set("core", "repositoryformatversion", "1")
+            config.add_section("extensions")
+            config.set("extensions", "refstorage", ref_format)
         config.write(f)
 
     return repo
@@ -52,7 +62,13 @@ wyag_init.add_argument(
     default=".",
     help="Where to create the repository.",
 )
+wyag_init.add_argument(
+    "--ref-format",
+    choices=sorted(REF_BACKENDS),
+    default="files",
+    help="How refs are stored: one file per ref, or a stack of reftables.",
+)
 
 
 def cmd_init(args):
-    repo_create(args.path)
+    repo_create(args.path, ref_format=args.ref_format)
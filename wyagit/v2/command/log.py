@@ -1,8 +1,16 @@
 from common.parser import sub_parsers
-from common.helper_classes import object_hash, repo_root_finder, object_find, object_read
+from common.helper_classes import object_hash, repo_root_finder, object_find, object_read, oid_index
+from common.oidindex import DEFAULT_ABBREV
 
 wyag_log = sub_parsers.add_parser("log", help="Display history of a given commit.")
 wyag_log.add_argument("commit", default="HEAD", nargs="?", help="Commit to start at.")
+wyag_log.add_argument(
+    "--abbrev",
+    metavar="length",
+    type=int,
+    default=DEFAULT_ABBREV,
+    help="Label commits with their shortest unique prefix, at least <length> long",
+)
 
 
 def cmd_log(args):
@@ -10,11 +18,11 @@ def cmd_log(args):
 
     print("digraph wyaglog{")
     print("  node[shape=rect]")
-    log_graphviz(repo, object_find(repo, args.commit), set())
+    log_graphviz(repo, object_find(repo, args.commit), set(), args.abbrev)
     print("}")
 
 
-def log_graphviz(repo, sha, seen):
+def log_graphviz(repo, sha, seen, abbrev=DEFAULT_ABBREV):
 
     if sha in seen:
         return
@@ -28,7 +36,7 @@ def log_graphviz(repo, sha, seen):
     if "\n" in message:  # Keep only the first line
         message = message[: message.index("\n")]
 
-    print(f'  c_{sha} [label="{sha[0:7]}: {message}"]')
+    print(f'  c_{sha} [label="{oid_index(repo).abbrev(sha, abbrev)}: {message}"]')
     assert commit.fmt == b"commit"
 
     if not b"parent" in commit.kvlm.keys():
@@ -43,4 +51,4 @@ def log_graphviz(repo, sha, seen):
     for p in parents:
         p = p.decode("ascii")
         print(f"  c_{sha} -> c_{p};")
-        log_graphviz(repo, p, seen)
+        log_graphviz(repo, p, seen, abbrev)
@@ -0,0 +1,13 @@
+from common.parser import sub_parsers
+from common.helper_classes import repo_root_finder, ref_backend
+
+wyag_packrefs = sub_parsers.add_parser(
+    "pack-refs", help="Pack refs for efficient repository access."
+)
+
+
+def cmd_pack_refs(args):
+    repo = repo_root_finder()
+    # files: loose refs move into packed-refs
+    # reftable: the whole stack is merged into one table
+    ref_backend(repo).compact()
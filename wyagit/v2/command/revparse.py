@@ -9,8 +9,11 @@ from common.helper_classes import (
     ref_list,
     ref_resolve,
     tag_create,
-    object_find
+    object_find,
+    oid_index,
 )
+from common.oidindex import DEFAULT_ABBREV
+from common.revision import rev_parse
 
 wyag_revparse = sub_parsers.add_parser(
     "rev-parse",
@@ -23,7 +26,15 @@ wyag_revparse.add_argument("--wyag-type",
                    default=None,
                    help="Specify the expected type")
 
+wyag_revparse.add_argument("--short",
+                   metavar="length",
+                   nargs="?",
+                   const=str(DEFAULT_ABBREV),
+                   default=None,
+                   help="Print the shortest unique prefix, at least <length> long")
+
 wyag_revparse.add_argument("name",
+                   nargs="?",
                    help="The name to parse")
 
 def cmd_rev_parse(args):
@@ -32,6 +43,22 @@ def cmd_rev_parse(args):
     else:
         fmt = None
 
+    # `--short HEAD` hands HEAD to --short, only `--short=N` sets a length
+    if args.name is None and args.short is not None:
+        args.name, args.short = args.short, str(DEFAULT_ABBREV)
+    if args.name is None:
+        raise Exception("rev-parse needs a name")
+
     repo = repo_root_finder()
 
-    print (object_find(repo, args.name, fmt, follow=True))
\ No newline at end of file
+    # A..B prints two lines: B and ^A
+    if fmt is None and ".." in args.name:
+        lines = rev_parse(repo, args.name)
+    else:
+        lines = [object_find(repo, args.name, fmt, follow=True)]
+
+    for sha in lines:
+        if sha and args.short is not None:
+            exclude = "^" if sha.startswith("^") else ""
+            sha = exclude + oid_index(repo).abbrev(sha.lstrip("^"), int(args.short))
+        print (sha)
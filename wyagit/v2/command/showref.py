@@ -9,7 +9,6 @@ from common.helper_classes import (
     ref_list,
     ref_resolve,
 )
-from loguru import logger
 
 wyag_showref = sub_parsers.add_parser("show-ref", help="List references.")
 
@@ -17,7 +16,6 @@ wyag_showref = sub_parsers.add_parser("show-ref", help="List references.")
 def cmd_show_ref(args):
     repo = repo_root_finder()
     refs = ref_list(repo)
-    logger.debug(f"repo: {repo} | refs: {refs}")
     show_ref(repo, refs, prefix="refs")
 
 
@@ -0,0 +1,49 @@
+from common.parser import sub_parsers
+from common.helper_classes import repo_root_finder, ref_resolve, object_find
+from common.checkout import CHECKOUT_DEFAULT_JOBS
+from common.index import index_read, index_write
+from common.sparse import SparseCone, sparse_apply, sparse_read, sparse_write
+
+wyag_sparse_checkout = sub_parsers.add_parser(
+    "sparse-checkout", help="Only check out some directories of the worktree."
+)
+
+wyag_sparse_checkout.add_argument(
+    "action",
+    choices=["set", "add", "list", "disable"],
+    help="set: replace the checked out directories, add: add to them, "
+    "list: show them, disable: check out everything again",
+)
+
+wyag_sparse_checkout.add_argument("dirs", nargs="*", help="Directories to check out")
+
+
+def cmd_sparse_checkout(args):
+    repo = repo_root_finder()
+    cone = sparse_read(repo)
+
+    match args.action:
+        case "list":
+            if cone is None:
+                raise Exception("This worktree is not sparse")
+            for d in sorted(cone.recursive):
+                print(d)
+            return
+        case "set":
+            cone = SparseCone(args.dirs)
+        case "add":
+            if cone is None:
+                raise Exception("This worktree is not sparse, use set first")
+            cone = SparseCone([*cone.recursive, *args.dirs])
+        case "disable":
+            cone = None
+
+    head = ref_resolve(repo, "HEAD")
+    tree = object_find(repo, head, fmt=b"tree") if head else None
+    jobs = repo.conf.getint("checkout", "workers", fallback=CHECKOUT_DEFAULT_JOBS)
+
+    # Update the worktree first: if a file can't leave the cone, nothing changed yet
+    index = index_read(repo)
+    sparse_apply(repo, tree, index, cone, jobs=jobs)
+    index_write(repo, index)
+    sparse_write(repo, cone)
@@ -0,0 +1,93 @@
+import os
+from common.parser import sub_parsers
+from common.helper_classes import repo_root_finder, object_find, object_read, ref_resolve
+from common.checkout import worktree_file_sha
+from common.ignore import gitignore_read, ignore_walk
+from common.index import index_read, index_tree
+from common.renames import RENAME_LIMIT, detect_renames
+from common.revision import ref_resolve_symbolic
+from common.treediff import diff_trees
+
+wyag_status = sub_parsers.add_parser("status", help="Show the working tree status.")
+
+
+def cmd_status(_):
+    repo = repo_root_finder()
+    index = index_read(repo)
+
+    cmd_status_branch(repo)
+    cmd_status_head_index(repo, index)
+    print()
+    cmd_status_index_worktree(repo, index)
+
+
+def branch_get_active(repo) -> str | None:
+    head = ref_resolve_symbolic(repo, "HEAD")
+    if head.startswith("refs/heads/"):
+        return head[len("refs/heads/") :]
+    return None
+
+
+def cmd_status_branch(repo):
+    branch = branch_get_active(repo)
+    if branch:
+        print(f"On branch {branch}.")
+    else:
+        print(f"HEAD detached at {object_find(repo, 'HEAD')}")
+
+
+def cmd_status_head_index(repo, index):
+    """
+    Show changes between head and index. Only the HEAD trees leading to
+    staged changes are read, see diff_trees.
+    """
+    print("Changes to be committed:")
+
+    head_sha = ref_resolve(repo, "HEAD")
+    head_tree = object_find(repo, head_sha, fmt=b"tree") if head_sha else None
+
+    changes = list(diff_trees(repo, head_tree, index_tree(index)))
+    if repo.conf.getboolean("status", "renames", fallback=True):
+        load = lambda sha: object_read(repo, sha).blobdata
+        changes = detect_renames(
+            changes,
+            lambda c: load(c.old_sha),
+            lambda c: load(c.new_sha),
+            limit=repo.conf.getint("status", "renamelimit", fallback=RENAME_LIMIT),
+        )
+
+    labels = {"A": "added:   ", "D": "deleted: ", "M": "modified:", "R": "renamed: "}
+    for change in changes:
+        if change.old_path:
+            print(" ", labels[change.status], change.old_path, "->", change.path)
+        else:
+            print(" ", labels[change.status], change.path)
+
+
+def cmd_status_index_worktree(repo, index):
+    """
+    Show changes between worktree and index. Skip-worktree entries (outside
+    the sparse checkout) aren't expected on disk, so they are left alone.
+    """
+    print("Changes not staged for commit:")
+
+    # Ignored directories aren't even walked into
+    ignore = gitignore_read(repo, index)
+    all_files = set(ignore_walk(ignore, repo))
+
+    for entry in index.entries:
+        all_files.discard(entry.name)
+        if entry.flag_skip_worktree:
+            continue
+
+        full_path = os.path.join(repo.worktree, entry.name)
+        if not os.path.lexists(full_path):
+            print("  deleted: ", entry.name)
+        elif not entry.stat_matches(os.lstat(full_path)) and worktree_file_sha(full_path) != entry.sha:
+            print("  modified:", entry.name)
+
+    print()
+    print("Untracked files:")
+
+    for f in sorted(all_files):
+        print(" ", f)
@@ -10,7 +10,6 @@ from common.helper_classes import (
     ref_resolve,
     tag_create
 )
-from loguru import logger
 from command.showref import show_ref
 
 wyag_tag = sub_parsers.add_parser("tag", help="List and create tags")
@@ -38,4 +37,4 @@ def cmd_tag(args):
         )
     else:
         refs = ref_list(repo)
-        show_ref(repo, refs["tags"], with_hash=False)
+        show_ref(repo, refs.get("tags", dict()), with_hash=False)
@@ -0,0 +1,77 @@
+import sys
+from common.parser import sub_parsers
+from common.helper_classes import repo_root_finder, ref_backend, object_find
+
+wyag_updateref = sub_parsers.add_parser(
+    "update-ref", help="Update the object name stored in a ref safely."
+)
+
+wyag_updateref.add_argument(
+    "-d", dest="delete", action="store_true", help="Delete the ref instead"
+)
+
+wyag_updateref.add_argument(
+    "--stdin",
+    action="store_true",
+    help="Read update/create/delete instructions from stdin, applied as one transaction",
+)
+
+wyag_updateref.add_argument("ref", nargs="?", help="The ref to update, e.g. refs/heads/ci/42")
+
+wyag_updateref.add_argument("values", nargs="*", help="<newvalue> [<oldvalue>]")
+
+NULL_SHA = "0" * 40
+
+
+def old_value(value: str):
+    """
+    An all-zero (or empty) old value means "the ref must not exist yet"
+    """
+    if value in ("", NULL_SHA):
+        return None
+    return value
+
+
+def cmd_update_ref(args):
+    repo = repo_root_finder()
+    tx = ref_backend(repo).transaction()
+
+    if args.stdin:
+        for line in sys.stdin:
+            update_ref_instruction(repo, tx, line.split())
+    elif not args.ref:
+        raise Exception("update-ref needs a ref, or --stdin")
+    elif args.delete:
+        update_ref_instruction(repo, tx, ["delete", args.ref, *args.values])
+    else:
+        update_ref_instruction(repo, tx, ["update", args.ref, *args.values])
+
+    tx.commit()
+
+
+def update_ref_instruction(repo, tx, words: list[str]):
+    """
+    update <ref> <new> [<old>]
+    create <ref> <new>
+    delete <ref> [<old>]
+    """
+    if not words:
+        return
+    if len(words) > 1 and not words[1].startswith("refs/"):
+        # HEAD and friends are files whatever the ref storage (see
+        # RefBackend.read): a reftable would hold a value nobody reads
+        raise Exception(f"Refusing to update {words[1]}: only refs under refs/ can be updated")
+
+    match words:
+        case ["update", ref, new]:
+            tx.update(ref, object_find(repo, new))
+        case ["update", ref, new, old]:
+            tx.update(ref, object_find(repo, new), old=old_value(old))
+        case ["create", ref, new]:
+            tx.update(ref, object_find(repo, new), old=None)
+        case ["delete", ref]:
+            tx.delete(ref)
+        case ["delete", ref, old]:
+            tx.delete(ref, old=old_value(old))
+        case _:
+            raise Exception(f"Bad update-ref instruction: {' '.join(words)}")
@@ -0,0 +1,16 @@
+from common.parser import sub_parsers
+from common.helper_classes import repo_root_finder
+from common.index import index_read, index_tree
+from common.objbatch import ObjectBatch
+
+wyag_write_tree = sub_parsers.add_parser(
+    "write-tree", help="Create a tree object from the current index"
+)
+
+
+def cmd_write_tree(args):
+    repo = repo_root_finder()
+    # Every tree of the index is written, synced once at the end
+    with ObjectBatch(repo):
+        sha = index_tree(index_read(repo)).sha(repo)
+    print(sha)
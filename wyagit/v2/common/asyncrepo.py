@@ -0,0 +1,122 @@
+import asyncio
+import heapq
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator
+
+from common.helper_classes import GitObject, GitRepository, object_find, object_read, object_write
+from common.revision import commit_time
+
+# ----------------------------- ASYNC_REPO_START ----------------------------- #
+# An asyncio facade over a repository, for services embedding wyag: reading
+# an object is file I/O plus zlib, both blocking, so it's done on a thread
+# pool instead of on the event loop.
+#
+#   repo = AsyncRepository(GitRepository(path))
+#   sha = await repo.resolve("HEAD")
+#   commit = await repo.read_object(sha)
+#   async for path, mode, sha in repo.walk_tree(commit.kvlm[b"tree"].decode()):
+#       ...
+#
+# At most max_workers threads run, and at most max_pending calls are queued
+# for them; past that, callers wait their turn on the event loop. Concurrent
+# reads of the same sha are coalesced: the first one reads it, the others
+# await the same future.
+
+ASYNC_REPO_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+ASYNC_REPO_PENDING = 256
+
+
+class AsyncRepository:
+    def __init__(self, repo: GitRepository, max_workers=ASYNC_REPO_WORKERS, max_pending=ASYNC_REPO_PENDING):
+        self.repo = repo
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="wyag")
+        self.pending = asyncio.Semaphore(max_pending)
+        self.reading: dict[str, asyncio.Future] = dict()  # sha -> its read in flight
+
+    async def run(self, fn, *args):
+        """
+        fn(*args) on the thread pool, within the concurrency limit
+        """
+        async with self.pending:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def read_object(self, sha: str) -> GitObject | None:
+        future = self.reading.get(sha)
+        if future is None:
+            future = asyncio.ensure_future(self.run(object_read, self.repo, sha))
+            self.reading[sha] = future
+            future.add_done_callback(lambda _: self.reading.pop(sha, None))
+        # One caller giving up mustn't cancel the read for the others
+        return await asyncio.shield(future)
+
+    async def write_object(self, obj: GitObject) -> str:
+        return await self.run(object_write, obj, self.repo)
+
+    async def resolve(self, name: str, fmt: bytes | None = None, follow=True) -> str | None:
+        """
+        See object_find: a name or revision expression to a sha
+        """
+        return await self.run(object_find, self.repo, name, fmt, follow)
+
+    async def walk_tree(self, tree: str, prefix="") -> AsyncIterator[tuple[str, bytes, str]]:
+        """
+        (path, mode, sha) of every blob (and submodule) under tree, in
+        order. The subtrees of a tree are all requested at once, so their
+        reads overlap while the entries before them are handed out.
+        """
+        obj = await self.read_object(tree)
+        subtrees = {
+            i: asyncio.ensure_future(self.read_object(obj.sha(i)))
+            for i in range(len(obj))
+            if obj.is_tree(i)
+        }
+        try:
+            for i in range(len(obj)):
+                path = f"{prefix}/{obj.path(i)}" if prefix else obj.path(i)
+                if i in subtrees:
+                    await subtrees[i]
+                    async for entry in self.walk_tree(obj.sha(i), path):
+                        yield entry
+                else:
+                    yield path, obj.mode(i), obj.sha(i)
+        finally:
+            for future in subtrees.values():
+                future.cancel()
+
+    async def walk_history(self, start: str) -> AsyncIterator[tuple[str, GitObject]]:
+        """
+        (sha, commit) for start and its ancestors, newest first (by
+        committer date, like git log). Parents are read ahead as soon as
+        their child comes out.
+        """
+        sha = await self.resolve(start, b"commit")
+        commit = await self.read_object(sha)
+        heap = [(-commit_time(commit), sha, commit)]
+        seen = {sha}
+        while heap:
+            _, sha, commit = heapq.heappop(heap)
+            parents = commit.kvlm.get(b"parent", [])
+            if type(parents) != list:
+                parents = [parents]
+            parents = [p.decode("ascii") for p in parents if p.decode("ascii") not in seen]
+            seen.update(parents)
+            reads = [asyncio.ensure_future(self.read_object(p)) for p in parents]
+
+            yield sha, commit
+
+            for parent, parent_commit in zip(parents, await asyncio.gather(*reads)):
+                heapq.heappush(heap, (-commit_time(parent_commit), parent, parent_commit))
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_):
+        self.close()
+
+
+# ------------------------------ ASYNC_REPO_END ------------------------------ #
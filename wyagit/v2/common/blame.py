@@ -0,0 +1,148 @@
+import heapq
+
+from typing import NamedTuple
+
+from common.helper_classes import GitRepository, object_read
+from common.linediff import diff_equal_runs, split_lines
+from common.revision import commit_info
+
+# -------------------------------- BLAME_START ------------------------------- #
+# Blame hands line ranges down the history. Every commit still holding some
+# lines ("suspect" ranges of its version of the file) diffs that version
+# against each parent's: lines that are the same in a parent move on to it,
+# the rest were written by this commit. Commits are visited newest first, so
+# two children handing lines to the same parent are merged before it's
+# looked at, and the walk ends as soon as every line has its author.
+#
+# Blobs are split into lines and interned once, the int tables are cached
+# by blob sha: the same version of a file is usually seen by many commits.
+
+
+class BlameEntry(NamedTuple):
+    final_start: int  # first line in the blamed version, 0-based
+    length: int
+    commit: str
+    orig_start: int  # where these lines start in that commit's version
+    path: str
+
+
+class Suspect(NamedTuple):
+    start: int  # in this commit's version of the file
+    length: int
+    final_start: int
+
+
+class Blamer:
+    def __init__(self, repo: GitRepository):
+        self.repo = repo
+        self.trees = dict()  # tree sha -> GitTree
+        self.lines = dict()  # blob sha -> interned lines
+        self.line_ids = dict()  # line -> int, shared by every blob
+
+    def tree_entry(self, tree: str, path: str) -> str | None:
+        """
+        The sha of the blob at path in tree, None if there's none
+        """
+        *dirs, name = path.split("/")
+        for d in dirs + [name]:
+            obj = self.trees.get(tree)
+            if obj is None:
+                obj = self.trees[tree] = object_read(self.repo, tree)
+            i = obj.find(d)
+            if i is None:
+                return None
+            is_tree, tree = obj.is_tree(i), obj.sha(i)
+            if d != name and not is_tree:
+                return None
+        return None if is_tree else tree
+
+    def blob_lines(self, sha: str) -> list[int]:
+        ids = self.lines.get(sha)
+        if ids is None:
+            line_ids = self.line_ids
+            ids = [line_ids.setdefault(line, len(line_ids)) for line in split_lines(object_read(self.repo, sha).blobdata)]
+            self.lines[sha] = ids
+        return ids
+
+
+def suspects_pass(suspects: list[Suspect], runs) -> tuple[list[Suspect], list[Suspect]]:
+    """
+    Split suspects over the equal runs between a parent's version (run.a)
+    and ours (run.b): (moved to the parent, in parent lines), (still ours)
+    """
+    passed = list()
+    kept = list()
+    runs = list(runs)
+    r = 0
+    for s in suspects:
+        start, end, final = s.start, s.start + s.length, s.final_start
+        # Runs entirely before this suspect can't be used by later ones either
+        while r < len(runs) and runs[r].b + runs[r].length <= start:
+            r += 1
+        i = r
+        while start < end:
+            if i >= len(runs) or runs[i].b >= end:
+                kept.append(Suspect(start, end - start, final))
+                break
+            run = runs[i]
+            if run.b > start:
+                kept.append(Suspect(start, run.b - start, final))
+                final += run.b - start
+                start = run.b
+            overlap_end = min(end, run.b + run.length)
+            passed.append(Suspect(run.a + start - run.b, overlap_end - start, final))
+            final += overlap_end - start
+            start = overlap_end
+            i += 1
+    return passed, kept
+
+
+def blame(repo: GitRepository, commit: str, path: str) -> list[BlameEntry]:
+    """
+    Who wrote each line of path, as of commit. Returns entries in line order.
+    """
+    blamer = Blamer(repo)
+    blob = blamer.tree_entry(commit_info(repo, commit).tree, path)
+    if blob is None:
+        raise Exception(f"no such path {path} in {commit}")
+
+    total = len(blamer.blob_lines(blob))
+    # sha -> (blob, suspects), and a max-heap on commit time of the same shas
+    pending = {commit: (blob, [Suspect(0, total, 0)])}
+    queue = [(-commit_info(repo, commit).time, commit)]
+    ret = list()
+
+    while queue:
+        _, sha = heapq.heappop(queue)
+        blob, suspects = pending.pop(sha)
+        suspects.sort()
+        ours = blamer.blob_lines(blob)
+
+        for parent in commit_info(repo, sha).parents:
+            if not suspects:
+                break
+            parent_blob = blamer.tree_entry(commit_info(repo, parent).tree, path)
+            if parent_blob is None:
+                continue
+
+            if parent_blob == blob:
+                passed, suspects = suspects, list()
+            else:
+                theirs = blamer.blob_lines(parent_blob)
+                passed, suspects = suspects_pass(suspects, diff_equal_runs(theirs, ours))
+            if not passed:
+                continue
+
+            if parent in pending:
+                pending[parent][1].extend(passed)
+            else:
+                pending[parent] = (parent_blob, passed)
+                heapq.heappush(queue, (-commit_info(repo, parent).time, parent))
+
+        ret.extend(BlameEntry(s.final_start, s.length, sha, s.start, path) for s in suspects)
+
+    ret.sort()
+    return ret
+
+
+# --------------------------------- BLAME_END -------------------------------- #
@@ -0,0 +1,383 @@
+import os
+import shutil
+import stat
+import threading
+import time
+import zlib
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+from common.helper_classes import (
+    GitBlob,
+    GitRepository,
+    GitTree,
+    object_read,
+    object_read_loose,
+    object_write,
+    oid_index,
+    repo_path,
+)
+from common.index import GitIndex, GitIndexEntry, index_entry_from_stat, index_entry_mode, index_entry_sparse_dir
+from common.pack import pack_object_read, pack_object_size
+from common.trace import traced
+from common.treediff import TreeChange, diff_trees, is_tree_mode
+
+# ------------------------------ CHECKOUT_START ------------------------------ #
+# Checkout in three passes:
+#   1. flatten the tree into a list of directories and a list of files,
+#      reading only tree objects
+#   2. create every directory, parents first, before any file is written
+#   3. inflate and write the blobs on a thread pool. zlib and file I/O both
+#      release the GIL, so the workers really do overlap.
+# A byte budget caps how much inflated data is held in memory at once.
+
+CHECKOUT_BYTE_BUDGET = 64 * 1024 * 1024
+CHECKOUT_DEFAULT_JOBS = min(32, (os.cpu_count() or 1) + 4)
+
+
+class CheckoutItem(NamedTuple):
+    path: str  # absolute destination
+    mode: bytes  # normalized to 6 bytes, e.g. b"100644"
+    sha: str
+
+
+class CheckoutStats(NamedTuple):
+    files: int
+    dirs: int
+    bytes: int
+    seconds: float
+
+    def __str__(self):
+        seconds = max(self.seconds, 1e-9)
+        return (
+            f"{self.files} files, {self.dirs} directories, {self.bytes} bytes in {self.seconds:.3f}s "
+            f"({self.files / seconds:.0f} files/s, {self.bytes / seconds / 1024 / 1024:.1f} MiB/s)"
+        )
+
+
+class ByteBudget:
+    """
+    A semaphore counted in bytes. A single request bigger than the whole
+    budget is still let through once nothing else is in flight.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self.cond = threading.Condition()
+
+    def acquire(self, n: int):
+        with self.cond:
+            while self.in_flight > 0 and self.in_flight + n > self.limit:
+                self.cond.wait()
+            self.in_flight += n
+
+    def release(self, n: int):
+        with self.cond:
+            self.in_flight -= n
+            self.cond.notify_all()
+
+
+def checkout_plan(repo: GitRepository, tree: GitTree, path: str, sparse=None):
+    """
+    Flatten tree into (directories, files), directories listed parents first.
+    Subtrees outside the sparse cone (see common.sparse) are not even read.
+    """
+    dirs = list()
+    files = list()
+    stack = [(tree, path, "")]
+
+    while stack:
+        tree, path, rel_path = stack.pop()
+        for i in range(len(tree)):
+            name = tree.path(i)
+            dest = os.path.join(path, name)
+            if tree.is_tree(i):
+                rel_dest = f"{rel_path}/{name}" if rel_path else name
+                if sparse is not None and not sparse.includes_dir(rel_dest):
+                    continue
+                dirs.append(dest)
+                stack.append((object_read(repo, tree.sha(i)), dest, rel_dest))
+                continue
+            mode = tree.mode(i)
+            if mode.startswith(b"16"):
+                # A submodule: git leaves an empty directory behind
+                dirs.append(dest)
+            else:
+                files.append(CheckoutItem(dest, mode, tree.sha(i)))
+
+    return dirs, files
+
+
+def blob_inflate(repo: GitRepository, sha: str, budget: ByteBudget) -> bytes:
+    """
+    Inflate a blob, waiting for room in the budget before the bulk of it is
+    decompressed. The size comes from the object header, the first few bytes.
+    """
+    path = repo_path(repo, "objects", sha[0:2], sha[2:])
+    try:
+        with open(path, "rb") as f:
+            compressed = f.read()
+    except FileNotFoundError:
+        return blob_inflate_packed(repo, sha, budget)
+
+    inflater = zlib.decompressobj()
+    head = inflater.decompress(compressed, 64)
+    null_pos = head.index(b"\x00")
+    size = int(head[head.index(b" ") + 1 : null_pos])
+
+    budget.acquire(size)
+    rest = inflater.decompress(inflater.unconsumed_tail) + inflater.flush()
+    data = head[null_pos + 1 :] + rest
+    if len(data) != size:
+        budget.release(size)
+        raise Exception(f"Malformed object {sha}: bad length")
+    return data
+
+
+def blob_inflate_packed(repo: GitRepository, sha: str, budget: ByteBudget) -> bytes:
+    """
+    Same for a packed blob, the size comes from its pack entry header (or
+    delta header for a deltified one)
+    """
+    packs = oid_index(repo).packs()
+    size = pack_object_size(packs, sha)
+    if size is None:
+        raise Exception(f"Object {sha} not found")
+
+    budget.acquire(size)
+    try:
+        fmt, data = pack_object_read(packs, sha, lambda base: object_read_loose(repo, base))
+        if fmt != b"blob" or len(data) != size:
+            raise Exception(f"Malformed object {sha}: not a blob of {size} bytes")
+    except BaseException:
+        budget.release(size)
+        raise
+    return data
+
+
+def checkout_file(repo: GitRepository, item: CheckoutItem, budget: ByteBudget) -> int:
+    data = blob_inflate(repo, item.sha, budget)
+    try:
+        if item.mode.startswith(b"12"):
+            # A symlink, the blob holds its target
+            os.symlink(data, item.path)
+        else:
+            with open(item.path, "wb") as f:
+                f.write(data)
+            if item.mode == b"100755":
+                os.chmod(item.path, 0o755)
+        return len(data)
+    finally:
+        budget.release(len(data))
+
+
+@traced("checkout_files")
+def checkout_files(repo: GitRepository, items: list[CheckoutItem],
+                   jobs=CHECKOUT_DEFAULT_JOBS, byte_budget=CHECKOUT_BYTE_BUDGET) -> int:
+    """
+    Write items (their directories must exist), returns the bytes written
+    """
+    budget = ByteBudget(byte_budget)
+    total = 0
+    if jobs <= 1 or len(items) < 2:
+        for item in items:
+            total += checkout_file(repo, item, budget)
+    else:
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            for written in pool.map(lambda item: checkout_file(repo, item, budget), items):
+                total += written
+    return total
+
+
+def tree_checkout(repo: GitRepository, tree: GitTree, path: str,
+                  jobs=CHECKOUT_DEFAULT_JOBS, byte_budget=CHECKOUT_BYTE_BUDGET, sparse=None) -> CheckoutStats:
+    """
+    Write tree into the (existing, empty) directory path
+    """
+    start = time.perf_counter()
+
+    dirs, files = checkout_plan(repo, tree, path, sparse)
+    for d in dirs:
+        os.mkdir(d)
+
+    total = checkout_files(repo, files, jobs, byte_budget)
+
+    return CheckoutStats(len(files), len(dirs), total, time.perf_counter() - start)
+
+
+def worktree_file_sha(path: str) -> str:
+    """
+    Hash a worktree file (or symlink) as a blob, without writing it
+    """
+    if os.path.islink(path):
+        data = os.readlink(path).encode("utf8")
+    else:
+        with open(path, "rb") as f:
+            data = f.read()
+    return object_write(GitBlob(data), None)
+
+
+def worktree_file_mode(st: os.stat_result) -> bytes:
+    if stat.S_ISLNK(st.st_mode):
+        return b"120000"
+    if st.st_mode & 0o111:
+        return b"100755"
+    return b"100644"
+
+
+def worktree_index(repo: GitRepository, index: GitIndex) -> GitIndex:
+    """
+    The index as it would be if every tracked file were staged again from
+    the worktree. Files whose stat data still matches aren't hashed.
+    """
+    entries = list()
+    for entry in index.entries:
+        if entry.flag_skip_worktree or entry.flag_stage:
+            entries.append(entry)
+            continue
+
+        full_path = os.path.join(repo.worktree, entry.name)
+        try:
+            st = os.lstat(full_path)
+        except FileNotFoundError:
+            continue  # Deleted
+        if entry.stat_matches(st) and worktree_file_mode(st) == index_entry_mode(entry):
+            entries.append(entry)
+        else:
+            sha = worktree_file_sha(full_path)
+            entries.append(index_entry_from_stat(entry.name, sha, st, worktree_file_mode(st)))
+    return GitIndex(version=index.version, entries=entries)
+
+
+def worktree_check(repo: GitRepository, changes: list[TreeChange], entries: dict[str, GitIndexEntry]):
+    """
+    Refuse to switch if it would throw away anything not committed: staged
+    or unstaged edits to a path we're about to touch, or an untracked file
+    sitting where a new one goes. Only changed paths are looked at.
+    """
+    deleted = {change.path for change in changes if change.new_sha is None}
+
+    for change in changes:
+        full_path = os.path.join(repo.worktree, change.path)
+        entry = entries.get(change.path)
+
+        if change.old_sha is None:
+            # A new path: nothing may be staged or lying around there
+            if entry is not None and entry.sha != change.new_sha:
+                raise Exception(f"Your staged changes to {change.path} would be overwritten by checkout")
+            if entry is None and os.path.lexists(full_path):
+                if not os.path.isdir(full_path) or os.path.islink(full_path):
+                    raise Exception(f"Untracked working tree file {change.path} would be overwritten by checkout")
+                # A directory is fine if everything in it goes away anyway
+                for root, _, files in os.walk(full_path):
+                    for f in files:
+                        rel_path = os.path.relpath(os.path.join(root, f), repo.worktree)
+                        if rel_path not in deleted:
+                            raise Exception(f"Untracked working tree file {rel_path} would be overwritten by checkout")
+            continue
+
+        if entry is None or entry.sha != change.old_sha:
+            raise Exception(f"Your staged changes to {change.path} would be overwritten by checkout")
+
+        if not os.path.lexists(full_path):
+            continue  # Deleted in the worktree, nothing to lose
+        if not entry.stat_matches(os.lstat(full_path)) and worktree_file_sha(full_path) != entry.sha:
+            raise Exception(f"Your local changes to {change.path} would be overwritten by checkout")
+
+
+def index_entry_under(name: str, dirs) -> bool:
+    """
+    Whether the index entry name is (or is inside) one of dirs
+    """
+    path = name.rstrip("/")
+    while path:
+        if path in dirs:
+            return True
+        path = os.path.dirname(path)
+    return False
+
+
+def worktree_remove_empty_dirs(worktree: str, path: str):
+    """
+    Remove path's parent directories as long as they are empty
+    """
+    parent = os.path.dirname(path)
+    while parent != worktree and parent.startswith(worktree):
+        try:
+            os.rmdir(parent)
+        except OSError:
+            break  # Not empty (or already gone)
+        parent = os.path.dirname(parent)
+
+
+@traced("worktree_checkout", "old_tree", "new_tree")
+def worktree_checkout(repo: GitRepository, old_tree: str | None, new_tree: str, index: GitIndex,
+                      jobs=CHECKOUT_DEFAULT_JOBS, byte_budget=CHECKOUT_BYTE_BUDGET, sparse=None) -> CheckoutStats:
+    """
+    Move the worktree and index from old_tree to new_tree, touching only the
+    paths that differ between the two. Identical subtrees are never read,
+    and neither are changed ones outside the sparse cone: their sparse
+    directory entry is just repointed.
+    """
+    start = time.perf_counter()
+    worktree = os.path.realpath(repo.worktree)
+
+    changes = list()
+    collapsed = dict()
+    for change in diff_trees(repo, old_tree, new_tree, sparse=sparse):
+        if is_tree_mode(change.new_mode or change.old_mode):
+            collapsed[change.path] = change.new_sha
+        else:
+            changes.append(change)
+
+    entries = {e.name: e for e in index.entries}
+    if collapsed:
+        entries = {name: e for name, e in entries.items() if not index_entry_under(name, collapsed)}
+        for path, sha in collapsed.items():
+            if sha is not None:
+                entries[path + "/"] = index_entry_sparse_dir(path, sha)
+    worktree_check(repo, changes, entries)
+
+    # Clear every changed path first: a file may be replaced by a directory
+    # of the same name, a symlink by a regular file...
+    removed = 0
+    for change in changes:
+        if change.new_sha is None:
+            full_path = os.path.join(worktree, change.path)
+            if os.path.lexists(full_path):
+                os.unlink(full_path)
+            entries.pop(change.path, None)
+            worktree_remove_empty_dirs(worktree, full_path)
+            removed += 1
+
+    for change in changes:
+        if change.new_sha is not None:
+            full_path = os.path.join(worktree, change.path)
+            if os.path.islink(full_path) or os.path.isfile(full_path):
+                os.unlink(full_path)
+            elif os.path.isdir(full_path):
+                shutil.rmtree(full_path)  # worktree_check made sure it held nothing of value
+
+    items = [
+        CheckoutItem(os.path.join(worktree, c.path), c.new_mode, c.new_sha)
+        for c in changes
+        if c.new_sha is not None
+    ]
+    dirs = sorted({os.path.dirname(item.path) for item in items})
+    for d in dirs:
+        os.makedirs(d, exist_ok=True)
+
+    total = checkout_files(repo, items, jobs, byte_budget)
+
+    # Refresh the stat data of what we wrote, so status sees clean files
+    for change, item in zip((c for c in changes if c.new_sha is not None), items):
+        st = os.lstat(item.path)
+        entries[change.path] = index_entry_from_stat(change.path, item.sha, st, item.mode)
+
+    index.entries = [entries[name] for name in sorted(entries)]
+    return CheckoutStats(len(items) + removed, len(dirs), total, time.perf_counter() - start)
+
+
+# ------------------------------- CHECKOUT_END ------------------------------- #
@@ -0,0 +1,78 @@
+import time
+import zlib
+
+from common.trace import TRACE, trace
+
+# ---------------------------- COMPRESSION_START ----------------------------- #
+# How hard objects are deflated, from the repo config like git:
+#   core.looseCompression   loose objects, defaults to core.compression, then 1
+#   pack.compression        packs, defaults to core.compression, then -1
+# -1 is zlib's default (6), 0 stores the data as is, 9 is the smallest.
+#
+# Whatever the level, data that's already compressed (jpg, zip, gzip...)
+# only costs CPU to deflate again and comes out the same size. So a few
+# slices of a large object are compressed first: if they don't shrink,
+# the object is stored at level 0.
+
+COMPRESSION_LOOSE_DEFAULT = 1
+COMPRESSION_PACK_DEFAULT = -1
+
+COMPRESSION_SAMPLE_MIN = 16 * 1024  # Smaller objects are cheap whatever the level
+COMPRESSION_SAMPLE_SIZE = 4096
+COMPRESSION_SAMPLES = 4
+COMPRESSION_INCOMPRESSIBLE = 0.95  # Samples coming out larger than that are incompressible
+
+
+def compression_config_level(conf, section: str, key: str, fallback: int | None) -> int | None:
+    if not conf.has_option(section, key):
+        return fallback
+    level = conf.getint(section, key)
+    if not -1 <= level <= 9:
+        raise Exception(f"Bad zlib compression level {level} for {section}.{key}")
+    return level
+
+
+def compression_levels(conf) -> tuple[int, int]:
+    """
+    The (loose, pack) compression levels configured in conf
+    """
+    core = compression_config_level(conf, "core", "compression", None)
+    loose = compression_config_level(
+        conf, "core", "loosecompression", COMPRESSION_LOOSE_DEFAULT if core is None else core
+    )
+    pack = compression_config_level(
+        conf, "pack", "compression", COMPRESSION_PACK_DEFAULT if core is None else core
+    )
+    return loose, pack
+
+
+def compression_level(data: bytes, level: int) -> int:
+    """
+    level, or 0 when sampling data says it won't compress
+    """
+    if level == 0 or len(data) < COMPRESSION_SAMPLE_MIN:
+        return level
+    step = (len(data) - COMPRESSION_SAMPLE_SIZE) // (COMPRESSION_SAMPLES - 1)
+    sample = b"".join(
+        data[i * step : i * step + COMPRESSION_SAMPLE_SIZE] for i in range(COMPRESSION_SAMPLES)
+    )
+    if len(zlib.compress(sample, 1)) > len(sample) * COMPRESSION_INCOMPRESSIBLE:
+        return 0
+    return level
+
+
+def deflate(level: int, *chunks: bytes) -> bytes:
+    """
+    chunks as a single zlib stream, the last one (the content) deciding the
+    level: see compression_level
+    """
+    start = time.perf_counter() if TRACE else None
+    level = compression_level(chunks[-1], level)
+    compressor = zlib.compressobj(level)
+    out = b"".join([*(compressor.compress(chunk) for chunk in chunks), compressor.flush()])
+    if TRACE:
+        trace("deflate", start, level=level, bytes_in=sum(len(chunk) for chunk in chunks), bytes_out=len(out))
+    return out
+
+
+# ----------------------------- COMPRESSION_END ------------------------------ #
@@ -0,0 +1,203 @@
+import base64
+import io
+import json
+import os
+import socket
+import sys
+
+from constants import GIT_DIR
+
+# ------------------------------- DAEMON_START ------------------------------- #
+# `wyag daemon` keeps a repository open with everything it has read cached:
+# config, refs, objects, the parsed index (until the file changes), commit
+# infos... and answers read-only commands over a Unix socket, .git/wyag.sock.
+#
+# The protocol is JSON lines, any number of requests per connection:
+#   -> {"argv": ["status"], "cwd": "/path/in/the/worktree"}
+#   <- {"code": 0, "stdout": "<base64>", "stderr": "<base64>"}
+# A "code" of null means the daemon won't run it (not a command it serves,
+# or cwd is outside its worktree): run it yourself.
+#
+# The CLI is a client when WYAG_DAEMON=1, falling back to running the
+# command itself whenever no daemon answers. Editors polling status can
+# skip even that and talk to the socket directly.
+#
+# Commands run one at a time, on a single worker thread: they print to
+# sys.stdout, which is swapped for a buffer while each one runs. Their logs
+# go to a loguru sink over the stderr buffer, added for that one request:
+# loguru's default sink would hold on to whatever sys.stderr was when it
+# was first imported.
+
+DAEMON_SOCKET = "wyag.sock"
+DAEMON_COMMANDS = ("cat-file", "log", "ls-tree", "rev-parse", "status")
+
+daemon_logging = False  # Whether loguru's default sink is gone
+
+
+def daemon_socket_path(gitdir: str) -> str:
+    return os.path.join(gitdir, DAEMON_SOCKET)
+
+
+def daemon_find_gitdir(path=".") -> str | None:
+    """
+    The gitdir above path, found without opening the repository
+    """
+    path = os.path.realpath(path)
+    while True:
+        gitdir = os.path.join(path, GIT_DIR)
+        if os.path.isdir(gitdir):
+            return gitdir
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+
+def daemon_request(sock: socket.socket, argv: list[str], cwd: str) -> dict | None:
+    sock.sendall(json.dumps({"argv": argv, "cwd": cwd}).encode("utf8") + b"\n")
+    line = sock.makefile("rb").readline()
+    return json.loads(line) if line else None
+
+
+def daemon_client_run(argv: list[str]) -> int | None:
+    """
+    Have the daemon run argv. Returns its exit code, or None if there's no
+    daemon to ask or it won't run argv: run it locally then.
+    """
+    if not argv or argv[0] not in DAEMON_COMMANDS:
+        return None
+    gitdir = daemon_find_gitdir()
+    if gitdir is None:
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(daemon_socket_path(gitdir))
+        response = daemon_request(sock, argv, os.getcwd())
+    except OSError:
+        return None  # Not running, or went away
+    finally:
+        sock.close()
+
+    if response is None or response.get("code") is None:
+        return None
+    sys.stdout.buffer.write(base64.b64decode(response["stdout"]))
+    sys.stdout.buffer.flush()
+    sys.stderr.buffer.write(base64.b64decode(response["stderr"]))
+    sys.stderr.buffer.flush()
+    return response["code"]
+
+
+def daemon_run_command(repo, argv: list[str], cwd: str) -> dict:
+    """
+    Run argv in-process, as if from cwd, capturing its output
+    """
+    from common.log import logger
+    from common.parser import command_parse
+
+    global daemon_logging
+    worktree = os.path.realpath(repo.worktree)
+    cwd = os.path.realpath(cwd)
+    if not argv or argv[0] not in DAEMON_COMMANDS:
+        return {"code": None, "error": f"Not served by the daemon: {argv[:1]}"}
+    if cwd != worktree and not cwd.startswith(worktree + os.sep):
+        return {"code": None, "error": f"{cwd} is outside of {worktree}"}
+
+    if not daemon_logging:
+        logger.remove()  # The default sink, on the daemon's own stderr
+        daemon_logging = True
+
+    stdout = io.BytesIO()
+    stderr = io.BytesIO()
+    saved = sys.stdout, sys.stderr, os.getcwd()
+    out = sys.stdout = io.TextIOWrapper(stdout, encoding="utf8", write_through=True)
+    err = sys.stderr = io.TextIOWrapper(stderr, encoding="utf8", write_through=True)
+    sink = logger.add(err)
+    os.chdir(cwd)
+    try:
+        cmd, args = command_parse(argv)
+        cmd(args)
+        code = 0
+    except SystemExit as e:
+        if isinstance(e.code, int) or e.code is None:
+            code = e.code or 0
+        else:
+            print(e.code, file=sys.stderr)
+            code = 1
+    except Exception as e:
+        print(f"{type(e).__name__}: {e}", file=sys.stderr)
+        code = 1  # What an uncaught exception exits with
+    finally:
+        logger.remove(sink)
+        # Detached, the buffers outlive their wrappers
+        out.detach()
+        err.detach()
+        sys.stdout, sys.stderr, old_cwd = saved
+        os.chdir(old_cwd)
+
+    return {
+        "code": code,
+        "stdout": base64.b64encode(stdout.getvalue()).decode("ascii"),
+        "stderr": base64.b64encode(stderr.getvalue()).decode("ascii"),
+    }
+
+
+def daemon_serve(repo, path: str):
+    """
+    Serve repo on the socket at path until SIGINT or SIGTERM
+    """
+    import asyncio
+    import signal
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except OSError:
+            os.unlink(path)  # Left behind by a daemon that died
+        else:
+            raise Exception(f"A daemon is already listening on {path}")
+        finally:
+            probe.close()
+
+    executor = ThreadPoolExecutor(max_workers=1)
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        loop = asyncio.get_running_loop()
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                    argv, cwd = request["argv"], request["cwd"]
+                except (ValueError, KeyError, TypeError):
+                    response = {"code": None, "error": "Malformed request"}
+                else:
+                    response = await loop.run_in_executor(executor, daemon_run_command, repo, argv, cwd)
+                writer.write(json.dumps(response).encode("utf8") + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        server = await asyncio.start_unix_server(handle, path=path)
+        print(f"Serving {repo.worktree} on {path}", file=sys.stderr)
+        async with server:
+            await stop.wait()
+
+    try:
+        asyncio.run(serve())
+    finally:
+        executor.shutdown()
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+# -------------------------------- DAEMON_END -------------------------------- #
@@ -0,0 +1,149 @@
+import os
+import re
+import zlib
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, NamedTuple
+
+from common.helper_classes import GitRepository, object_read, repo_path
+
+# -------------------------------- GREP_START -------------------------------- #
+# Search blobs in place, without checking anything out. Files are listed
+# (from a tree, the index or the worktree), then handed to a thread pool
+# which inflates and scans them; results are printed in path order, as soon
+# as the files before them are done. Only a window of files is in flight at
+# once, so memory doesn't grow with the size of the tree.
+#
+# Binary files are skipped: like git, a NUL in the first 8000 bytes means
+# binary. For a loose object only that much is inflated to find out.
+
+GREP_SNIFF_BYTES = 8000
+GREP_DEFAULT_JOBS = min(32, (os.cpu_count() or 1) + 4)
+
+
+class GrepFile(NamedTuple):
+    path: str
+    sha: str | None  # None: read it from the worktree
+
+
+class GrepMatch(NamedTuple):
+    line_number: int
+    line: bytes
+
+
+def grep_tree_files(repo: GitRepository, tree: str, prefix="") -> Iterator[GrepFile]:
+    """
+    Every regular file of tree, in path order. Like git, symlinks and
+    submodules are skipped.
+    """
+    obj = object_read(repo, tree)
+    for i in range(len(obj)):
+        if obj.is_tree(i):
+            path = f"{prefix}/{obj.path(i)}" if prefix else obj.path(i)
+            yield from grep_tree_files(repo, obj.sha(i), path)
+        elif obj.mode(i).startswith(b"10"):
+            path = f"{prefix}/{obj.path(i)}" if prefix else obj.path(i)
+            yield GrepFile(path, obj.sha(i))
+
+
+def blob_read_text(repo: GitRepository, sha: str) -> bytes | None:
+    """
+    The content of a blob, or None if it's binary
+    """
+    path = repo_path(repo, "objects", sha[0:2], sha[2:])
+    try:
+        with open(path, "rb") as f:
+            compressed = f.read()
+    except FileNotFoundError:
+        data = object_read(repo, sha).blobdata
+        return None if b"\x00" in data[:GREP_SNIFF_BYTES] else data
+
+    inflater = zlib.decompressobj()
+    head = inflater.decompress(compressed, GREP_SNIFF_BYTES + 64)
+    head = head[head.index(b"\x00") + 1 :]
+    if b"\x00" in head[:GREP_SNIFF_BYTES]:
+        return None
+    return head + inflater.decompress(inflater.unconsumed_tail) + inflater.flush()
+
+
+def worktree_read_text(path: str) -> bytes | None:
+    with open(path, "rb") as f:
+        head = f.read(GREP_SNIFF_BYTES)
+        if b"\x00" in head:
+            return None
+        return head + f.read()
+
+
+def grep_data(regex: re.Pattern, data: bytes) -> list[GrepMatch]:
+    r"""
+    The lines of data matching regex. The regex runs over the whole blob
+    at once, line numbers are only counted for the lines that match.
+
+    A match reaching into a newline (`\s`, `\W`, `[^a]`...) isn't one: like
+    git, a line is matched on its own, so that line is searched again alone.
+    """
+    ret = list()
+    line_number = 1
+    counted = 0  # line_number is the number of the line at counted
+    pos = 0
+    while True:
+        match = regex.search(data, pos)
+        if match is None:
+            break
+        start = data.rfind(b"\n", 0, match.start()) + 1
+        end = data.find(b"\n", match.start())
+        if end == -1:
+            end = len(data)
+        if match.end() > end and regex.search(data, start, end) is None:
+            pos = end + 1
+            if pos > len(data):
+                break
+            continue
+        line_number += data.count(b"\n", counted, start)
+        counted = start
+        ret.append(GrepMatch(line_number, data[start:end]))
+        # Next search from the line after, a line is reported once
+        pos = end + 1
+        if pos > len(data):
+            break
+    return ret
+
+
+def grep_file(repo: GitRepository, regex: re.Pattern, file: GrepFile) -> list[GrepMatch]:
+    if file.sha is None:
+        try:
+            data = worktree_read_text(os.path.join(repo.worktree, file.path))
+        except FileNotFoundError:
+            return list()  # Deleted, but not staged yet
+    else:
+        data = blob_read_text(repo, file.sha)
+    if data is None:
+        return list()
+    return grep_data(regex, data)
+
+
+def grep_files(repo: GitRepository, regex: re.Pattern, files: Iterator[GrepFile],
+               jobs=GREP_DEFAULT_JOBS) -> Iterator[tuple[GrepFile, list[GrepMatch]]]:
+    """
+    Scan files on a pool of jobs threads, yielding (file, matches) in order
+    """
+    if jobs <= 1:
+        for file in files:
+            yield file, grep_file(repo, regex, file)
+        return
+
+    window = jobs * 4
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        in_flight = deque()
+        for file in files:
+            in_flight.append((file, pool.submit(grep_file, repo, regex, file)))
+            if len(in_flight) >= window:
+                done, future = in_flight.popleft()
+                yield done, future.result()
+        while in_flight:
+            done, future = in_flight.popleft()
+            yield done, future.result()
+
+
+# --------------------------------- GREP_END --------------------------------- #
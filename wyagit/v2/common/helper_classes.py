@@ -2,17 +2,24 @@ import os
 import re
 import configparser
 from constants import GIT_DIR, GIT_CONFIG_FILE
-from loguru import logger
-import traceback
+from common.refs import REF_BACKENDS, RefBackend
+from common.oidindex import OidIndex
+from common.pack import pack_object_read
+from common.compression import compression_levels, deflate
+from common.trace import traced
+from common.log import logger
+from common.singleflight import SingleFlight
 import zlib
 import hashlib
 import io
-import json
+import threading
 
+from collections import OrderedDict
 
-from typing import BinaryIO, TypedDict, NamedTuple
+from array import array
 
-from collections import namedtuple
+
+from typing import BinaryIO, NamedTuple
 
 
 # ------------------------------- CLASSES_START ------------------------------ #
@@ -30,9 +37,18 @@ class GitRepository:
     worktree: str | None = None
     gitdir: str | None = None
     conf: configparser.ConfigParser | None = None
+    refs: RefBackend | None = None
+    oids: OidIndex | None = None
+    commits: dict | None = None  # sha -> CommitInfo, see common.revision
+    # Only for repos kept open by a long-lived process, see repo_cache_enable
+    objects: "ObjectCache | None" = None
+    index_cache: dict | None = None  # index file stat -> GitIndex
+    batch: "ObjectBatch | None" = None  # Where object_write goes, see common.objbatch
+    compression: tuple[int, int] | None = None  # (loose, pack) zlib levels, see repo_compression
 
     def __init__(self, path: str, force=False):
         self.worktree = path
+        self.reads = SingleFlight()  # sha -> the object_read in flight
         self.gitdir = os.path.join(path, GIT_DIR)
 
         valid_gitdir = force or os.path.isdir(self.gitdir)
@@ -53,9 +69,44 @@ class GitRepository:
 
         if not force:
             vers = int(self.conf.get("core", "repositoryformatversion"))
-            if vers != 0:
+            if vers not in (0, 1):
                 raise Exception("Unsupported repositoryformatversion: {vers}")
 
+            # Version 1 repositories may only use extensions we understand
+            if vers == 1 and self.conf.has_section("extensions"):
+                for ext, value in self.conf.items("extensions"):
+                    if ext != "refstorage" or value not in REF_BACKENDS:
+                        raise Exception(f"Unsupported extension: {ext} = {value}")
+
+
+OBJECT_CACHE_SIZE = 4096
+
+
+class ObjectCache:
+    """
+    The last max_objects objects read, by sha. An object never changes,
+    so a cached one is always right.
+    """
+
+    def __init__(self, max_objects=OBJECT_CACHE_SIZE):
+        self.max_objects = max_objects
+        self.objects = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, sha: str):
+        with self.lock:
+            obj = self.objects.get(sha)
+            if obj is not None:
+                self.objects.move_to_end(sha)
+            return obj
+
+    def put(self, sha: str, obj):
+        with self.lock:
+            self.objects[sha] = obj
+            self.objects.move_to_end(sha)
+            while len(self.objects) > self.max_objects:
+                self.objects.popitem(last=False)
+
 
 class GitObject:
     """
@@ -98,11 +149,160 @@ class GitBlob(GitObject):
         self.blobdata = data
 
 
+class LazyKvlm(dict):
+    """
+    A kvlm (see kvlm_parse) that only parses the headers history walks
+    need up front: tree and parent (object and type for tags) always come
+    first. The rest is parsed the first time anything else is looked at.
+    """
+
+    eager_keys = frozenset((b"tree", b"parent", b"object", b"type"))
+
+    def __init__(self, raw: bytes):
+        super().__init__()
+        self.raw = raw
+        self.pos = kvlm_parse_headers(raw, 0, self, self.eager_keys)
+        if self.pos is None:
+            self.raw = None
+
+    def parse_rest(self):
+        raw, pos = self.raw, self.pos
+        if pos is not None:
+            # Parsed aside and added in one go: threads sharing this object
+            # (see object_read) may both get here, and both add the same
+            rest = dict()
+            kvlm_parse_headers(raw, pos, rest)
+            dict.update(self, rest)
+            self.pos = self.raw = None
+
+    def peek(self, key: bytes) -> bytes | None:
+        """
+        Value of a one-line header (e.g. committer), found without parsing
+        the rest
+        """
+        raw, pos = self.raw, self.pos
+        if pos is None:
+            return dict.get(self, key)
+        prefix = key + b" "
+        while pos < len(raw):
+            end = raw.find(b"\n", pos)
+            if end < 0:
+                end = len(raw)
+            if end == pos:
+                return None  # The blank line before the message
+            if raw.startswith(prefix, pos):
+                return raw[pos + len(prefix) : end]
+            pos = end + 1
+        return None
+
+    def __getitem__(self, key):
+        if key not in self.eager_keys:
+            self.parse_rest()
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        if key not in self.eager_keys:
+            self.parse_rest()
+        return super().get(key, default)
+
+    def __contains__(self, key):
+        if key not in self.eager_keys:
+            self.parse_rest()
+        return super().__contains__(key)
+
+    def __setitem__(self, key, value):
+        self.parse_rest()  # Keep the headers in order
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self.parse_rest()
+        super().__delitem__(key)
+
+    def __iter__(self):
+        self.parse_rest()
+        return super().__iter__()
+
+    def __len__(self):
+        self.parse_rest()
+        return super().__len__()
+
+    def __repr__(self):
+        self.parse_rest()
+        return super().__repr__()
+
+    def keys(self):
+        self.parse_rest()
+        return super().keys()
+
+    def values(self):
+        self.parse_rest()
+        return super().values()
+
+    def items(self):
+        self.parse_rest()
+        return super().items()
+
+    def pop(self, *args):
+        self.parse_rest()
+        return super().pop(*args)
+
+    def setdefault(self, key, default=None):
+        self.parse_rest()
+        return super().setdefault(key, default)
+
+    # What dict implements in C, reading its own storage, must see every
+    # header too
+
+    def __eq__(self, other):
+        self.parse_rest()
+        if isinstance(other, LazyKvlm):
+            other.parse_rest()
+        return super().__eq__(other)
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        return eq if eq is NotImplemented else not eq
+
+    def __or__(self, other):
+        self.parse_rest()
+        if isinstance(other, LazyKvlm):
+            other.parse_rest()
+        return dict(self.items()) | other
+
+    def __ror__(self, other):
+        self.parse_rest()
+        return other | dict(self.items())
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def __reversed__(self):
+        self.parse_rest()
+        return super().__reversed__()
+
+    def copy(self):
+        self.parse_rest()
+        return dict(self.items())
+
+    def update(self, *args, **kwargs):
+        self.parse_rest()
+        super().update(*args, **kwargs)
+
+    def popitem(self):
+        self.parse_rest()
+        return super().popitem()
+
+    def clear(self):
+        self.parse_rest()
+        super().clear()
+
+
 class GitCommit(GitObject):
     fmt = b"commit"
 
     def deserialize(self, data):
-        self.kvlm = kvlm_parse(data)
+        self.kvlm = LazyKvlm(data)
 
     def serialize(self):
         return kvlm_serialize(self.kvlm)
@@ -125,16 +325,102 @@ class GitTreeLeaf:
 
 
 class GitTree(GitObject):
+    """
+    A tree read from disk keeps its raw data and where each entry starts
+    and where its path ends (the NUL before the 20 byte sha). Entries are
+    read straight from the buffer by index with mode(), path(), oid()...,
+    nothing is decoded or allocated for the ones nobody looks at.
+
+    items, the list of GitTreeLeaf, is only built when asked for. It's the
+    one to edit to change the tree; the accessors keep describing the
+    tree as it was read.
+    """
+
     fmt = b"tree"
 
     def deserialize(self, data):
-        self.items = tree_parse(data)
+        self.raw = data
+        self.starts, self.nulls = tree_parse_offsets(data)
+        self._items = None
 
     def serialize(self):
+        if self._items is None:
+            return self.raw  # Untouched since it was read
         return tree_serialize(self)
 
     def init(self):
-        self.items = list()
+        self.raw = b""
+        self.starts, self.nulls = array("I"), array("I")
+        self._items = list()
+
+    @property
+    def items(self) -> list[GitTreeLeaf]:
+        if self._items is None:
+            self._items = [GitTreeLeaf(self.mode(i), self.path(i), self.sha(i)) for i in range(len(self.starts))]
+        return self._items
+
+    @items.setter
+    def items(self, items: list[GitTreeLeaf]):
+        self._items = items
+
+    def __len__(self):
+        return len(self.starts)
+
+    def mode(self, i: int) -> bytes:
+        """
+        Normalized to 6 bytes, like GitTreeLeaf.mode
+        """
+        start = self.starts[i]
+        if self.raw[start + 5] == 0x20:
+            return b"0" + self.raw[start : start + 5]
+        return self.raw[start : start + 6]
+
+    def is_tree(self, i: int) -> bool:
+        # Only a subtree's mode is 5 bytes long, "40000"
+        return self.raw[self.starts[i] + 5] == 0x20
+
+    def path_bytes(self, i: int) -> bytes:
+        start = self.starts[i]
+        space = start + 5 if self.raw[start + 5] == 0x20 else start + 6
+        return self.raw[space + 1 : self.nulls[i]]
+
+    def path(self, i: int) -> str:
+        return self.path_bytes(i).decode("utf8")
+
+    def oid(self, i: int) -> bytes:
+        """
+        The raw 20 byte sha
+        """
+        null = self.nulls[i]
+        return self.raw[null + 1 : null + 21]
+
+    def sha(self, i: int) -> str:
+        return self.oid(i).hex()
+
+    def sort_key(self, i: int) -> bytes:
+        if self.is_tree(i):
+            return self.path_bytes(i) + b"/"
+        return self.path_bytes(i)
+
+    def find(self, name: str) -> int | None:
+        """
+        The index of the entry called name, by binary search. Entries are
+        sorted with a "/" after subtree names, so name is looked for both
+        as a file and as a subtree.
+        """
+        key = name.encode("utf8")
+        n = len(self.starts)
+        for wanted in (key, key + b"/"):
+            lo, hi = 0, n
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self.sort_key(mid) < wanted:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            if lo < n and self.sort_key(lo) == wanted:
+                return lo
+        return None
 
 
 class GitTag(GitCommit):
@@ -196,6 +482,84 @@ def repo_dir(repo: GitRepository, *path: str, mkdir=False):
         logger.debug(f"repo: {repo} | *path: {path} | mkdir: {mkdir}")
 
 
+# Every repository opened in this process, by real gitdir, with the stat of
+# its config when it was read: (mtime_ns, size, inode) -> repo. Handing out
+# the same handle keeps its refs, commits and objects cached; a new config
+# means opening it again
+open_repos: dict[str, tuple[tuple, GitRepository]] = dict()
+open_repos_lock = threading.Lock()
+
+# Directory, as given -> worktree of the repo it's in. Only hits are kept:
+# a directory outside of any repo may become one
+repo_roots: dict[str, str] = dict()
+
+
+def repo_config_key(gitdir: str) -> tuple | None:
+    try:
+        st = os.stat(os.path.join(gitdir, GIT_CONFIG_FILE))
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def repo_open(worktree: str) -> GitRepository:
+    """
+    The repository at worktree (a real path), opened once per process and
+    again only when its config changed
+    """
+    gitdir = os.path.join(worktree, GIT_DIR)
+    key = repo_config_key(gitdir)
+    entry = open_repos.get(gitdir)
+    if entry is not None and key is not None and entry[0] == key:
+        return entry[1]
+
+    repo = GitRepository(worktree)
+    if entry is not None:
+        # Objects are immutable and the index has its own check: both
+        # caches outlive the config
+        old = entry[1]
+        repo.objects, repo.index_cache, repo.commits = old.objects, old.index_cache, old.commits
+    with open_repos_lock:
+        open_repos[gitdir] = (key, repo)
+    return repo
+
+
+def repo_cache_enable(repo: GitRepository, max_objects=OBJECT_CACHE_SIZE):
+    """
+    Cache what's read from repo for as long as it lives: objects, and the
+    index until the file changes
+    """
+    repo.objects = ObjectCache(max_objects)
+    repo.index_cache = dict()
+
+
+def repo_root_walk(path: str) -> str | None:
+    """
+    Worktree of the repo path is in, going up one directory at a time.
+    Every directory passed on the way is remembered in repo_roots
+    """
+    passed = [path]
+    current = os.path.realpath(path)  # Ignore symlinks
+    while True:
+        worktree = repo_roots.get(current)
+        if worktree is not None:
+            break
+        if os.path.isdir(os.path.join(current, GIT_DIR)):
+            worktree = current
+            break
+        passed.append(current)
+
+        # os.path.dirname('/') == '/'
+        parent = os.path.dirname(current)
+        if parent == current:
+            return None
+        current = parent
+
+    for directory in passed:
+        repo_roots[directory] = worktree
+    return worktree
+
+
 def repo_root_finder(path=".", required=True):
     """
     Find the root of the repo, regardless of current location within the worktree
@@ -205,26 +569,35 @@ def repo_root_finder(path=".", required=True):
     Current = ~/Documents/MyProject/src/tui/frames/mainview/
 
     If incoming path is Current, it'll find Root which returns ~/Documents/MyProject
-    """
 
-    path = os.path.realpath(path)  # Ignore symlinks
-    is_root = os.path.isdir(os.path.join(path, GIT_DIR))
-    if is_root:
-        return GitRepository(path)
-
-    # Recursively go up the directory and find parent
+    Directories already looked up, and the repos found, are cached: see
+    repo_roots and open_repos
+    """
 
-    parent = os.path.realpath(os.path.join(path, ".."))
-    logger.debug(f"parent: {parent} | path: {path}")
+    path = os.path.abspath(path)
+    worktree = repo_roots.get(path)
+    if worktree is not None and not os.path.isdir(os.path.join(worktree, GIT_DIR)):
+        repo_roots.clear()  # A repo went away, any of these may be stale
+        worktree = None
+    if worktree is None:
+        worktree = repo_root_walk(path)
 
-    # os.path.join('/', '..') == '/'
-    if parent == path:
+    if worktree is None:
         if required:
             raise Exception("No git directory")
         else:
             return None
 
-    return repo_root_finder(parent, required)
+    return repo_open(worktree)
+
+
+def repo_compression(repo: GitRepository) -> tuple[int, int]:
+    """
+    The zlib levels of repo's (loose, packed) objects, from its config
+    """
+    if repo.compression is None:
+        repo.compression = compression_levels(repo.conf)
+    return repo.compression
 
 
 def repo_default_config():
@@ -238,6 +611,7 @@ def repo_default_config():
     return ret
 
 
+@traced("object_read", "sha")
 def object_read(repo: GitRepository, sha: str):
     """
     Read the contents of the object, based off the SHA provided.
@@ -248,11 +622,52 @@ def object_read(repo: GitRepository, sha: str):
         - Contents is everything after the header
         - Header format: [obj-type] space [content size in ASCII] null. [obj-type] represent the type of
     """
-    obj_dir_name, obj_file_name = split_obj_sha(sha)
+    if repo.objects is not None:
+        obj = repo.objects.get(sha)
+        if obj is not None:
+            return obj
+
+    # Threads reading the same object at once wait for the first one to
+    # inflate and parse it, and all get that same object
+    return repo.reads.do(sha, object_read_file, repo, sha)
+
+
+def object_read_file(repo: GitRepository, sha: str):
+    found = repo.batch.read(sha) if repo.batch is not None else None
+    if found is None:
+        found = object_read_loose(repo, sha)
+    if found is None:
+        found = pack_object_read(oid_index(repo).packs(), sha, lambda base: object_read_loose(repo, base))
+    if found is None:
+        return None
+    fmt, data = found
+
+    # Pick constructor
+    c: type[GitCommit] | type[GitTree] | type[GitTag] | type[GitBlob]
+    match fmt:
+        case b"commit":
+            c = GitCommit
+        case b"tree":
+            c = GitTree
+        case b"tag":
+            c = GitTag
+        case b"blob":
+            c = GitBlob
+        case _:
+            raise Exception(f"Unknown type {fmt.decode('ascii')} for object {sha}")
+    # Call constructor and return object
+    obj = c(data)
+    if repo.objects is not None:
+        repo.objects.put(sha, obj)
+    return obj
 
-    logger.debug(f"obj_dir_name: {obj_dir_name} | obj_file_name: {obj_file_name}")
-    path = repo_file(repo, "objects", obj_dir_name, obj_file_name)
-    logger.debug(f"path: {path}")
+
+def object_read_loose(repo: GitRepository, sha: str) -> tuple[bytes, bytes] | None:
+    """
+    (fmt, content) of a loose object, or None
+    """
+    obj_dir_name, obj_file_name = split_obj_sha(sha)
+    path = repo_path(repo, "objects", obj_dir_name, obj_file_name)
 
     if not os.path.isfile(path):
         return None
@@ -260,63 +675,69 @@ def object_read(repo: GitRepository, sha: str):
     f: BinaryIO
     with open(path, "rb") as f:
         raw = zlib.decompress(f.read())
-        logger.debug(f"raw: {raw}")
-
-        fmt, null_pos = process_obj_header(raw, sha)
-
-        # Pick constructor
-        c: type[GitCommit] | type[GitTree] | type[GitTag] | type[GitBlob]
-        match fmt:
-            case b"commit":
-                c = GitCommit
-            case b"tree":
-                c = GitTree
-            case b"tag":
-                c = GitTag
-            case b"blob":
-                c = GitBlob
-            case _:
-                raise Exception(f"Unknown type {fmt.decode('ascii')} for object {sha}")
-        # Call constructor and return object
-        obj = c(raw[null_pos + 1 :])
-        return obj
+    fmt, null_pos = process_obj_header(raw, sha)
+    return fmt, raw[null_pos + 1 :]
 
 
+@traced("object_write")
 def object_write(obj: GitObject, repo=None | GitRepository):
     """
     Object binary file format:
     [object-type] space [content size in ASCII] null [content]
     """
     data = obj.serialize()
-    result = obj.fmt + b" " + str(len(data)).encode() + b"\x00" + data
-    sha = hashlib.sha1(result).hexdigest()
-
-    if repo:
+    # The header and data are hashed and compressed one after the other,
+    # never copied into a single buffer
+    header = obj.fmt + b" " + str(len(data)).encode() + b"\x00"
+    hasher = hashlib.sha1(header)
+    hasher.update(data)
+    sha = hasher.hexdigest()
+
+    if repo and repo.batch is not None:
+        repo.batch.write(sha, obj.fmt, header, data)
+    elif repo:
         obj_dir_name = sha[0:2]
         obj_b_file_name = sha[2:]
         path = repo_file(repo, "objects", obj_dir_name, obj_b_file_name, mkdir=True)
 
         if not os.path.exists(path):
+            import tempfile  # Only writers pay for importing it
+
+            # Written next to it then renamed, so a reader never sees half an object
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix="tmp_obj_")
             f: BinaryIO
-            with open(path, "wb") as f:
-                f.write(zlib.compress(result))
+            with os.fdopen(fd, "wb") as f:
+                f.write(deflate(repo_compression(repo)[0], header, data))
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp_path, 0o444)
+            os.replace(tmp_path, path)
+            if repo.oids:
+                repo.oids.add(sha)
     return sha
 
 
-def object_find(repo: GitRepository, name, fmt=None, follow=True):
+def oid_index(repo: GitRepository) -> OidIndex:
     """
-    Cannot find stuff??
+    The sorted object id index of the repo, built lazily
     """
-    sha = object_resolve(repo, name)
-    if not sha:
-        raise Exception(f"No such reference {name}.")
+    if repo.oids is None:
+        repo.oids = OidIndex(repo_path(repo, "objects"))
+    return repo.oids
 
-    if len(sha) > 1:
-        raise Exception(
-            "Ambiguous reference {name}: Candidates are:\n - {'\n - '.join(sha)}."
-        )
 
-    sha = sha[0]
+def object_find(repo: GitRepository, name, fmt=None, follow=True):
+    """
+    Resolve a name (or a revision expression such as HEAD~2) to a single sha,
+    then follow tags / commits until an object of type fmt is reached
+    """
+    # common.revision builds on this module, hence the late import
+    from common.revision import is_rev_expression, rev_parse_single
+
+    if is_rev_expression(name):
+        sha = rev_parse_single(repo, name)
+    else:
+        sha = object_resolve_unique(repo, name)
 
     if not fmt:
         return sha
@@ -339,6 +760,22 @@ def object_find(repo: GitRepository, name, fmt=None, follow=True):
             return None
 
 
+def object_resolve_unique(repo: GitRepository, name: str) -> str:
+    """
+    Same as object_resolve, but name must match exactly one object
+    """
+    sha = object_resolve(repo, name)
+    if not sha:
+        raise Exception(f"No such reference {name}.")
+
+    if len(sha) > 1:
+        raise Exception(
+            "Ambiguous reference {name}: Candidates are:\n - {'\n - '.join(sha)}."
+        )
+
+    return sha[0]
+
+
 def object_resolve(repo: GitRepository, name: str):
     """
     Resolve name to an object hash in repo.
@@ -349,7 +786,6 @@ def object_resolve(repo: GitRepository, name: str):
     If name == tags/branch, return matching name
     """
 
-    logger.debug(f"repo: {repo} | name: {name}")
     if not name.strip():
         logger.warning(f"{name} is empty")
         return None
@@ -357,30 +793,23 @@ def object_resolve(repo: GitRepository, name: str):
     if name == "HEAD":
         return [ref_resolve(repo, "HEAD")]
 
+    # Full ref names are non-ambiguous too
+    if name.startswith("refs/"):
+        sha = ref_resolve(repo, name)
+        return [sha] if sha else None
+
     candidates = list()
     hashRE = re.compile(r"^[0-9A-Fa-f]{4,40}$")
 
     if hashRE.match(name):
         # Hash can either be short or full
-        name = name.lower()
-        obj_dir = name[0:2]
-        path = repo_dir(repo, "objects", obj_dir, mkdir=False)
-        if path:
-            obj_file_name = name[2:]
-            for file in os.listdir(path):
-                if file.startswith(obj_file_name):
-                    full_hash = obj_dir + obj_file_name
-                    candidates.append(full_hash)
-        else:
-            logger.warning(f"{path} is empty")
+        candidates.extend(oid_index(repo).resolve(name.lower()))
 
     as_tag = ref_resolve(repo, "refs/tags/" + name)
-    logger.debug(f"as_tag: {as_tag}")
     if as_tag:
         candidates.append(as_tag)
 
     as_branch = ref_resolve(repo, "refs/heads/" + name)
-    logger.debug(f"as_branch: {as_branch}")
     if as_branch:
         candidates.append(as_branch)
     return candidates
@@ -408,200 +837,177 @@ def object_hash(fd: io.BufferedReader, fmt: str, repo: GitRepository | None = No
     return object_write(obj, repo)
 
 
-# dct=None is done instead of dct=dict() as dct=dict() will cause
-# the same dictionary to grow across different function calls
-# @REVISIT
 def kvlm_parse(raw: bytes, start=0, dct=None):
     """
     Key Value List with Message (kvlm_parse)
 
-    This deserialises a commit object content.
-
-    The fn is recursive, it reads a key/value pair, calls itself to a new position.
+    This deserialises a commit object content: header lines ("key value",
+    continuation lines start with a space), a blank line, then the message,
+    stored under the None key.
     """
-
-    # logger.debug(f"raw: {raw} | start: {start} | dct: {dct}")
-
-    if not dct:
+    if dct is None:
         dct = dict()
+    kvlm_parse_headers(raw, start, dct)
+    return dct
 
-    # If a space appears before a new line, we have a keyword. Otherwise,
-    # it's the final message, which we just read to eof
-    space_pos = raw.find(b" ", start)
-    new_line_pos = raw.find(b"\n", start)
-
-    logger.debug(
-        f"space_pos: {space_pos} | new_line_pos: {new_line_pos} | start: {start}"
-    )
-
-    # It's a blank line if there's no space or a newline
-    # A blank line means the remainder of the data is message. We store it in the dict
-    # with None as the key, and return
-    blank_line = (space_pos < 0) or (new_line_pos < space_pos)
-    logger.debug(f"blank_line: {blank_line}")
-    if blank_line:
-        assert new_line_pos == start
-        dct[None] = raw[start + 1 :]
-        return dct
-
-    key = raw[start:space_pos]
-
-    # Find the end of the value. Continuation lines begin with a
-    # space, so we loop until we find a '\n' not followed by a space
-    end = start
-    while True:
-        end = raw.find(b"\n", end + 1)
-        if raw[end + 1] != ord(" "):
-            break
-    logger.debug(f"end: {end}")
-
-    # Drop the leading space on continuation lines
-    wo_lead_space = space_pos + 1
-    value = raw[wo_lead_space:end].replace(b"\n ", b"\n")
 
-    logger.debug(f"key: {key} | value: {value}")
+def kvlm_parse_headers(raw: bytes, start: int, dct: dict, keys=None) -> int | None:
+    """
+    Parse header lines from start into dct, one loop iteration per header:
+    positions are found with find() on raw itself, only values are sliced.
+    With keys, stop at the first header not in keys and return its position.
+    Returns None once the message is reached.
+    """
+    n = len(raw)
+    pos = start
+    while True:
+        new_line_pos = raw.find(b"\n", pos)
+        if new_line_pos < 0:
+            new_line_pos = n  # No message at all
+        space_pos = raw.find(b" ", pos, new_line_pos)
+
+        # No space before the end of the line: it's the blank line, the
+        # remainder of the data is the message
+        if space_pos < 0:
+            dict.__setitem__(dct, None, raw[new_line_pos + 1 :])
+            return None
 
-    if key in dct:
-        if type(dct[key]) == list:
-            dct[key].append(value)
+        key = raw[pos:space_pos]
+        if keys is not None and key not in keys:
+            return pos
+
+        # Find the end of the value. Continuation lines begin with a
+        # space, so we loop until we find a '\n' not followed by a space
+        end = new_line_pos
+        while end + 1 < n and raw[end + 1] == 0x20:
+            end = raw.find(b"\n", end + 1)
+            if end < 0:
+                end = n
+        value = raw[space_pos + 1 : end]
+        if end != new_line_pos:
+            # Drop the leading space on continuation lines
+            value = value.replace(b"\n ", b"\n")
+
+        existing = dict.get(dct, key)
+        if existing is None:
+            dict.__setitem__(dct, key, value)
+        elif type(existing) == list:
+            existing.append(value)
         else:
-            dct[key] = [dct[key], value]
-    else:
-        dct[key] = value
-
-    logger.debug("")
-    return kvlm_parse(raw, start=end + 1, dct=dct)
+            dict.__setitem__(dct, key, [existing, value])
+        pos = end + 1
 
 
 def kvlm_serialize(kvlm):
     """
     Writing commits / tags in a text format
     """
-
-    ret = b""
-
-    for k in kvlm.keys():
+    ret = list()
+    for k, val in kvlm.items():
         # skip the message itself
         if k == None:
             continue
-        val = kvlm[k]
         if type(val) != list:
             val = [val]
-
         for v in val:
-            ret += k + b" " + (v.replace(b"\n", b"\n ")) + b"\n"
-
-    ret += b"\n" + kvlm[None]
+            ret.append(k + b" " + v.replace(b"\n", b"\n ") + b"\n")
 
-    return ret
+    ret.append(b"\n")
+    ret.append(kvlm[None])
+    return b"".join(ret)
 
 
-def tree_parse_worker(raw: bytes, start=0):
+def tree_parse_offsets(raw: bytes) -> tuple[array, array]:
     """
-    Format of a tree: [mode] space [path] 0x00 [sha-1]
+    Format of a tree: [mode] space [path] 0x00 [sha-1], repeated.
+    Returns where each entry starts and where its NUL is.
     """
-    space_pos = raw.find(b" ", start)
-    mode_len = space_pos - start
-    assert mode_len == 5 or mode_len == 6
-
-    mode = raw[start:space_pos]
-    logger.debug(f"mode: {mode}")
-    if len(mode) == 5:
-        # Normalize to 6 bytes
-        mode = b"0" + mode
-
-    null_pos = raw.find(b"\x00", space_pos)
-    path = raw[space_pos + 1 : null_pos]
+    starts = array("I")
+    nulls = array("I")
+    pos = 0
+    end = len(raw)
+    while pos < end:
+        # Neither the mode nor the path may hold a NUL
+        null_pos = raw.find(b"\x00", pos)
+        if null_pos < 0 or null_pos + 21 > end:
+            raise Exception("Malformed tree object: truncated entry")
+        starts.append(pos)
+        nulls.append(null_pos)
+        pos = null_pos + 21
+    return starts, nulls
 
-    raw_sha = int.from_bytes(raw[null_pos + 1 : null_pos + 21], "big")
 
-    # Convert it into an hex string, padded to 40 chars with zero if needed
-    sha = format(raw_sha, "040x")
-    return null_pos + 21, GitTreeLeaf(mode, path.decode("utf8"), sha)
-
-
-def tree_parse(raw: bytes):
-    pos = 0
-    max = len(raw)
-    ret = list()
-    while pos < max:
-        pos, data = tree_parse_worker(raw, pos)
-        ret.append(data)
-    return ret
+def tree_parse(raw: bytes) -> list[GitTreeLeaf]:
+    tree = GitTree(raw)
+    return tree.items
 
 
 def tree_leaf_sort_key(leaf: GitTreeLeaf):
-    if leaf.mode.startswith(b"10"):
-        return leaf.path
-    else:
+    # Only subtrees sort as if their name ended with "/", not symlinks or
+    # submodules
+    if leaf.mode.startswith(b"04"):
         return f"{leaf.path}/"
+    else:
+        return leaf.path
 
 
-def tree_serialize(obj: GitTree):
+def tree_serialize(obj: GitTree) -> bytearray:
     """
-    Writing a tree object in a binary format
+    Writing a tree object in a binary format, appended to a single buffer
     """
     obj.items.sort(key=tree_leaf_sort_key)
-    ret = b""
+    ret = bytearray()
     for i in obj.items:
-        ret += i.mode
+        # Modes are normalized to 6 bytes when parsed, git writes trees as "40000"
+        ret += i.mode.lstrip(b"0")
         ret += b" "
         ret += i.path.encode("utf8")
         ret += b"\x00"
-        sha = int(i.sha, 16)
-        ret += sha.to_bytes(20, byteorder="big")
+        ret += bytes.fromhex(i.sha)
     return ret
 
 
-def tree_checkout(repo: GitRepository, tree: GitTree, path: str):
-    for item in tree.items:
-        obj = object_read(repo, item.sha)
-        dest = os.path.join(path, item.path)
-
-        if obj.fmt == b"tree":
-            os.mkdir(dest)
-            tree_checkout(repo, obj, dest)
-        elif obj.fmt == b"blob":
-            # @TODO Support symlinks (identified by mode 12****)
-            with open(dest, "wb") as f:
-                f.write(obj.blobdata)
+def ref_backend(repo: GitRepository) -> RefBackend:
+    """
+    The ref storage of the repo, picked from extensions.refStorage (default: files)
+    """
+    if repo.refs is None:
+        ref_format = repo.conf.get("extensions", "refstorage", fallback="files")
+        repo.refs = REF_BACKENDS[ref_format](repo.gitdir)
+    return repo.refs
 
 
 def ref_resolve(repo: GitRepository, ref: str):
     """
     Recursively resolving a indirect reference (`ref: <path/to/a/ref>`) to a direct reference (hash)
     """
-    path = repo_file(repo, ref)
+    data = ref_backend(repo).read(ref)
 
-    if not os.path.isfile(path):
-        logger.warning(f"{path} is not a file")
+    if data is None:
+        # Not an error: object_resolve tries a name as a tag, a branch...
         return None
 
-    data: str
-    with open(path, "r") as fp:
-        data = fp.read()[:-1]
-        # Drop final \n ^^^^^
-
     if data.startswith("ref: "):
-        logger.debug("returning indirect reference")
-        logger.debug(f"data: {data} | data[5:]: {data[5:]}")
-        # @TODO figure out why is it data[5:], it drops the initial `ref:`
+        # data[5:] drops the initial `ref: `
         return ref_resolve(repo, data[5:])
     else:
         # reached direct ref
         return data
 
 
-def ref_list(repo: GitRepository, path=None):
-    if not path:
-        path = repo_dir(repo, "refs")
+def ref_list(repo: GitRepository):
+    """
+    Nested dict of every ref under refs/, e.g. {"heads": {"master": <sha>}, "tags": {...}}
+    """
     ret = dict()
-    for f in sorted(os.listdir(path)):
-        can = os.path.join(path, f)
-        if os.path.isdir(can):
-            ret[f] = ref_list(repo, can)
-        else:
-            ret[f] = ref_resolve(repo, can)
+    for name, value in ref_backend(repo).iter_refs("refs/"):
+        *dirs, leaf = name.split("/")[1:]
+        node = ret
+        for d in dirs:
+            node = node.setdefault(d, dict())
+        if value.startswith("ref: "):
+            value = ref_resolve(repo, value[5:])
+        node[leaf] = value
 
     return ret
 
@@ -635,9 +1041,9 @@ def tag_create(repo: GitRepository, name: str, ref: str, create_tag_object=False
         ref_create(repo, "tags/" + name, sha)
 
 
-def ref_create(repo, ref_name, sha):
-    with open(repo_file(repo, "refs/" + ref_name), "w") as fp:
-        fp.write(sha + "\n")
+def ref_create(repo: GitRepository, ref_name: str, sha: str):
+    with ref_backend(repo).transaction() as tx:
+        tx.update("refs/" + ref_name, sha)
 
 
 class ObjShaParts(NamedTuple):
@@ -672,8 +1078,6 @@ def process_obj_header(raw: bytes, sha: str):
     null_pos = raw.find(b"\x00", space_pos)  # find null AFTER first space
     obj_size = int(raw[space_pos:null_pos].decode("ascii"))
 
-    logger.info(f"fmt: {fmt} | obj_size: {obj_size}")
-
     is_obj_valid = obj_size == len(raw) - null_pos - 1
     if not is_obj_valid:
         raise Exception(f"Malformed object {sha}: bad length")
@@ -0,0 +1,374 @@
+import json
+import os
+import re
+
+from typing import Iterator, NamedTuple
+
+from constants import GIT_DIR
+from common.helper_classes import GitRepository, object_read, repo_file, repo_path
+from common.index import GitIndex, index_read
+from common.refs import lock_acquire, lock_commit, lock_release
+from common.trace import traced
+
+# ------------------------------- IGNORE_START ------------------------------- #
+# Ignore rules come from three places, the most specific winning:
+#   - .gitignore files (as staged in the index), scoped to their directory,
+#     the deepest one first
+#   - .git/info/exclude
+#   - the user's global $XDG_CONFIG_HOME/git/ignore
+# Within one file the last matching rule wins, and "!pattern" un-ignores.
+#
+# Every pattern is translated to a regex once, following gitignore(5):
+#   - a pattern with a "/" (other than a trailing one) is anchored to the
+#     directory of its file, otherwise it matches a name at any depth
+#   - a trailing "/" only matches directories
+#   - "*" and "?" stop at "/", "**/" "/**/" and "/**" span directories
+# and all the rules of a file are joined into one alternation, last rule
+# first, so one regex call finds the rule that decides.
+#
+# Nothing inside an ignored directory can be un-ignored, so an ignored
+# directory is never walked into, and what was decided for a directory is
+# remembered for every path below it.
+#
+# Parsed rules are cached in .git/wyag/ignore-cache, keyed by the blob sha
+# of every .gitignore and the mtime and size of the exclude files: when none
+# of them changed, the whole rule set is loaded with one read, and no blob
+# is inflated. A rule set's regexes are only compiled once it's used.
+
+IGNORE_CACHE_FILE = ("wyag", "ignore-cache")
+IGNORE_CACHE_VERSION = 1
+
+
+class IgnoreRule(NamedTuple):
+    pattern: str  # As written, minus the "!"
+    negated: bool
+    dir_only: bool
+    regex: str  # Matched against paths relative to the rule's directory
+    source: str  # The file it comes from
+    line_number: int
+
+
+def glob_class(glob: str, i: int) -> tuple[str, int] | None:
+    """
+    The bracket expression at glob[i] as a regex class, and the index right
+    after it; None when it's never closed. Every character is escaped, a
+    backslash escapes the next one, and ranges stay ranges (a reversed one
+    only matches its first character, like in git).
+    """
+    n = len(glob)
+    j = i + 1
+    negated = glob[j : j + 1] in ("!", "^")
+    if negated:
+        j += 1
+    start = j
+    ranges = list()
+    while j < n and (glob[j] != "]" or j == start):
+        if glob[j] == "\\" and j + 1 < n:
+            j += 1
+        lo = hi = glob[j]
+        j += 1
+        if glob.startswith("-", j) and j + 1 < n and glob[j + 1] != "]":
+            j += 1
+            if glob[j] == "\\" and j + 1 < n:
+                j += 1
+            hi = glob[j]
+            j += 1
+        ranges.append((lo, hi))
+    if j >= n:
+        return None
+
+    body = "".join(re.escape(lo) if lo >= hi else f"{re.escape(lo)}-{re.escape(hi)}" for lo, hi in ranges)
+    return f"(?!/)[{'^' if negated else ''}{body}]", j + 1
+
+
+def glob_translate(glob: str) -> str:
+    """
+    A gitignore glob (without its leading/trailing "/") as a regex
+    """
+    ret = list()
+    i = 0
+    n = len(glob)
+    while i < n:
+        if glob.startswith("**/", i) and (i == 0 or glob[i - 1] == "/"):
+            ret.append("(?:.*/)?")  # Zero or more directories
+            i += 3
+        elif glob.startswith("**", i) and i + 2 == n and (i == 0 or glob[i - 1] == "/"):
+            ret.append(".*")  # Everything inside
+            i += 2
+        elif glob[i] == "*":
+            ret.append("[^/]*")
+            i += 1
+        elif glob[i] == "?":
+            ret.append("[^/]")
+            i += 1
+        elif glob[i] == "\\" and i + 1 < n:
+            ret.append(re.escape(glob[i + 1]))
+            i += 2
+        elif glob[i] == "[" and (found := glob_class(glob, i)) is not None:
+            ret.append(found[0])
+            i = found[1]
+        else:
+            ret.append(re.escape(glob[i]))
+            i += 1
+    return "".join(ret)
+
+
+def gitignore_parse1(raw: str, source="", line_number=0) -> IgnoreRule | None:
+    raw = raw.rstrip("\n")
+    # Trailing spaces don't count, unless escaped
+    stripped = raw.rstrip(" ")
+    if stripped.endswith("\\") and len(stripped) < len(raw):
+        stripped += " "
+    raw = stripped
+
+    # Blank lines and comments
+    if not raw or raw[0] == "#":
+        return None
+
+    negated = raw[0] == "!"
+    if negated:
+        raw = raw[1:]
+    elif raw[0] == "\\" and raw[1:2] in ("!", "#"):
+        raw = raw[1:]  # An escaped leading ! or #
+
+    pattern = raw
+    dir_only = raw.endswith("/") and not raw.endswith("\\/")
+    if dir_only:
+        raw = raw[:-1]
+    anchored = "/" in raw
+    raw = raw.lstrip("/") if anchored else raw
+    if not raw:
+        return None
+
+    regex = glob_translate(raw)
+    if not anchored:
+        regex = "(?:.*/)?" + regex
+    return IgnoreRule(pattern, negated, dir_only, regex, source, line_number)
+
+
+def gitignore_parse(lines: list[str], source="") -> list[IgnoreRule]:
+    ret = list()
+    for i, line in enumerate(lines):
+        rule = gitignore_parse1(line, source, i + 1)
+        if rule:
+            ret.append(rule)
+    return ret
+
+
+def rules_compile(rules: list[IgnoreRule], indexes: list[int]) -> re.Pattern | None:
+    """
+    One regex for the rules at indexes, the last one tried first. The name
+    of the group that matched says which rule it was.
+    """
+    if not indexes:
+        return None
+    return re.compile("|".join(f"(?P<r{i}>{rules[i].regex})" for i in reversed(indexes)))
+
+
+class IgnoreRuleSet:
+    """
+    The rules of one file, compiled
+    """
+
+    def __init__(self, rules: list[IgnoreRule]):
+        self.rules = rules
+        self.regexes = None  # (dirs, files), compiled on first use
+
+    def match(self, path: str, is_dir: bool) -> IgnoreRule | None:
+        if self.regexes is None:
+            rules = self.rules
+            self.regexes = (
+                rules_compile(rules, list(range(len(rules)))),
+                rules_compile(rules, [i for i, r in enumerate(rules) if not r.dir_only]),
+            )
+        regex = self.regexes[0] if is_dir else self.regexes[1]
+        if regex is None:
+            return None
+        match = regex.fullmatch(path)
+        if match is None:
+            return None
+        return self.rules[int(match.lastgroup[1:])]
+
+
+class GitIgnore:
+    absolute: list[IgnoreRuleSet] | None
+    scoped: dict[str, IgnoreRuleSet] | None
+
+    def __init__(self, absolute=None, scoped=None):
+        self.absolute = absolute if absolute is not None else list()
+        self.scoped = scoped if scoped is not None else dict()
+        self.dirs = dict()  # directory -> its deciding rule (or None)
+
+    def match_here(self, path: str, is_dir: bool) -> IgnoreRule | None:
+        """
+        The rule deciding for path itself, ignoring its parent directories
+        """
+        base = os.path.dirname(path)
+        while True:
+            ruleset = self.scoped.get(base)
+            if ruleset is not None:
+                rule = ruleset.match(path[len(base) + 1 :] if base else path, is_dir)
+                if rule is not None:
+                    return rule
+            if not base:
+                break
+            base = os.path.dirname(base)
+
+        for ruleset in self.absolute:
+            rule = ruleset.match(path, is_dir)
+            if rule is not None:
+                return rule
+        return None
+
+    def match(self, path: str, is_dir=False) -> IgnoreRule | None:
+        """
+        The rule deciding whether path is ignored, None if no rule matches.
+        A negated rule means "not ignored".
+        """
+        parent = os.path.dirname(path)
+        if parent:
+            rule = self.match_dir(parent)
+            if rule is not None and not rule.negated:
+                return rule  # Inside an ignored directory
+        if is_dir:
+            return self.match_dir(path)
+        return self.match_here(path, False)
+
+    def match_dir(self, path: str) -> IgnoreRule | None:
+        if path not in self.dirs:
+            parent = os.path.dirname(path)
+            rule = self.match_dir(parent) if parent else None
+            if rule is None or rule.negated:
+                rule = self.match_here(path, True)
+            self.dirs[path] = rule
+        return self.dirs[path]
+
+    def is_ignored(self, path: str, is_dir=False) -> bool:
+        rule = self.match(path, is_dir)
+        return rule is not None and not rule.negated
+
+
+def gitignore_global_file() -> str:
+    config_home = os.environ.get("XDG_CONFIG_HOME", os.path.expanduser("~/.config"))
+    return os.path.join(config_home, "git", "ignore")
+
+
+def gitignore_sources(repo: GitRepository, index: GitIndex) -> tuple[list, list]:
+    """
+    What the rules are built from: the exclude files that exist, as
+    [path, mtime_ns, size], and the .gitignore files as [path, sha]
+    """
+    files = list()
+    for path in (os.path.join(repo.gitdir, "info", "exclude"), gitignore_global_file()):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        files.append([path, st.st_mtime_ns, st.st_size])
+
+    blobs = list()
+    for entry in index.entries:
+        if entry.name == ".gitignore" or entry.name.endswith("/.gitignore"):
+            blobs.append([entry.name, entry.sha])
+    return files, blobs
+
+
+def ignore_cache_read(repo: GitRepository, key: list) -> GitIgnore | None:
+    path = repo_path(repo, *IGNORE_CACHE_FILE)
+    try:
+        with open(path, "r") as f:
+            cache = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if cache.get("version") != IGNORE_CACHE_VERSION or cache.get("key") != key:
+        return None
+
+    ret = GitIgnore()
+    for rules in cache["absolute"]:
+        ret.absolute.append(IgnoreRuleSet([IgnoreRule(*r) for r in rules]))
+    for dir_name, rules in cache["scoped"].items():
+        ret.scoped[dir_name] = IgnoreRuleSet([IgnoreRule(*r) for r in rules])
+    return ret
+
+
+def ignore_cache_write(repo: GitRepository, key: list, rules: GitIgnore):
+    """
+    Best effort: if someone else holds the lock, they're writing it already
+    """
+    path = repo_file(repo, *IGNORE_CACHE_FILE, mkdir=True)
+    cache = {
+        "version": IGNORE_CACHE_VERSION,
+        "key": key,
+        "absolute": [ruleset.rules for ruleset in rules.absolute],
+        "scoped": {dir_name: ruleset.rules for dir_name, ruleset in rules.scoped.items()},
+    }
+    try:
+        fd = lock_acquire(path, timeout=0)
+    except Exception:
+        return
+    try:
+        lock_commit(path, fd, json.dumps(cache).encode("utf8"))
+    except OSError:
+        lock_release(path, fd)  # Only a cache: not writing it is fine
+    except BaseException:
+        lock_release(path, fd)
+        raise
+
+
+@traced("gitignore_read")
+def gitignore_read(repo: GitRepository, index: GitIndex | None = None) -> GitIgnore:
+    if index is None:
+        index = index_read(repo)
+    files, blobs = gitignore_sources(repo, index)
+    key = [files, blobs]
+    cached = ignore_cache_read(repo, key)
+    if cached is not None:
+        return cached
+
+    ret = GitIgnore()
+    for path, _, _ in files:
+        # Named like git does: .git/info/exclude, but the global file in full
+        source = os.path.relpath(path, repo.worktree) if path.startswith(repo.gitdir) else path
+        with open(path, "r") as f:
+            ret.absolute.append(IgnoreRuleSet(gitignore_parse(f.readlines(), source)))
+
+    # .gitignore files in the index
+    for name, sha in blobs:
+        lines = object_read(repo, sha).blobdata.decode("utf8").splitlines()
+        ret.scoped[os.path.dirname(name)] = IgnoreRuleSet(gitignore_parse(lines, name))
+
+    ignore_cache_write(repo, key, ret)
+    return ret
+
+
+def check_ignore(rules: GitIgnore, path: str, is_dir=False) -> bool:
+    if os.path.isabs(path):
+        raise Exception("This function requires path to be relative to the repository's root")
+    return rules.is_ignored(path, is_dir)
+
+
+def ignore_walk(rules: GitIgnore, repo: GitRepository) -> Iterator[str]:
+    """
+    Every file of the worktree that isn't ignored, relative to its root.
+    Ignored directories (and .git) are pruned, never listed.
+    """
+    for root, dirs, files in os.walk(repo.worktree):
+        rel_root = os.path.relpath(root, repo.worktree)
+        rel_root = "" if rel_root == "." else rel_root
+
+        kept = list()
+        for d in dirs:
+            rel_path = f"{rel_root}/{d}" if rel_root else d
+            if os.path.islink(os.path.join(root, d)):
+                files.append(d)  # To git, a symlink is a file wherever it points
+            elif rel_path != GIT_DIR and not check_ignore(rules, rel_path, is_dir=True):
+                kept.append(d)
+        dirs[:] = kept
+
+        for f in files:
+            rel_path = f"{rel_root}/{f}" if rel_root else f
+            if not check_ignore(rules, rel_path):
+                yield rel_path
+
+
+# -------------------------------- IGNORE_END -------------------------------- #
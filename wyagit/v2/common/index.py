@@ -0,0 +1,371 @@
+import os
+import hashlib
+import struct
+
+from common.helper_classes import GitRepository, GitTree, GitTreeLeaf, object_write, repo_file
+from common.refs import lock_acquire, lock_commit, lock_release
+from common.trace import traced
+
+# -------------------------------- INDEX_START ------------------------------- #
+# The index (.git/index, aka the staging area) lists every tracked file
+# with the blob it was staged as and a copy of its stat() data, so most
+# "did this file change?" questions are answered without hashing it.
+#
+# [DIRC] [version] [entry count] [entries...] [extensions...] [sha-1 of all the above]
+#
+# Each entry is 62 bytes of fixed fields, then the path, NUL-padded so the
+# entry size is a multiple of 8. Version 3 entries with the "extended" flag
+# carry 2 more bytes of flags, among them skip-worktree (sparse checkout).
+#
+# A sparse index (the "sdir" extension) may also hold directory entries:
+# mode 040000, name ending in "/", pointing at a tree that is entirely
+# outside the sparse checkout. Nothing below it is listed.
+
+INDEX_SIGNATURE = b"DIRC"
+# ctime s/ns, mtime s/ns, dev, ino, mode, uid, gid, size, sha, flags
+INDEX_ENTRY = struct.Struct(">LLLLLLLLLL20sH")
+INDEX_EXTENDED_FLAGS = struct.Struct(">H")
+
+INDEX_FLAG_EXTENDED = 0x4000
+INDEX_EXT_SKIP_WORKTREE = 0x4000
+INDEX_EXT_INTENT_TO_ADD = 0x2000
+
+INDEX_SPARSE_DIR_EXTENSION = b"sdir"
+INDEX_MODE_TYPE_TREE = 0b0100
+
+
+class GitIndexEntry:
+    def __init__(
+        self,
+        ctime=None,
+        mtime=None,
+        dev=None,
+        ino=None,
+        mode_type=None,
+        mode_perms=None,
+        uid=None,
+        gid=None,
+        fsize=None,
+        sha=None,
+        flag_assume_valid=None,
+        flag_stage=None,
+        flag_skip_worktree=False,
+        flag_intent_to_add=False,
+        name=None,
+    ):
+        # The last time a file's metadata changed. (seconds, nanoseconds)
+        self.ctime = ctime
+        # The last time a file's data changed. (seconds, nanoseconds)
+        self.mtime = mtime
+        # The ID of device containing this file
+        self.dev = dev
+        # The file's inode number
+        self.ino = ino
+        # The object type, either b1000 (regular), b1010 (symlink),
+        # b1110 (gitlink).
+        self.mode_type = mode_type
+        # The object permissions, an integer.
+        self.mode_perms = mode_perms
+        # User ID of owner
+        self.uid = uid
+        # Group ID of owner
+        self.gid = gid
+        # Size of this object, in bytes
+        self.fsize = fsize
+        # The object's SHA
+        self.sha = sha
+        self.flag_assume_valid = flag_assume_valid
+        self.flag_stage = flag_stage
+        # Not materialized in the worktree (sparse checkout), don't look for it there
+        self.flag_skip_worktree = flag_skip_worktree
+        self.flag_intent_to_add = flag_intent_to_add
+        # Name of the object (full path this time!)
+        self.name = name
+
+    @property
+    def is_sparse_dir(self) -> bool:
+        return self.mode_type == INDEX_MODE_TYPE_TREE
+
+    def stat_matches(self, st: os.stat_result) -> bool:
+        """
+        Whether the file behind st still looks like what was staged
+        """
+        return (
+            st.st_mtime_ns == self.mtime[0] * 10**9 + self.mtime[1]
+            and st.st_ctime_ns == self.ctime[0] * 10**9 + self.ctime[1]
+            and st.st_size % 2**32 == self.fsize
+        )
+
+
+class GitIndex:
+    version: int | None = None
+    entries: list[GitIndexEntry] = []
+    sparse: bool = False  # May hold sparse directory entries
+
+    def __init__(self, version=2, entries=None, sparse=False):
+        if not entries:
+            entries = list()
+
+        self.version = version
+        self.entries = entries
+        self.sparse = sparse
+
+
+def index_entry_from_stat(name: str, sha: str, st: os.stat_result, mode: bytes) -> GitIndexEntry:
+    """
+    Build an entry for a file we just wrote (or hashed). mode is the tree
+    mode of the blob, e.g. b"100644"
+    """
+    mode = int(mode, 8)
+    return GitIndexEntry(
+        ctime=(int(st.st_ctime), st.st_ctime_ns % 10**9),
+        mtime=(int(st.st_mtime), st.st_mtime_ns % 10**9),
+        dev=st.st_dev % 2**32,
+        ino=st.st_ino % 2**32,
+        mode_type=mode >> 12,
+        mode_perms=mode & 0o777,
+        uid=st.st_uid,
+        gid=st.st_gid,
+        fsize=st.st_size % 2**32,
+        sha=sha,
+        flag_assume_valid=False,
+        flag_stage=0,
+        name=name,
+    )
+
+
+def index_entry_sparse_dir(path: str, sha: str) -> GitIndexEntry:
+    """
+    A sparse directory entry standing for the whole tree sha at path
+    """
+    return GitIndexEntry(
+        ctime=(0, 0), mtime=(0, 0), dev=0, ino=0,
+        mode_type=INDEX_MODE_TYPE_TREE, mode_perms=0,
+        uid=0, gid=0, fsize=0, sha=sha,
+        flag_assume_valid=False, flag_stage=0, flag_skip_worktree=True,
+        name=path.rstrip("/") + "/",
+    )
+
+
+def index_entry_mode(entry: GitIndexEntry) -> bytes:
+    """
+    The tree mode of an entry, e.g. b"100644"
+    """
+    return f"{entry.mode_type:02o}{entry.mode_perms:04o}".encode("ascii")
+
+
+@traced("index_read")
+def index_read(repo: GitRepository) -> GitIndex:
+    index_file = repo_file(repo, "index")
+
+    # New repositories have no index!
+    if not os.path.exists(index_file):
+        return GitIndex()
+
+    if repo.index_cache is not None:
+        st = os.stat(index_file)
+        key = (st.st_mtime_ns, st.st_size, st.st_ino)
+        cached = repo.index_cache.get(key)
+        if cached is None:
+            cached = index_parse(index_file)
+            repo.index_cache.clear()
+            repo.index_cache[key] = cached
+        # The caller may edit the entry list, not the cached one
+        return GitIndex(cached.version, list(cached.entries), cached.sparse)
+
+    return index_parse(index_file)
+
+
+def index_parse(index_file: str) -> GitIndex:
+    with open(index_file, "rb") as f:
+        raw = f.read()
+
+    header = raw[:12]
+    signature = header[:4]
+    assert signature == INDEX_SIGNATURE  # Stands for "DirCache"
+    version = int.from_bytes(header[4:8], "big")
+    assert version in (2, 3), "wyag only supports index file versions 2 and 3"
+    count = int.from_bytes(header[8:12], "big")
+
+    entries = list()
+    idx = 12
+    for _ in range(count):
+        (
+            ctime_s, ctime_ns, mtime_s, mtime_ns, dev, ino,
+            mode, uid, gid, fsize, raw_sha, flags,
+        ) = INDEX_ENTRY.unpack_from(raw, idx)
+
+        mode_type = mode >> 12
+        assert mode_type in [0b1000, 0b1010, 0b1110, INDEX_MODE_TYPE_TREE]
+
+        flag_assume_valid = (flags & 0b1000000000000000) != 0
+        flag_extended = (flags & INDEX_FLAG_EXTENDED) != 0
+        flag_stage = flags & 0b0011000000000000
+        # Name length is stored on 12 bits, 0xFFF means "at least 0xFFF,
+        # look for the NUL"
+        name_length = flags & 0b0000111111111111
+
+        idx += INDEX_ENTRY.size
+        extended_flags = 0
+        if flag_extended:
+            (extended_flags,) = INDEX_EXTENDED_FLAGS.unpack_from(raw, idx)
+            idx += INDEX_EXTENDED_FLAGS.size
+        if name_length < 0xFFF:
+            raw_name = raw[idx : idx + name_length]
+            idx += name_length + 1
+        else:
+            null_idx = raw.find(b"\x00", idx + 0xFFF)
+            raw_name = raw[idx:null_idx]
+            idx = null_idx + 1
+
+        # Entries are padded to a multiple of 8 bytes (counted from the
+        # start of the entries)
+        idx = 12 + 8 * -(-(idx - 12) // 8)
+
+        entries.append(
+            GitIndexEntry(
+                ctime=(ctime_s, ctime_ns),
+                mtime=(mtime_s, mtime_ns),
+                dev=dev,
+                ino=ino,
+                mode_type=mode_type,
+                mode_perms=mode & 0b0000000111111111,
+                uid=uid,
+                gid=gid,
+                fsize=fsize,
+                sha=raw_sha.hex(),
+                flag_assume_valid=flag_assume_valid,
+                flag_stage=flag_stage,
+                flag_skip_worktree=(extended_flags & INDEX_EXT_SKIP_WORKTREE) != 0,
+                flag_intent_to_add=(extended_flags & INDEX_EXT_INTENT_TO_ADD) != 0,
+                name=raw_name.decode("utf8"),
+            )
+        )
+
+    # Extensions: [signature] [size] [data], up to the trailing sha-1. We
+    # only care whether the index is sparse, the rest is dropped.
+    sparse = False
+    while idx + 8 <= len(raw) - 20:
+        signature = raw[idx : idx + 4]
+        size = int.from_bytes(raw[idx + 4 : idx + 8], "big")
+        sparse = sparse or signature == INDEX_SPARSE_DIR_EXTENSION
+        idx += 8 + size
+
+    return GitIndex(version=version, entries=entries, sparse=sparse)
+
+
+@traced("index_write")
+def index_write(repo: GitRepository, index: GitIndex):
+    """
+    Write the index back. Extensions (cached trees etc.) are dropped, git
+    rebuilds them when it needs them. Only sparse directory entries need
+    their "sdir" marker.
+    """
+    extended = any(e.flag_skip_worktree or e.flag_intent_to_add for e in index.entries)
+    sparse = any(e.is_sparse_dir for e in index.entries)
+    # Extended flags only exist from version 3 on
+    version = max(index.version, 3) if extended else index.version
+
+    out = bytearray()
+    out += INDEX_SIGNATURE
+    out += version.to_bytes(4, "big")
+    out += len(index.entries).to_bytes(4, "big")
+
+    for e in index.entries:
+        name_bytes = e.name.encode("utf8")
+        name_length = min(len(name_bytes), 0xFFF)
+        extended_flags = (INDEX_EXT_SKIP_WORKTREE if e.flag_skip_worktree else 0) | (
+            INDEX_EXT_INTENT_TO_ADD if e.flag_intent_to_add else 0
+        )
+        flags = (0x1 << 15 if e.flag_assume_valid else 0) | (e.flag_stage or 0) | name_length
+        if extended_flags:
+            flags |= INDEX_FLAG_EXTENDED
+
+        out += INDEX_ENTRY.pack(
+            e.ctime[0], e.ctime[1], e.mtime[0], e.mtime[1], e.dev, e.ino,
+            (e.mode_type << 12) | e.mode_perms,
+            e.uid, e.gid, e.fsize, bytes.fromhex(e.sha), flags,
+        )
+        entry_len = INDEX_ENTRY.size
+        if extended_flags:
+            out += INDEX_EXTENDED_FLAGS.pack(extended_flags)
+            entry_len += INDEX_EXTENDED_FLAGS.size
+        out += name_bytes
+        # At least one NUL, then pad to a multiple of 8
+        entry_len += len(name_bytes)
+        out += b"\x00" * (8 - entry_len % 8)
+
+    if sparse:
+        out += INDEX_SPARSE_DIR_EXTENSION + (0).to_bytes(4, "big")
+
+    out += hashlib.sha1(out).digest()
+
+    # Write through index.lock, a reader never sees a half-written index
+    path = repo_file(repo, "index")
+    fd = lock_acquire(path)
+    try:
+        lock_commit(path, fd, bytes(out))
+    except BaseException:
+        lock_release(path, fd)
+        raise
+
+
+class IndexTree:
+    """
+    One directory of the index, as the tree object it would be written as.
+    Shas are computed on demand and remembered: hashing a tree in memory
+    is much cheaper than reading one from disk.
+    """
+
+    def __init__(self):
+        self.children: dict[str, "IndexTree | GitIndexEntry"] = dict()
+        self._sha = None
+
+    def leaves(self, repo: GitRepository | None = None) -> list[GitTreeLeaf]:
+        """
+        The entries of this directory as tree leaves, in git's tree order.
+        Subdirectory leaves also carry their IndexTree as .node. With repo,
+        the subdirectories' trees are written on the way.
+        """
+        ret = list()
+        for name, child in self.children.items():
+            if isinstance(child, IndexTree):
+                leaf = GitTreeLeaf(b"040000", name, child.sha(repo))
+                leaf.node = child
+            elif child.is_sparse_dir:
+                leaf = GitTreeLeaf(b"040000", name, child.sha)
+            else:
+                leaf = GitTreeLeaf(index_entry_mode(child), name, child.sha)
+            ret.append(leaf)
+        ret.sort(key=lambda leaf: leaf.path + "/" if leaf.mode == b"040000" else leaf.path)
+        return ret
+
+    def sha(self, repo: GitRepository | None = None) -> str:
+        """
+        The sha of this directory's tree. With repo, the trees are written too.
+        """
+        if self._sha is None or repo is not None:
+            tree = GitTree()
+            tree.items = self.leaves(repo)
+            self._sha = object_write(tree, repo)
+        return self._sha
+
+
+def index_tree(index: GitIndex) -> IndexTree:
+    """
+    Nest the (flat, sorted) index entries into directories. Entries in a
+    conflicted state (stage > 0) can't be part of a tree and are left out.
+    """
+    root = IndexTree()
+    for e in index.entries:
+        if e.flag_stage:
+            continue
+        *dirs, name = e.name.rstrip("/").split("/")
+        node = root
+        for d in dirs:
+            node = node.children.setdefault(d, IndexTree())
+        node.children[name] = e
+    return root
+
+
+# --------------------------------- INDEX_END -------------------------------- #
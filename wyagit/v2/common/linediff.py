@@ -0,0 +1,295 @@
+from typing import Iterator, NamedTuple
+
+# ------------------------------ LINE_DIFF_START ----------------------------- #
+# Line diff, Myers' O(ND) algorithm in its linear space form: instead of
+# keeping every furthest-reaching path, find the "middle snake" of the edit
+# graph searching from both ends at once, then solve the two halves on each
+# side of it. Memory stays O(N + M) whatever the size of the edit.
+#
+# Lines are interned to ints first, so comparing two lines is comparing two
+# ints, and the common prefix and suffix of each sub-problem are trimmed
+# before searching (most real diffs are a few changes in a sea of equal lines).
+#
+# Equal runs come out in order, and hunks are built from them on the fly:
+# a hunk is handed out as soon as enough equal lines follow it.
+
+DIFF_CONTEXT = 3
+
+
+class EqualRun(NamedTuple):
+    a: int  # first line in a
+    b: int  # first line in b
+    length: int
+
+
+class Hunk(NamedTuple):
+    a_start: int
+    a_count: int
+    b_start: int
+    b_count: int
+    lines: list[tuple[str, bytes]]  # (" " | "-" | "+", line)
+
+    def header(self, function: bytes = b"") -> bytes:
+        ranges = f"@@ -{hunk_range(self.a_start, self.a_count)} +{hunk_range(self.b_start, self.b_count)} @@"
+        if function:
+            return ranges.encode("ascii") + b" " + function
+        return ranges.encode("ascii")
+
+
+def hunk_range(start: int, count: int) -> str:
+    """
+    1-based, ",1" left out; an empty range names the line before it
+    """
+    if count == 1:
+        return f"{start + 1}"
+    if count == 0:
+        return f"{start},0"
+    return f"{start + 1},{count}"
+
+
+def function_context(lines: list[bytes], before: int) -> bytes:
+    """
+    git's default "function name" shown after a hunk header: the closest line
+    above the hunk starting with a letter, "_" or "$", cut to 80 bytes
+    """
+    for i in range(before - 1, -1, -1):
+        line = lines[i]
+        if line[:1].isalpha() or line[:1] in (b"_", b"$"):
+            return line[:80].rstrip()
+    return b""
+
+
+def split_lines(data: bytes) -> list[bytes]:
+    """
+    Lines keep their "\n", except maybe the last one. Only "\n" ends a line.
+    """
+    lines = data.split(b"\n")
+    if lines[-1] == b"":
+        lines.pop()
+        return [line + b"\n" for line in lines]
+    return [line + b"\n" for line in lines[:-1]] + [lines[-1]]
+
+
+def lines_intern(a: list[bytes], b: list[bytes]) -> tuple[list[int], list[int]]:
+    ids = dict()
+    return (
+        [ids.setdefault(line, len(ids)) for line in a],
+        [ids.setdefault(line, len(ids)) for line in b],
+    )
+
+
+def middle_snake(a: list[int], alo: int, ahi: int, b: list[int], blo: int, bhi: int) -> tuple[int, int] | None:
+    """
+    A point (x, y) on an optimal edit path of a[alo:ahi] -> b[blo:bhi], to
+    split the problem at. None if the two have nothing in common.
+    """
+    n = ahi - alo
+    m = bhi - blo
+    max_d = (n + m + 1) // 2
+    offset = max_d
+    size = 2 * max_d + 2
+    # forward[k]: furthest x reached on diagonal k = x - y from the start,
+    # backward[k]: the same from the end (x counted backwards)
+    forward = [-1] * size
+    backward = [-1] * size
+    forward[offset + 1] = 0
+    backward[offset + 1] = 0
+    delta = n - m
+    # With an odd delta the paths can only meet on a forward step
+    odd = delta % 2 != 0
+
+    for d in range(max_d):
+        for k in range(-d, d + 1, 2):
+            i = offset + k
+            if k == -d or (k != d and forward[i - 1] < forward[i + 1]):
+                x = forward[i + 1]
+            else:
+                x = forward[i - 1] + 1
+            y = x - k
+            while x < n and y < m and a[alo + x] == b[blo + y]:
+                x += 1
+                y += 1
+            forward[i] = x
+            if odd and 0 <= offset + delta - k < size:
+                back_x = backward[offset + delta - k]
+                if back_x != -1 and x + back_x >= n:
+                    return alo + x, blo + y
+
+        for k in range(-d, d + 1, 2):
+            i = offset + k
+            if k == -d or (k != d and backward[i - 1] < backward[i + 1]):
+                x = backward[i + 1]
+            else:
+                x = backward[i - 1] + 1
+            y = x - k
+            while x < n and y < m and a[ahi - 1 - x] == b[bhi - 1 - y]:
+                x += 1
+                y += 1
+            backward[i] = x
+            if not odd and 0 <= offset + delta - k < size:
+                front_x = forward[offset + delta - k]
+                if front_x != -1 and front_x + x >= n:
+                    front_y = front_x - (delta - k)
+                    return alo + front_x, blo + front_y
+
+    return None
+
+
+def diff_equal_runs(a: list[int], b: list[int]) -> Iterator[EqualRun]:
+    """
+    The runs of lines a and b have in common, in order. Everything between
+    two runs is a change.
+    """
+    # Sub-problems to solve, or runs to hand out once what's before is done
+    stack: list = [(0, len(a), 0, len(b))]
+
+    while stack:
+        item = stack.pop()
+        if isinstance(item, EqualRun):
+            yield item
+            continue
+
+        alo, ahi, blo, bhi = item
+        prefix = 0
+        while alo + prefix < ahi and blo + prefix < bhi and a[alo + prefix] == b[blo + prefix]:
+            prefix += 1
+        if prefix:
+            yield EqualRun(alo, blo, prefix)
+            alo += prefix
+            blo += prefix
+
+        suffix = 0
+        while ahi - suffix > alo and bhi - suffix > blo and a[ahi - 1 - suffix] == b[bhi - 1 - suffix]:
+            suffix += 1
+        if suffix:
+            stack.append(EqualRun(ahi - suffix, bhi - suffix, suffix))
+            ahi -= suffix
+            bhi -= suffix
+
+        if alo == ahi or blo == bhi:
+            continue
+
+        split = middle_snake(a, alo, ahi, b, blo, bhi)
+        if split is None or split in ((alo, blo), (ahi, bhi)):
+            continue  # Nothing in common, one big change
+        x, y = split
+        stack.append((x, ahi, y, bhi))
+        stack.append((alo, x, blo, y))
+
+
+def diff_segments(a: list[int], b: list[int]) -> Iterator[tuple[str, int, int, int, int]]:
+    """
+    Alternating ("=", ...) and ("!", ...) segments (a_start, a_end, b_start,
+    b_end) covering both sequences, adjacent equal runs merged
+    """
+    pos_a = pos_b = 0
+    pending = None
+    for run in diff_equal_runs(a, b):
+        if pending and pending.a + pending.length == run.a and pending.b + pending.length == run.b:
+            pending = EqualRun(pending.a, pending.b, pending.length + run.length)
+            continue
+        if pending:
+            yield ("=", pending.a, pending.a + pending.length, pending.b, pending.b + pending.length)
+            pos_a, pos_b = pending.a + pending.length, pending.b + pending.length
+        if pos_a < run.a or pos_b < run.b:
+            yield ("!", pos_a, run.a, pos_b, run.b)
+        pending = run
+
+    if pending:
+        yield ("=", pending.a, pending.a + pending.length, pending.b, pending.b + pending.length)
+        pos_a, pos_b = pending.a + pending.length, pending.b + pending.length
+    if pos_a < len(a) or pos_b < len(b):
+        yield ("!", pos_a, len(a), pos_b, len(b))
+
+
+def diff_slide(segments, a: list[int], b: list[int]) -> Iterator[tuple[str, int, int, int, int]]:
+    """
+    Slide pure insertions and deletions down as far as the equal lines after
+    them allow, as git does: a block added between two identical lines
+    shows up as the later copy, not the earlier one. A change sliding all
+    the way through the equal lines joins the change after them.
+    """
+    before = None  # Equal segment held back: the change may still grow it
+    change = None
+    for segment in segments:
+        if segment[0] == "!":
+            if change is not None:
+                # Slid up against this one: they're a single change
+                segment = ("!", change[1], segment[2], change[3], segment[4])
+            change = segment
+            continue
+        if change is not None:
+            _, a0, a1, b0, b1 = change
+            _, e_a0, e_a1, e_b0, e_b1 = segment
+            shift = 0
+            if a0 == a1:
+                while e_b0 + shift < e_b1 and b[b0 + shift] == b[e_b0 + shift]:
+                    shift += 1
+            elif b0 == b1:
+                while e_a0 + shift < e_a1 and a[a0 + shift] == a[e_a0 + shift]:
+                    shift += 1
+            if shift:
+                if before is None:
+                    before = ("=", a0, a0, b0, b0)
+                before = ("=", before[1], before[2] + shift, before[3], before[4] + shift)
+                change = ("!", a0 + shift, a1 + shift, b0 + shift, b1 + shift)
+                segment = ("=", e_a0 + shift, e_a1, e_b0 + shift, e_b1)
+            if segment[1] == segment[2]:
+                continue  # Nothing equal left: wait for the next change
+            if before is not None and before[1] < before[2]:
+                yield before
+            yield change
+            change = None
+            before = segment
+        else:
+            if before is not None:
+                yield before
+            before = segment
+
+    if before is not None and before[1] < before[2]:
+        yield before
+    if change is not None:
+        yield change
+
+
+def diff_hunks(old: list[bytes], new: list[bytes], context=DIFF_CONTEXT) -> Iterator[Hunk]:
+    """
+    Unified diff hunks turning old into new, yielded as soon as each is complete
+    """
+    a, b = lines_intern(old, new)
+    hunk = None
+    equal = None  # The equal segment since the last change
+
+    def close(hunk, trailing):
+        a_start, b_start, lines = hunk
+        if trailing:
+            _, a0, a1, _, _ = trailing
+            lines += [(" ", line) for line in old[a0 : min(a1, a0 + context)]]
+        a_count = sum(1 for op, _ in lines if op != "+")
+        b_count = sum(1 for op, _ in lines if op != "-")
+        return Hunk(a_start, a_count, b_start, b_count, lines)
+
+    for segment in diff_slide(diff_segments(a, b), a, b):
+        op, a0, a1, b0, b1 = segment
+        if op == "=":
+            equal = segment
+            if hunk is not None and a1 - a0 > 2 * context:
+                yield close(hunk, equal)
+                hunk = None
+            continue
+
+        if hunk is None:
+            # Leading context: the end of the equal run before this change
+            lead = min(context, equal[2] - equal[1]) if equal else 0
+            hunk = (a0 - lead, b0 - lead, [(" ", line) for line in old[a0 - lead : a0]])
+        elif equal:
+            hunk[2].extend((" ", line) for line in old[equal[1] : equal[2]])
+        hunk[2].extend(("-", line) for line in old[a0:a1])
+        hunk[2].extend(("+", line) for line in new[b0:b1])
+        equal = None
+
+    if hunk is not None:
+        yield close(hunk, equal)
+
+
+# ------------------------------- LINE_DIFF_END ------------------------------ #
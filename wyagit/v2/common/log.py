@@ -0,0 +1,16 @@
+# ---------------------------------- LOG_START --------------------------------- #
+# loguru takes longer to import than most commands take to run, and it's
+# only needed when something goes wrong. logger stands in for it and
+# imports it on first use.
+
+
+class LazyLogger:
+    def __getattr__(self, name):
+        from loguru import logger
+
+        return getattr(logger, name)
+
+
+logger = LazyLogger()
+
+# ----------------------------------- LOG_END ---------------------------------- #
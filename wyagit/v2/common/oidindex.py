@@ -0,0 +1,135 @@
+import os
+import bisect
+import re
+
+from common.pack import PackIndex, pack_indexes
+
+# ------------------------------ OID_INDEX_START ----------------------------- #
+# Resolving "ce01" or printing "ce01362" for a full SHA both come down to
+# looking at the SHAs sorting next to it. Loose objects are listed one
+# fanout directory (objects/xx) at a time, only when a lookup needs it, and
+# kept sorted; packed objects are already sorted in their .idx files.
+
+# Git's default when core.abbrev isn't set
+DEFAULT_ABBREV = 7
+MIN_ABBREV = 4
+
+LOOSE_NAME_RE = re.compile(r"^[0-9a-f]{38}$")
+
+
+def common_prefix_len(a: str, b: str) -> int:
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+class OidIndex:
+    """
+    Sorted view of every object id in the repo, loose and packed.
+
+    Each listing is cached along with the mtime of the directory it came
+    from, so a long-lived process picks up objects written by others.
+    """
+
+    def __init__(self, objects_dir: str):
+        self.objects_dir = objects_dir
+        self._loose: dict[str, tuple[int, list[str]]] = dict()
+        self._packs: tuple[int, list[PackIndex]] | None = None
+
+    def loose(self, fanout: str) -> list[str]:
+        """
+        Sorted full shas of the loose objects stored in objects/<fanout>
+        """
+        path = os.path.join(self.objects_dir, fanout)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return list()
+
+        cached = self._loose.get(fanout)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        shas = sorted(fanout + name for name in os.listdir(path) if LOOSE_NAME_RE.match(name))
+        self._loose[fanout] = (mtime, shas)
+        return shas
+
+    def packs(self) -> list[PackIndex]:
+        path = os.path.join(self.objects_dir, "pack")
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return list()
+
+        if self._packs is None or self._packs[0] != mtime:
+            self._packs = (mtime, pack_indexes(self.objects_dir))
+        return self._packs[1]
+
+    def add(self, sha: str):
+        """
+        Record a freshly written loose object without relisting its directory
+        """
+        cached = self._loose.get(sha[0:2])
+        if cached is None:
+            return
+        shas = cached[1]
+        i = bisect.bisect_left(shas, sha)
+        if i == len(shas) or shas[i] != sha:
+            shas.insert(i, sha)
+        # Writing the object bumped the directory mtime, refresh ours
+        try:
+            mtime = os.stat(os.path.join(self.objects_dir, sha[0:2])).st_mtime_ns
+        except FileNotFoundError:
+            return
+        self._loose[sha[0:2]] = (mtime, shas)
+
+    def resolve(self, prefix: str) -> list[str]:
+        """
+        Every object id starting with prefix (at least 2 hex chars, lowercase)
+        """
+        found = set()
+
+        shas = self.loose(prefix[0:2])
+        i = bisect.bisect_left(shas, prefix)
+        while i < len(shas) and shas[i].startswith(prefix):
+            found.add(shas[i])
+            i += 1
+
+        for pack in self.packs():
+            found.update(pack.with_prefix(prefix))
+
+        return sorted(found)
+
+    def contains(self, sha: str) -> bool:
+        shas = self.loose(sha[0:2])
+        i = bisect.bisect_left(shas, sha)
+        if i < len(shas) and shas[i] == sha:
+            return True
+        return any(pack.find(sha) is not None for pack in self.packs())
+
+    def abbrev(self, sha: str, min_len=DEFAULT_ABBREV) -> str:
+        """
+        Shortest prefix of sha, at least min_len long, that no other object shares
+        """
+        longest = 0
+
+        shas = self.loose(sha[0:2])
+        i = bisect.bisect_left(shas, sha)
+        if i > 0:
+            longest = max(longest, common_prefix_len(sha, shas[i - 1]))
+        if i < len(shas) and shas[i] == sha:
+            i += 1
+        if i < len(shas):
+            longest = max(longest, common_prefix_len(sha, shas[i]))
+
+        for pack in self.packs():
+            for other in pack.neighbours(sha):
+                longest = max(longest, common_prefix_len(sha, other))
+
+        return sha[0 : max(min_len, MIN_ABBREV, longest + 1)]
+
+
+# ------------------------------- OID_INDEX_END ------------------------------ #
@@ -0,0 +1,458 @@
+import hashlib
+import os
+import zlib
+
+from typing import BinaryIO, Iterator
+
+from common.compression import COMPRESSION_PACK_DEFAULT, deflate
+
+# ------------------------------ PACK_IDX_START ------------------------------ #
+# A pack index (.idx) sits next to every .pack under .git/objects/pack and
+# lists the pack's objects sorted by SHA. Version 2 layout:
+#
+#   [magic \377tOc] [version 2]
+#   [fanout: 256 x u32]  fanout[b] = number of objects whose first byte <= b
+#   [sha-1: N x 20 bytes, sorted]
+#   [crc32: N x u32] [offset: N x u32] [large offsets: M x u64]
+#   [pack checksum] [idx checksum]
+#
+# Version 1 has no magic, then the fanout, then N x ([offset: u32] [sha-1]).
+
+PACK_IDX_MAGIC = b"\377tOc"
+
+
+class PackIndex:
+    """
+    Read-only view over a .idx file. SHA lookups are binary searches over
+    the raw table, nothing is decoded up front.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self.data = f.read()
+
+        if self.data[:4] == PACK_IDX_MAGIC:
+            self.version = int.from_bytes(self.data[4:8], "big")
+            if self.version != 2:
+                raise Exception(f"Unsupported pack index version {self.version}: {path}")
+            fanout_start = 8
+        else:
+            self.version = 1
+            fanout_start = 0
+
+        self.fanout = [
+            int.from_bytes(self.data[fanout_start + 4 * i : fanout_start + 4 * i + 4], "big")
+            for i in range(256)
+        ]
+        self.count = self.fanout[255]
+
+        if self.version == 2:
+            self.sha_start = fanout_start + 256 * 4
+            self.sha_stride = 20
+        else:
+            # v1 entries are [offset] [sha], so the sha sits 4 bytes in
+            self.sha_start = fanout_start + 256 * 4 + 4
+            self.sha_stride = 24
+
+    def raw_sha(self, i: int) -> bytes:
+        pos = self.sha_start + i * self.sha_stride
+        return self.data[pos : pos + 20]
+
+    def sha(self, i: int) -> str:
+        return self.raw_sha(i).hex()
+
+    def offset(self, i: int) -> int:
+        if self.version == 1:
+            pos = self.sha_start - 4 + i * self.sha_stride
+            return int.from_bytes(self.data[pos : pos + 4], "big")
+
+        offsets_start = self.sha_start + self.count * 20 + self.count * 4
+        offset = int.from_bytes(self.data[offsets_start + i * 4 : offsets_start + i * 4 + 4], "big")
+        if offset & 0x80000000:
+            # MSB set: the rest indexes the 8-byte large offsets table
+            large_start = offsets_start + self.count * 4
+            j = offset & 0x7FFFFFFF
+            offset = int.from_bytes(self.data[large_start + j * 8 : large_start + j * 8 + 8], "big")
+        return offset
+
+    def bisect(self, raw: bytes) -> int:
+        """
+        Position of the first sha >= raw (raw may be shorter than 20 bytes)
+        """
+        first = raw[0] if raw else 0
+        lo = self.fanout[first - 1] if first > 0 else 0
+        hi = self.fanout[first] if raw else self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.raw_sha(mid) < raw:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find(self, sha: str) -> int | None:
+        """
+        Position of sha in the index, or None
+        """
+        raw = bytes.fromhex(sha)
+        i = self.bisect(raw)
+        if i < self.count and self.raw_sha(i) == raw:
+            return i
+        return None
+
+    def with_prefix(self, prefix: str) -> Iterator[str]:
+        """
+        Every sha starting with the (lowercase hex) prefix
+        """
+        # An odd prefix like "abc" starts at 0xab 0xc0
+        i = self.bisect(bytes.fromhex(prefix.ljust(len(prefix) + len(prefix) % 2, "0")))
+        while i < self.count:
+            sha = self.sha(i)
+            if not sha.startswith(prefix):
+                break
+            yield sha
+            i += 1
+
+    def neighbours(self, sha: str) -> list[str]:
+        """
+        The shas sorting right before and right after sha (sha itself excluded)
+        """
+        raw = bytes.fromhex(sha)
+        i = self.bisect(raw)
+        ret = list()
+        if i > 0:
+            ret.append(self.sha(i - 1))
+        if i < self.count and self.raw_sha(i) == raw:
+            i += 1
+        if i < self.count:
+            ret.append(self.sha(i))
+        return ret
+
+
+def pack_indexes(objects_dir: str) -> list[PackIndex]:
+    pack_dir = os.path.join(objects_dir, "pack")
+    if not os.path.isdir(pack_dir):
+        return list()
+    return [
+        PackIndex(os.path.join(pack_dir, name))
+        for name in sorted(os.listdir(pack_dir))
+        if name.endswith(".idx")
+    ]
+
+
+# ------------------------------- PACK_IDX_END ------------------------------- #
+
+
+# -------------------------------- PACK_START -------------------------------- #
+# A pack (.pack) is every object of the pack one after the other:
+#
+#   [PACK] [version 2] [number of objects: u32]
+#   N x ([type and size] [zlib deflated content])
+#   [sha-1 of everything above]
+#
+# The type and size header is a varint: the first byte holds a "more"
+# bit, the type on 3 bits and the low 4 bits of the size, every following
+# byte a "more" bit and 7 more bits of the size. Types 6 and 7 are deltas
+# against another object, only written by git (gc, repack, fetch):
+# OFS_DELTA is followed by the distance back to its base in the same pack,
+# REF_DELTA by the sha of its base, then both by the deflated delta.
+
+PACK_MAGIC = b"PACK"
+PACK_TYPES = {b"commit": 1, b"tree": 2, b"blob": 3, b"tag": 4}
+PACK_TYPE_NAMES = {num: fmt for fmt, num in PACK_TYPES.items()}
+PACK_OFS_DELTA = 6
+PACK_REF_DELTA = 7
+
+
+def pack_entry_header(fmt: bytes, size: int) -> bytes:
+    byte = PACK_TYPES[fmt] << 4 | size & 0x0F
+    size >>= 4
+    out = bytearray()
+    while size:
+        out.append(byte | 0x80)
+        byte = size & 0x7F
+        size >>= 7
+    out.append(byte)
+    return bytes(out)
+
+
+def pack_entry_header_read(f: BinaryIO, offset: int) -> tuple[int, int]:
+    """
+    (type, size) of the entry at offset, leaving f right after the header
+    """
+    f.seek(offset)
+    byte = f.read(1)[0]
+    type_num = byte >> 4 & 0x07
+    size = byte & 0x0F
+    shift = 4
+    while byte & 0x80:
+        byte = f.read(1)[0]
+        size |= (byte & 0x7F) << shift
+        shift += 7
+    return type_num, size
+
+
+def pack_ofs_read(f: BinaryIO) -> int:
+    """
+    Distance back to the base of an OFS_DELTA, right after its header
+    """
+    byte = f.read(1)[0]
+    distance = byte & 0x7F
+    while byte & 0x80:
+        byte = f.read(1)[0]
+        distance = (distance + 1) << 7 | byte & 0x7F
+    return distance
+
+
+def pack_inflate(f: BinaryIO, size: int, path: str, offset: int) -> bytes:
+    decompressor = zlib.decompressobj()
+    data = bytearray()
+    while not decompressor.eof:
+        chunk = f.read(65536)
+        if not chunk:
+            raise Exception(f"Truncated pack entry at {offset} in {path}")
+        data += decompressor.decompress(chunk)
+    if len(data) != size:
+        raise Exception(f"Malformed pack entry at {offset} in {path}")
+    return bytes(data)
+
+
+def delta_varint(delta: bytes, pos: int) -> tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = delta[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, pos
+
+
+def delta_apply(base: bytes, delta: bytes) -> bytes:
+    """
+    Rebuild an object from its base and a delta: the base and result
+    sizes as varints, then opcodes. An opcode with the high bit set copies
+    from the base, its low 4 bits say which offset bytes follow and the
+    next 3 which size bytes (a size of 0 means 0x10000); any other nonzero
+    opcode inserts that many bytes from the delta itself.
+    """
+    base_size, pos = delta_varint(delta, 0)
+    size, pos = delta_varint(delta, pos)
+    if base_size != len(base):
+        raise Exception("Delta base size mismatch")
+    out = bytearray()
+    while pos < len(delta):
+        op = delta[pos]
+        pos += 1
+        if op & 0x80:
+            copy_offset = copy_size = 0
+            for i in range(4):
+                if op & 1 << i:
+                    copy_offset |= delta[pos] << 8 * i
+                    pos += 1
+            for i in range(3):
+                if op & 0x10 << i:
+                    copy_size |= delta[pos] << 8 * i
+                    pos += 1
+            copy_size = copy_size or 0x10000
+            if copy_offset + copy_size > base_size:
+                raise Exception("Delta copies past the end of its base")
+            out += base[copy_offset : copy_offset + copy_size]
+        elif op:
+            out += delta[pos : pos + op]
+            pos += op
+        else:
+            raise Exception("Reserved delta opcode 0")
+    if len(out) != size:
+        raise Exception("Delta result size mismatch")
+    return bytes(out)
+
+
+def pack_entry_read(path: str, offset: int, base_read=None) -> tuple[bytes, bytes]:
+    """
+    (fmt, content) of the object at offset in the pack at path. Deltas are
+    followed down to their base, OFS_DELTA bases in this pack, REF_DELTA
+    bases through base_read(sha) -> (fmt, content) | None.
+    """
+    deltas = list()
+    with open(path, "rb") as f:
+        while True:
+            type_num, size = pack_entry_header_read(f, offset)
+            if type_num == PACK_OFS_DELTA:
+                base_offset = offset - pack_ofs_read(f)
+                deltas.append(pack_inflate(f, size, path, offset))
+                offset = base_offset
+            elif type_num == PACK_REF_DELTA:
+                base_sha = f.read(20).hex()
+                deltas.append(pack_inflate(f, size, path, offset))
+                found = base_read(base_sha) if base_read is not None else None
+                if found is None:
+                    raise Exception(f"Missing delta base {base_sha} for entry at {offset} in {path}")
+                fmt, data = found
+                break
+            elif type_num in PACK_TYPE_NAMES:
+                fmt, data = PACK_TYPE_NAMES[type_num], pack_inflate(f, size, path, offset)
+                break
+            else:
+                raise Exception(f"Unsupported pack entry type {type_num} at {offset} in {path}")
+    for delta in reversed(deltas):
+        data = delta_apply(data, delta)
+    return fmt, data
+
+
+def pack_entry_size(path: str, offset: int) -> int:
+    """
+    Content size of the object at offset, without inflating it: from the
+    entry header, or for a delta from the head of the delta
+    """
+    with open(path, "rb") as f:
+        type_num, size = pack_entry_header_read(f, offset)
+        if type_num in PACK_TYPE_NAMES:
+            return size
+        if type_num == PACK_OFS_DELTA:
+            pack_ofs_read(f)
+        elif type_num == PACK_REF_DELTA:
+            f.read(20)
+        else:
+            raise Exception(f"Unsupported pack entry type {type_num} at {offset} in {path}")
+        # Two varints of at most 10 bytes each
+        decompressor = zlib.decompressobj()
+        head = b""
+        while len(head) < 20 and not decompressor.eof:
+            chunk = decompressor.unconsumed_tail or f.read(64)
+            if not chunk:
+                raise Exception(f"Truncated pack entry at {offset} in {path}")
+            head += decompressor.decompress(chunk, 20 - len(head))
+    _, pos = delta_varint(head, 0)
+    return delta_varint(head, pos)[0]
+
+
+def pack_object_read(packs: list[PackIndex], sha: str, loose_read=None) -> tuple[bytes, bytes] | None:
+    """
+    (fmt, content) of sha from the first pack holding it, or None.
+    loose_read(sha) finds REF_DELTA bases outside of the packs.
+    """
+
+    def base_read(base_sha):
+        return pack_object_read(packs, base_sha, loose_read) or (
+            loose_read(base_sha) if loose_read is not None else None
+        )
+
+    for pack in packs:
+        i = pack.find(sha)
+        if i is not None:
+            return pack_entry_read(pack.path[: -len(".idx")] + ".pack", pack.offset(i), base_read)
+    return None
+
+
+def pack_object_size(packs: list[PackIndex], sha: str) -> int | None:
+    """
+    Content size of sha from the first pack holding it, or None
+    """
+    for pack in packs:
+        i = pack.find(sha)
+        if i is not None:
+            return pack_entry_size(pack.path[: -len(".idx")] + ".pack", pack.offset(i))
+    return None
+
+
+def pack_index_write(f: BinaryIO, entries: list[tuple[bytes, int, int]], pack_sha: bytes):
+    """
+    Write the v2 index of a pack whose entries are (raw sha, crc32, offset)
+    """
+    entries = sorted(entries)
+    out = bytearray(PACK_IDX_MAGIC + (2).to_bytes(4, "big"))
+    counts = [0] * 256
+    for raw, _, _ in entries:
+        counts[raw[0]] += 1
+    total = 0
+    for count in counts:
+        total += count
+        out += total.to_bytes(4, "big")
+    for raw, _, _ in entries:
+        out += raw
+    for _, crc, _ in entries:
+        out += crc.to_bytes(4, "big")
+    large = bytearray()
+    for _, _, offset in entries:
+        if offset < 0x80000000:
+            out += offset.to_bytes(4, "big")
+        else:
+            out += (0x80000000 | len(large) // 8).to_bytes(4, "big")
+            large += offset.to_bytes(8, "big")
+    out += large
+    out += pack_sha
+    out += hashlib.sha1(out).digest()
+    f.write(out)
+
+
+class PackWriter:
+    """
+    Streams objects into a new pack under objects/pack. Nothing is visible
+    until finish(): the pack and its index are written as temporary files,
+    synced, then renamed to pack-<sha>.pack and pack-<sha>.idx (the index
+    last, readers only look for packs through their index).
+    """
+
+    def __init__(self, objects_dir: str, level=COMPRESSION_PACK_DEFAULT):
+        self.level = level
+        self.dir = os.path.join(objects_dir, "pack")
+        os.makedirs(self.dir, exist_ok=True)
+        self.tmp_path = os.path.join(self.dir, f"tmp_pack_{os.getpid()}_{id(self):x}")
+        self.f = open(self.tmp_path, "w+b")
+        self.f.write(PACK_MAGIC + (2).to_bytes(4, "big") + (0).to_bytes(4, "big"))
+        self.entries: list[tuple[bytes, int, int]] = list()
+        self.offsets: dict[str, int] = dict()  # sha -> offset, to read back
+
+    def add(self, sha: str, fmt: bytes, data: bytes):
+        offset = self.f.tell()
+        entry = pack_entry_header(fmt, len(data)) + deflate(self.level, data)
+        self.f.write(entry)
+        self.entries.append((bytes.fromhex(sha), zlib.crc32(entry), offset))
+        self.offsets[sha] = offset
+
+    def read(self, sha: str) -> tuple[bytes, bytes] | None:
+        offset = self.offsets.get(sha)
+        if offset is None:
+            return None
+        self.f.flush()
+        return pack_entry_read(self.tmp_path, offset)
+
+    def finish(self) -> str | None:
+        """
+        Sync and install the pack. Returns its name (pack-<sha>), or None
+        when nothing was added
+        """
+        if not self.entries:
+            self.abort()
+            return None
+
+        self.f.seek(8)
+        self.f.write(len(self.entries).to_bytes(4, "big"))
+        self.f.seek(0)
+        hasher = hashlib.sha1()
+        while chunk := self.f.read(65536):
+            hasher.update(chunk)
+        pack_sha = hasher.digest()
+        self.f.write(pack_sha)
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.f.close()
+
+        name = f"pack-{pack_sha.hex()}"
+        idx_tmp_path = self.tmp_path + ".idx"
+        with open(idx_tmp_path, "wb") as f:
+            pack_index_write(f, self.entries, pack_sha)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.tmp_path, os.path.join(self.dir, name + ".pack"))
+        os.replace(idx_tmp_path, os.path.join(self.dir, name + ".idx"))
+        return name
+
+    def abort(self):
+        self.f.close()
+        os.unlink(self.tmp_path)
+
+
+# --------------------------------- PACK_END --------------------------------- #
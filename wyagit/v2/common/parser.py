@@ -1,6 +1,53 @@
 import argparse
+import importlib
 
 main_parsers = argparse.ArgumentParser(description="The stupidest content tracker")
 sub_parsers = main_parsers.add_subparsers(
     title="Commands", dest="command", required=True
-)
\ No newline at end of file
+)
+
+# command -> (module, function). A command module registers its parser
+# when it's imported, so only the one being run is: imports are most of
+# the startup time, and scripts run wyag thousands of times.
+COMMANDS = {
+    "blame"           : ("command.blame", "cmd_blame"),
+    "cat-file"        : ("command.catfile", "cmd_cat_file"),
+    "check-ignore"    : ("command.checkignore", "cmd_check_ignore"),
+    "checkout"        : ("command.checkout", "cmd_checkout"),
+    "daemon"          : ("command.daemon", "cmd_daemon"),
+    "diff"            : ("command.diff", "cmd_diff"),
+    "grep"            : ("command.grep", "cmd_grep"),
+    "hash-object"     : ("command.hashobject", "cmd_hash_object"),
+    "init"            : ("command.init", "cmd_init"),
+    "log"             : ("command.log", "cmd_log"),
+    "ls-tree"         : ("command.lstree", "cmd_ls_tree"),
+    "pack-refs"       : ("command.packrefs", "cmd_pack_refs"),
+    "rev-parse"       : ("command.revparse", "cmd_rev_parse"),
+    "show-ref"        : ("command.showref", "cmd_show_ref"),
+    "sparse-checkout" : ("command.sparsecheckout", "cmd_sparse_checkout"),
+    "status"          : ("command.status", "cmd_status"),
+    "tag"             : ("command.tag", "cmd_tag"),
+    "update-ref"      : ("command.updateref", "cmd_update_ref"),
+    "write-tree"      : ("command.writetree", "cmd_write_tree"),
+}
+
+
+def command_load(name: str):
+    module, fn = COMMANDS[name]
+    return getattr(importlib.import_module(module), fn)
+
+
+def command_parse(argv: list[str]):
+    """
+    Parse argv, loading only the parser of the command it names. Anything
+    but a known command (--help, a typo...) gets the full parser.
+    Returns (the command's function, args).
+    """
+    if argv and argv[0] in COMMANDS:
+        command_load(argv[0])
+    else:
+        for name in COMMANDS:
+            command_load(name)
+
+    args = main_parsers.parse_args(argv)
+    return command_load(args.command), args
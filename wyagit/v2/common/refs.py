@@ -0,0 +1,596 @@
+import os
+import bisect
+import heapq
+import struct
+import time
+
+from typing import Iterator
+
+# ---------------------------- REF_BACKENDS_START ---------------------------- #
+# A ref value is either a hex SHA ("c84e27...") or a symbolic ref
+# ("ref: refs/heads/master"). None is used for "deleted".
+#
+# Only names starting with refs/ live in the backend. Pseudo refs such as
+# HEAD always stay as plain files in the gitdir, whatever the backend.
+
+LOCK_SUFFIX = ".lock"
+LOCK_TIMEOUT = 1.0  # seconds we keep retrying a held lock before giving up
+
+REFTABLE_DIR = "reftable"
+REFTABLE_LIST = "tables.list"
+REFTABLE_MAGIC = b"WREF"
+REFTABLE_VERSION = 1
+REFTABLE_BLOCK_SIZE = 4096
+
+# header: [magic] [version] [block size]
+REFTABLE_HEADER = struct.Struct(">4sBI")
+# footer: [index offset] [block count] [min update index] [max update index] [magic]
+REFTABLE_FOOTER = struct.Struct(">QIQQ4s")
+# index entry: [block offset] [block length] [first key length], followed by the key
+REFTABLE_INDEX_ENTRY = struct.Struct(">QIH")
+
+VALUE_DELETION = 0
+VALUE_OID = 1
+VALUE_SYMREF = 2
+
+_MISSING = object()
+
+
+def lock_acquire(path: str, timeout=LOCK_TIMEOUT) -> int:
+    """
+    Take `<path>.lock` the same way git does: O_CREAT | O_EXCL is atomic, so
+    whoever manages to create the lock file owns it. Returns the open fd.
+    """
+    deadline = time.monotonic() + timeout
+    delay = 0.001
+    while True:
+        try:
+            return os.open(path + LOCK_SUFFIX, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        except FileExistsError:
+            if time.monotonic() >= deadline:
+                raise Exception(f"Unable to lock {path}: {path}{LOCK_SUFFIX} exists")
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05)
+
+
+def lock_release(path: str, fd: int):
+    try:
+        os.close(fd)
+    except OSError:
+        pass  # lock_commit got as far as closing it
+    try:
+        os.unlink(path + LOCK_SUFFIX)
+    except FileNotFoundError:
+        pass
+
+
+def lock_commit(path: str, fd: int, data: bytes):
+    """
+    Write data into an acquired lock file, flush it to disk and rename it
+    over path. Readers either see the old file or the new one, never half of it.
+    """
+    os.write(fd, data)
+    os.fsync(fd)
+    os.close(fd)
+    os.replace(path + LOCK_SUFFIX, path)
+
+
+class RefTransaction:
+    """
+    A batch of ref updates applied all at once (or not at all).
+
+    with ref_backend(repo).transaction() as tx:
+        tx.update("refs/heads/ci/1234", sha)
+        tx.delete("refs/heads/ci/1233")
+
+    `old` makes an update conditional: it is only applied if the ref still
+    holds that value (use None for "must not exist").
+    """
+
+    def __init__(self, backend: "RefBackend"):
+        self.backend = backend
+        self.updates: dict[str, str | None] = dict()
+        self.expected: dict[str, str | None] = dict()
+
+    def update(self, name: str, value: str, old=_MISSING):
+        self.updates[name] = value
+        if old is not _MISSING:
+            self.expected[name] = old
+
+    def delete(self, name: str, old=_MISSING):
+        self.updates[name] = None
+        if old is not _MISSING:
+            self.expected[name] = old
+
+    def commit(self):
+        if self.updates:
+            self.backend.commit(self.updates, self.expected)
+        self.updates = dict()
+        self.expected = dict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+
+
+class RefBackend:
+    """
+    Generic class every ref storage MUST implement.
+    """
+
+    def __init__(self, gitdir: str):
+        self.gitdir = gitdir
+
+    def read(self, name: str) -> str | None:
+        """
+        Return the raw value of a single ref (no symref following), or None
+        """
+        if not name.startswith("refs/"):
+            return read_ref_file(os.path.join(self.gitdir, name))
+        return self.read_ref(name)
+
+    def read_ref(self, name: str) -> str | None:
+        raise Exception("Unimplemented!")
+
+    def iter_refs(self, prefix="refs/") -> Iterator[tuple[str, str]]:
+        """
+        Yield (name, raw value) for every ref starting with prefix, sorted by name
+        """
+        raise Exception("Unimplemented!")
+
+    def commit(self, updates: dict[str, str | None], expected: dict[str, str | None]):
+        raise Exception("Unimplemented!")
+
+    def compact(self):
+        """
+        Fold everything into the most compact representation the backend has
+        """
+        raise Exception("Unimplemented!")
+
+    def transaction(self) -> RefTransaction:
+        return RefTransaction(self)
+
+    def check_expected(self, expected: dict[str, str | None]):
+        for name, old in expected.items():
+            current = self.read_ref(name)
+            if current != old:
+                raise Exception(f"Cannot update {name}: expected {old}, found {current}")
+
+
+def read_ref_file(path: str) -> str | None:
+    if not os.path.isfile(path):
+        return None
+    with open(path, "r") as fp:
+        return fp.read().rstrip("\n")
+
+
+class FilesRefBackend(RefBackend):
+    """
+    The classic layout: one file per ref under .git/refs, plus the optional
+    .git/packed-refs produced by `pack-refs`. Loose refs win over packed ones.
+    """
+
+    def __init__(self, gitdir: str):
+        super().__init__(gitdir)
+        self._packed: dict[str, str] | None = None
+        self._packed_stat = None
+
+    def packed_refs(self) -> dict[str, str]:
+        """
+        Parse .git/packed-refs, reusing the last parse while the file is unchanged
+        """
+        path = os.path.join(self.gitdir, "packed-refs")
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self._packed, self._packed_stat = dict(), None
+            return self._packed
+
+        key = (st.st_mtime_ns, st.st_size, st.st_ino)
+        if self._packed is not None and self._packed_stat == key:
+            return self._packed
+
+        packed = dict()
+        with open(path, "r") as fp:
+            for line in fp:
+                # Skip the header and peeled tag lines (^<sha>)
+                if line.startswith("#") or line.startswith("^"):
+                    continue
+                sha, _, name = line.rstrip("\n").partition(" ")
+                if name:
+                    packed[name] = sha
+        self._packed, self._packed_stat = packed, key
+        return packed
+
+    def read_ref(self, name: str) -> str | None:
+        value = read_ref_file(os.path.join(self.gitdir, name))
+        if value is not None:
+            return value
+        return self.packed_refs().get(name)
+
+    def iter_refs(self, prefix="refs/"):
+        refs = dict(self.packed_refs())
+        refs_dir = os.path.join(self.gitdir, "refs")
+        for root, _, files in os.walk(refs_dir):
+            for f in files:
+                if f.endswith(LOCK_SUFFIX):
+                    continue
+                path = os.path.join(root, f)
+                name = os.path.relpath(path, self.gitdir).replace(os.sep, "/")
+                value = read_ref_file(path)
+                if value is not None:
+                    refs[name] = value
+
+        for name in sorted(refs):
+            if name.startswith(prefix):
+                yield name, refs[name]
+
+    def commit(self, updates, expected):
+        locks = list()
+        try:
+            # Lock in sorted order so two transactions can't deadlock each other
+            for name in sorted(updates):
+                path = os.path.join(self.gitdir, name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                locks.append((name, path, lock_acquire(path)))
+
+            self.check_expected(expected)
+
+            deleted = {name for name, value in updates.items() if value is None}
+            if deleted & self.packed_refs().keys():
+                self._packed_rewrite(remove=deleted)
+
+            while locks:
+                name, path, fd = locks.pop()
+                committed = False
+                try:
+                    if updates[name] is None:
+                        if os.path.isfile(path):
+                            os.unlink(path)
+                    else:
+                        lock_commit(path, fd, (updates[name] + "\n").encode("ascii"))
+                        committed = True
+                finally:
+                    if not committed:
+                        lock_release(path, fd)
+        finally:
+            for _, path, fd in locks:
+                lock_release(path, fd)
+
+    def compact(self):
+        """
+        Move every loose ref into packed-refs, like `git pack-refs --all`
+        """
+        loose = dict()
+        for root, _, files in os.walk(os.path.join(self.gitdir, "refs")):
+            for f in files:
+                if f.endswith(LOCK_SUFFIX):
+                    continue
+                path = os.path.join(root, f)
+                value = read_ref_file(path)
+                if value is not None and not value.startswith("ref: "):
+                    loose[os.path.relpath(path, self.gitdir).replace(os.sep, "/")] = (path, value)
+
+        self._packed_rewrite(add={name: value for name, (_, value) in loose.items()})
+
+        for name, (path, value) in loose.items():
+            # Only drop the loose file if nobody updated it in the meantime
+            fd = lock_acquire(path)
+            try:
+                if read_ref_file(path) == value:
+                    os.unlink(path)
+            finally:
+                lock_release(path, fd)
+
+    def _packed_rewrite(self, add=None, remove=None):
+        path = os.path.join(self.gitdir, "packed-refs")
+        fd = lock_acquire(path)
+        try:
+            self._packed = None
+            refs = dict(self.packed_refs())
+            refs.update(add or dict())
+            for name in remove or set():
+                refs.pop(name, None)
+
+            lines = ["# pack-refs with: sorted \n"]
+            lines.extend(f"{refs[name]} {name}\n" for name in sorted(refs))
+            lock_commit(path, fd, "".join(lines).encode("ascii"))
+        except BaseException:
+            lock_release(path, fd)
+            raise
+        self._packed = None
+
+
+def reftable_encode_value(value: str | None) -> bytes:
+    if value is None:
+        return bytes([VALUE_DELETION])
+    if value.startswith("ref: "):
+        target = value[5:].encode("utf8")
+        return bytes([VALUE_SYMREF]) + len(target).to_bytes(2, "big") + target
+    return bytes([VALUE_OID]) + bytes.fromhex(value)
+
+
+def reftable_write(records: list[tuple[str, str | None]], min_index: int, max_index: int,
+                   block_size=REFTABLE_BLOCK_SIZE) -> bytes:
+    """
+    Serialize sorted (name, value) records into a reftable:
+
+    [header] [block]... [block index] [footer]
+
+    Each block holds records back to back:
+        [name length: u16] [name] [value type: u8] [value]
+    The block index keeps the first name of every block, so a lookup is one
+    bisect over the index plus a scan of a single block.
+    """
+    out = bytearray(REFTABLE_HEADER.pack(REFTABLE_MAGIC, REFTABLE_VERSION, block_size))
+    index = list()
+    block = bytearray()
+    first_key = b""
+
+    for name, value in records:
+        key = name.encode("utf8")
+        record = len(key).to_bytes(2, "big") + key + reftable_encode_value(value)
+        if block and len(block) + len(record) > block_size:
+            index.append((len(out), len(block), first_key))
+            out += block
+            block = bytearray()
+        if not block:
+            first_key = key
+        block += record
+
+    if block:
+        index.append((len(out), len(block), first_key))
+        out += block
+
+    index_offset = len(out)
+    for offset, length, key in index:
+        out += REFTABLE_INDEX_ENTRY.pack(offset, length, len(key)) + key
+    out += REFTABLE_FOOTER.pack(index_offset, len(index), min_index, max_index, REFTABLE_MAGIC)
+    return bytes(out)
+
+
+class Reftable:
+    """
+    A single immutable table file. Tables are never modified once written,
+    so a parsed table can be cached for the lifetime of the process.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self.data = f.read()
+
+        magic, version, _ = REFTABLE_HEADER.unpack_from(self.data, 0)
+        footer = REFTABLE_FOOTER.unpack_from(self.data, len(self.data) - REFTABLE_FOOTER.size)
+        index_offset, count, self.min_index, self.max_index, footer_magic = footer
+        if magic != REFTABLE_MAGIC or footer_magic != REFTABLE_MAGIC or version != REFTABLE_VERSION:
+            raise Exception(f"Malformed reftable {path}")
+
+        self.keys: list[str] = list()
+        self.blocks: list[tuple[int, int]] = list()
+        pos = index_offset
+        for _ in range(count):
+            offset, length, key_len = REFTABLE_INDEX_ENTRY.unpack_from(self.data, pos)
+            pos += REFTABLE_INDEX_ENTRY.size
+            self.keys.append(self.data[pos : pos + key_len].decode("utf8"))
+            self.blocks.append((offset, length))
+            pos += key_len
+
+    def block_records(self, block_no: int) -> Iterator[tuple[str, str | None]]:
+        data = self.data
+        offset, length = self.blocks[block_no]
+        pos, end = offset, offset + length
+        while pos < end:
+            key_len = int.from_bytes(data[pos : pos + 2], "big")
+            name = data[pos + 2 : pos + 2 + key_len].decode("utf8")
+            pos += 2 + key_len
+            vtype = data[pos]
+            pos += 1
+            if vtype == VALUE_OID:
+                value = data[pos : pos + 20].hex()
+                pos += 20
+            elif vtype == VALUE_SYMREF:
+                target_len = int.from_bytes(data[pos : pos + 2], "big")
+                value = "ref: " + data[pos + 2 : pos + 2 + target_len].decode("utf8")
+                pos += 2 + target_len
+            else:
+                value = None
+            yield name, value
+
+    def lookup(self, name: str):
+        """
+        Return the value stored for name, None for a deletion, or _MISSING
+        """
+        block_no = bisect.bisect_right(self.keys, name) - 1
+        if block_no < 0:
+            return _MISSING
+        for key, value in self.block_records(block_no):
+            if key == name:
+                return value
+            if key > name:
+                break
+        return _MISSING
+
+    def records_from(self, prefix: str) -> Iterator[tuple[str, str | None]]:
+        block_no = max(bisect.bisect_right(self.keys, prefix) - 1, 0)
+        for i in range(block_no, len(self.blocks)):
+            for key, value in self.block_records(i):
+                if key >= prefix:
+                    yield key, value
+
+
+class ReftableRefBackend(RefBackend):
+    """
+    Refs are stored in a stack of sorted, immutable tables under .git/reftable.
+    tables.list names the tables, oldest first; newer tables shadow older ones.
+
+    An update never rewrites a table: it writes a new (small) table, fsyncs it,
+    then swaps tables.list through its lock file. A crash at any point leaves
+    either the old or the new list in place. To keep the stack short, the
+    newest tables are merged whenever they grow past half of the table below
+    them (geometric compaction), so lookups touch O(log n) tables.
+    """
+
+    def __init__(self, gitdir: str):
+        super().__init__(gitdir)
+        self.dir = os.path.join(gitdir, REFTABLE_DIR)
+        self.list_path = os.path.join(self.dir, REFTABLE_LIST)
+        # Tables are immutable, each is read once: name -> Reftable. Only
+        # the tables of the last tables.list read are kept
+        self.cache: dict[str, Reftable] = dict()
+
+    def stack(self) -> list[str]:
+        try:
+            with open(self.list_path, "r") as f:
+                return f.read().split()
+        except FileNotFoundError:
+            return list()
+
+    def table_open(self, name: str) -> Reftable:
+        table = self.cache.get(name)
+        if table is None:
+            table = self.cache[name] = Reftable(os.path.join(self.dir, name))
+        return table
+
+    def tables(self, stack=None) -> list[Reftable]:
+        if stack is not None:
+            return [self.table_open(name) for name in stack]
+
+        # A writer may compact the stack between us reading tables.list and
+        # opening the tables. The new list is already in place then, so retry.
+        for attempt in range(4):
+            stack = self.stack()
+            try:
+                tables = self.tables(stack)
+            except FileNotFoundError:
+                if attempt == 3:
+                    raise
+                continue
+            # Forget the tables compacted away since, swapped in one go
+            self.cache = dict(zip(stack, tables))
+            return tables
+
+    def read_ref(self, name):
+        for table in reversed(self.tables()):
+            value = table.lookup(name)
+            if value is not _MISSING:
+                return value
+        return None
+
+    def merged(self, tables: list[Reftable], prefix="") -> Iterator[tuple[str, str | None]]:
+        """
+        Merge tables into a single sorted stream, keeping the newest value per name
+        """
+        def tagged(table: Reftable, age: int):
+            for name, value in table.records_from(prefix):
+                yield name, age, value
+
+        # Sorting on (name, -table position) puts the newest record first
+        streams = [tagged(table, -i) for i, table in enumerate(tables)]
+        last = None
+        for name, _, value in heapq.merge(*streams):
+            if name == last:
+                continue
+            last = name
+            if not name.startswith(prefix):
+                break
+            yield name, value
+
+    def iter_refs(self, prefix="refs/"):
+        for name, value in self.merged(self.tables(), prefix):
+            if value is not None:
+                yield name, value
+
+    def commit(self, updates, expected):
+        os.makedirs(self.dir, exist_ok=True)
+        fd = lock_acquire(self.list_path)
+        try:
+            self.check_expected(expected)
+
+            stack = self.stack()
+            tables = self.tables(stack)
+            update_index = tables[-1].max_index + 1 if tables else 1
+
+            records = sorted(updates.items())
+            stack.append(self._write_table(records, update_index, update_index))
+
+            new_stack = self._auto_compact(stack)
+
+            lock_commit(self.list_path, fd, "".join(f"{name}\n" for name in new_stack).encode("ascii"))
+        except BaseException:
+            lock_release(self.list_path, fd)
+            raise
+        self._remove_tables(set(stack) - set(new_stack))
+
+    def compact(self):
+        if not os.path.isdir(self.dir):
+            return
+        fd = lock_acquire(self.list_path)
+        try:
+            stack = self.stack()
+            new_stack = self._compact_range(stack, 0)
+            lock_commit(self.list_path, fd, "".join(f"{name}\n" for name in new_stack).encode("ascii"))
+        except BaseException:
+            lock_release(self.list_path, fd)
+            raise
+        self._remove_tables(set(stack) - set(new_stack))
+
+    def _write_table(self, records, min_index: int, max_index: int) -> str:
+        name = f"{min_index:012x}-{max_index:012x}-{os.urandom(4).hex()}.ref"
+        path = os.path.join(self.dir, name)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(reftable_write(records, min_index, max_index))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        return name
+
+    def _compact_range(self, stack: list[str], start: int) -> list[str]:
+        """
+        Merge stack[start:] into a single table
+        """
+        if len(stack) - start < 2 and start > 0:
+            return stack
+        tables = self.tables(stack[start:])
+        if not tables:
+            return stack
+        records = self.merged(tables)
+        if start == 0:
+            # Nothing older can be shadowed, so deletions can go away
+            records = ((name, value) for name, value in records if value is not None)
+        name = self._write_table(list(records), tables[0].min_index, tables[-1].max_index)
+        return stack[:start] + [name]
+
+    def _auto_compact(self, stack: list[str]) -> list[str]:
+        sizes = [os.path.getsize(os.path.join(self.dir, name)) for name in stack]
+        start = len(stack) - 1
+        tail = sizes[start]
+        # Grow the merge window while the table below isn't at least twice
+        # as big as everything above it
+        while start > 0 and sizes[start - 1] <= 2 * tail:
+            start -= 1
+            tail += sizes[start]
+        if start < len(stack) - 1:
+            return self._compact_range(stack, start)
+        return stack
+
+    def _remove_tables(self, names: set[str]):
+        # Only tables we just compacted away: they are out of tables.list, so
+        # no new reader will look for them, and readers holding the old list
+        # retry (see tables()).
+        for name in names:
+            try:
+                os.unlink(os.path.join(self.dir, name))
+            except FileNotFoundError:
+                pass
+
+
+REF_BACKENDS: dict[str, type[RefBackend]] = {
+    "files": FilesRefBackend,
+    "reftable": ReftableRefBackend,
+}
+
+# ----------------------------- REF_BACKENDS_END ----------------------------- #
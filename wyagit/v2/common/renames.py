@@ -0,0 +1,127 @@
+import os
+import zlib
+
+from typing import Callable
+
+from common.treediff import TreeChange
+
+# ------------------------------- RENAMES_START ------------------------------ #
+# A rename is a deletion and an addition of (nearly) the same content.
+#
+# Exact renames are found first, by blob sha, in one pass over the changes.
+# Whatever is left is compared pairwise: each blob is cut into chunks (lines,
+# at most 64 bytes) and summarized as {chunk hash: bytes}; the similarity of
+# two blobs is how many bytes of chunks they share over the bigger size.
+# Pairs are taken best first until no candidate is above the threshold.
+#
+# Pairwise comparison is quadratic, so it's skipped once sources x
+# destinations goes over limit x limit (git's diff.renameLimit).
+
+RENAME_THRESHOLD = 50
+RENAME_LIMIT = 1000
+FINGERPRINT_CHUNK = 64
+
+
+def blob_fingerprint(data: bytes) -> dict[int, int]:
+    ret = dict()
+    pos = 0
+    while pos < len(data):
+        end = data.find(b"\n", pos, pos + FINGERPRINT_CHUNK)
+        end = pos + FINGERPRINT_CHUNK if end == -1 else end + 1
+        chunk = data[pos:end]
+        key = zlib.crc32(chunk)
+        ret[key] = ret.get(key, 0) + len(chunk)
+        pos = end
+    return ret
+
+
+def fingerprint_of(data: bytes) -> tuple[dict[int, int], int]:
+    return blob_fingerprint(data), len(data)
+
+
+def similarity(src: dict[int, int], src_size: int, dst: dict[int, int], dst_size: int) -> int:
+    """
+    Percentage of the bigger blob's bytes found in the other one
+    """
+    biggest = max(src_size, dst_size)
+    if biggest == 0:
+        return 100
+    if len(src) > len(dst):
+        src, dst = dst, src
+    common = sum(min(n, dst.get(key, 0)) for key, n in src.items())
+    return common * 100 // biggest
+
+
+def rename_change(status: str, src: TreeChange, dst: TreeChange, score: int) -> TreeChange:
+    return TreeChange(status, dst.path, src.old_mode, src.old_sha, dst.new_mode, dst.new_sha,
+                      old_path=src.path, score=score)
+
+
+def detect_renames(changes: list[TreeChange], load_old: Callable[[TreeChange], bytes],
+                   load_new: Callable[[TreeChange], bytes], threshold=RENAME_THRESHOLD,
+                   limit=RENAME_LIMIT, copies=False) -> list[TreeChange]:
+    """
+    Pair up deletions (and with copies, modified files' old versions) with
+    additions. load_old/load_new give the content of a change's sides.
+    Returns the changes, pairs replaced by R (or C) changes.
+    """
+    deleted = [c for c in changes if c.status == "D"]
+    added = [c for c in changes if c.status == "A"]
+    if not added or not (deleted or copies):
+        return changes
+
+    sources = deleted + ([c for c in changes if c.status == "M"] if copies else [])
+    paired = dict()  # added path -> R/C change
+    used = set()  # deleted paths already renamed
+
+    def take(src: TreeChange, dst: TreeChange, score: int):
+        # A deletion can only be renamed once, any later pair is a copy
+        if src.status == "D" and src.path not in used:
+            used.add(src.path)
+            paired[dst.path] = rename_change("R", src, dst, score)
+        else:
+            paired[dst.path] = rename_change("C", src, dst, score)
+
+    # Exact renames: same blob. Prefer a source with the same file name.
+    # As in git, the last destination is the rename, earlier ones are copies.
+    by_sha = dict()
+    for src in sources:
+        by_sha.setdefault(src.old_sha, list()).append(src)
+    for dst in reversed(added):
+        candidates = [s for s in by_sha.get(dst.new_sha, ()) if copies or s.path not in used]
+        if candidates:
+            name = os.path.basename(dst.path)
+            candidates.sort(key=lambda s: (s.path in used, os.path.basename(s.path) != name))
+            take(candidates[0], dst, 100)
+
+    # Inexact renames
+    sources = [s for s in sources if copies or s.path not in used]
+    destinations = [d for d in added if d.path not in paired]
+    if sources and destinations and len(sources) * len(destinations) <= limit * limit:
+        src_prints = [(s, *fingerprint_of(load_old(s))) for s in sources]
+        scored = list()
+        for dst in destinations:
+            dst_print, dst_size = fingerprint_of(load_new(dst))
+            for i, (src, src_print, src_size) in enumerate(src_prints):
+                # Not even the sizes are close enough
+                if min(src_size, dst_size) * 100 < threshold * max(src_size, dst_size):
+                    continue
+                score = similarity(src_print, src_size, dst_print, dst_size)
+                if score >= threshold:
+                    scored.append((-score, i, dst.path, src, dst))
+
+        scored.sort(key=lambda item: item[:3])
+        for neg_score, _, _, src, dst in scored:
+            if dst.path in paired or (not copies and src.path in used):
+                continue
+            take(src, dst, -neg_score)
+
+    # Each pair takes the place of its addition
+    return [
+        paired.get(c.path, c)
+        for c in changes
+        if not (c.status == "D" and c.path in used)
+    ]
+
+
+# -------------------------------- RENAMES_END ------------------------------- #
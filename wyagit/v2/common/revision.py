@@ -0,0 +1,240 @@
+import re
+import heapq
+
+from typing import NamedTuple
+
+from common.helper_classes import (
+    GitRepository,
+    LazyKvlm,
+    object_read,
+    object_resolve_unique,
+    ref_backend,
+    ref_resolve,
+)
+
+# ------------------------------ REVISIONS_START ----------------------------- #
+# A revision expression is a name followed by any number of suffixes:
+#
+#   HEAD~3          third first-parent ancestor
+#   HEAD^2          second parent (HEAD^ == HEAD^1, HEAD^0 == HEAD itself)
+#   v1.0^{tree}     peel until an object of that type is reached
+#   v1.0^{}         peel tags until something that isn't a tag
+#   main^{/fix}     youngest commit reachable from main whose message matches
+#   main@{upstream} the branch main is configured to track (also @{u})
+#   @               HEAD
+#
+# and two of those joined by `..` make a range (A..B: reachable from B, not A).
+
+REV_SUFFIX_RE = re.compile(r"\^\{(?P<peel>[^}]*)\}|\^(?P<nth>\d*)|~(?P<gen>\d*)")
+REV_UPSTREAM_RE = re.compile(r"^(?P<branch>.*)@\{(u|upstream)\}$")
+
+
+class CommitInfo(NamedTuple):
+    tree: str
+    parents: tuple[str, ...]
+    time: int  # committer timestamp
+
+
+def commit_info(repo: GitRepository, sha: str) -> CommitInfo:
+    """
+    Tree and parents of a commit, memoized on the repo. Commits are
+    immutable, so entries never go stale: walking HEAD~1000 twice inflates
+    each commit only once.
+    """
+    if repo.commits is None:
+        repo.commits = dict()
+
+    info = repo.commits.get(sha)
+    if info is None:
+        obj = object_read(repo, sha)
+        if obj is None or obj.fmt != b"commit":
+            raise Exception(f"{sha} is not a commit")
+
+        parents = obj.kvlm.get(b"parent", [])
+        if type(parents) != list:
+            parents = [parents]
+        info = CommitInfo(
+            obj.kvlm[b"tree"].decode("ascii"),
+            tuple(p.decode("ascii") for p in parents),
+            commit_time(obj),
+        )
+        repo.commits[sha] = info
+    return info
+
+
+def is_rev_expression(name: str) -> bool:
+    return "^" in name or "~" in name or ".." in name or "@{" in name or name == "@"
+
+
+def rev_parse(repo: GitRepository, expr: str) -> list[str]:
+    """
+    Resolve an expression the way `git rev-parse` prints it: one sha, or for
+    a range A..B the pair [B, ^A]
+    """
+    if ".." in expr:
+        left, _, right = expr.partition("..")
+        # A missing side means HEAD, so `main..` is `main..HEAD`
+        tip = rev_parse_single(repo, right or "HEAD")
+        base = rev_parse_single(repo, left or "HEAD")
+        return [tip, "^" + base]
+    return [rev_parse_single(repo, expr)]
+
+
+def rev_parse_single(repo: GitRepository, expr: str) -> str:
+    """
+    Resolve an expression naming exactly one object to its sha
+    """
+    if ".." in expr:
+        raise Exception(f"{expr} is a range, not a single revision")
+
+    match = REV_SUFFIX_RE.search(expr)
+    split = match.start() if match else len(expr)
+    sha = rev_resolve_base(repo, expr[:split])
+
+    pos = split
+    while pos < len(expr):
+        match = REV_SUFFIX_RE.match(expr, pos)
+        if not match:
+            raise Exception(f"Bad revision {expr}: can't parse {expr[pos:]}")
+        pos = match.end()
+
+        if match.group("peel") is not None:
+            sha = rev_peel(repo, sha, match.group("peel"), expr)
+        elif match.group("nth") is not None:
+            nth = int(match.group("nth") or 1)
+            sha = rev_peel(repo, sha, "commit", expr)
+            if nth > 0:
+                parents = commit_info(repo, sha).parents
+                if nth > len(parents):
+                    raise Exception(f"Bad revision {expr}: {sha} has no parent {nth}")
+                sha = parents[nth - 1]
+        else:
+            generations = int(match.group("gen") or 1)
+            sha = rev_peel(repo, sha, "commit", expr)
+            for _ in range(generations):
+                parents = commit_info(repo, sha).parents
+                if not parents:
+                    raise Exception(f"Bad revision {expr}: {sha} has no parent")
+                sha = parents[0]
+
+    return sha
+
+
+def rev_resolve_base(repo: GitRepository, name: str) -> str:
+    """
+    The part of an expression before any suffix: @, name@{upstream} or a plain name
+    """
+    if name in ("", "@"):
+        name = "HEAD"
+
+    upstream = REV_UPSTREAM_RE.match(name)
+    if upstream:
+        ref = branch_upstream(repo, upstream.group("branch"))
+        sha = ref_resolve(repo, ref)
+        if not sha:
+            raise Exception(f"No such reference {ref} (upstream of {name}).")
+        return sha
+
+    return object_resolve_unique(repo, name)
+
+
+def branch_upstream(repo: GitRepository, branch: str) -> str:
+    """
+    The ref a branch tracks, from its [branch "<name>"] remote/merge config
+    """
+    if branch in ("", "@", "HEAD"):
+        head = ref_resolve_symbolic(repo, "HEAD")
+        if not head.startswith("refs/heads/"):
+            raise Exception("HEAD is detached, it has no upstream")
+        branch = head[len("refs/heads/") :]
+
+    section = f'branch "{branch}"'
+    if not repo.conf.has_option(section, "merge"):
+        raise Exception(f"No upstream configured for branch {branch}")
+
+    remote = repo.conf.get(section, "remote", fallback=".")
+    merge = repo.conf.get(section, "merge")
+    if remote == ".":
+        # Tracking a local branch
+        return merge
+    return f"refs/remotes/{remote}/{merge.removeprefix('refs/heads/')}"
+
+
+def ref_resolve_symbolic(repo: GitRepository, ref: str) -> str:
+    """
+    The name a symbolic ref points to (HEAD -> refs/heads/master), or ref itself
+    """
+    data = ref_backend(repo).read(ref)
+    if data and data.startswith("ref: "):
+        return data[5:]
+    return ref
+
+
+def rev_peel(repo: GitRepository, sha: str, peel: str, expr: str) -> str:
+    """
+    ^{<type>}, ^{} and ^{/<regex>}
+    """
+    if peel.startswith("/"):
+        return rev_search_message(repo, rev_peel(repo, sha, "commit", expr), peel[1:], expr)
+
+    if peel and peel not in ("commit", "tree", "blob", "tag"):
+        raise Exception(f"Bad revision {expr}: unknown type {peel}")
+
+    # Known commits don't need to be read again
+    if repo.commits and sha in repo.commits:
+        if peel == "commit" or peel == "":
+            return sha
+        if peel == "tree":
+            return repo.commits[sha].tree
+
+    while True:
+        obj = object_read(repo, sha)
+        if obj is None:
+            raise Exception(f"Bad revision {expr}: {sha} is missing")
+
+        if obj.fmt.decode("ascii") == peel or (peel == "" and obj.fmt != b"tag"):
+            return sha
+
+        if obj.fmt == b"tag":
+            sha = obj.kvlm[b"object"].decode("ascii")
+        elif obj.fmt == b"commit" and peel == "tree":
+            return commit_info(repo, sha).tree
+        else:
+            raise Exception(f"Bad revision {expr}: {sha} is a {obj.fmt.decode('ascii')}, not a {peel}")
+
+
+def commit_time(obj) -> int:
+    # committer Name <email> 1700000000 +0100
+    kvlm = obj.kvlm
+    # Peeked at: walks only need the time, not the rest of the headers
+    committer = (kvlm.peek(b"committer") if isinstance(kvlm, LazyKvlm) else kvlm.get(b"committer")) or b""
+    try:
+        return int(committer.rsplit(b" ", 2)[1])
+    except (IndexError, ValueError):
+        return 0
+
+
+def rev_search_message(repo: GitRepository, start: str, pattern: str, expr: str) -> str:
+    """
+    Youngest commit reachable from start whose message matches pattern
+    """
+    regex = re.compile(pattern)
+    seen = {start}
+    obj = object_read(repo, start)
+    # Max-heap on commit time, so the youngest commit is always visited next
+    queue = [(-commit_time(obj), start, obj)]
+
+    while queue:
+        _, sha, obj = heapq.heappop(queue)
+        if regex.search(obj.kvlm[None].decode("utf8", "replace")):
+            return sha
+        for parent in commit_info(repo, sha).parents:
+            if parent not in seen:
+                seen.add(parent)
+                parent_obj = object_read(repo, parent)
+                heapq.heappush(queue, (-commit_time(parent_obj), parent, parent_obj))
+
+    raise Exception(f"Bad revision {expr}: no commit message matches {pattern}")
+
+
+# ------------------------------- REVISIONS_END ------------------------------ #
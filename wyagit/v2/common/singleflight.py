@@ -0,0 +1,51 @@
+import threading
+
+# ---------------------------- SINGLE_FLIGHT_START --------------------------- #
+# When several threads ask for the same thing at once, only the first one
+# (the leader) does the work; the others wait for it and get the same
+# result, or the same exception. Once the call is over the key is
+# forgotten: this is not a cache, it only collapses calls that overlap.
+
+
+class Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights: dict = dict()
+
+    def do(self, key, fn, *args):
+        """
+        fn(*args), unless a call for key is already in flight: then wait
+        for that one and share its outcome
+        """
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn(*args)
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+
+
+# ----------------------------- SINGLE_FLIGHT_END ---------------------------- #
@@ -0,0 +1,230 @@
+import os
+
+from common.helper_classes import GitRepository, object_read, repo_file
+from common.checkout import (
+    CHECKOUT_BYTE_BUDGET,
+    CHECKOUT_DEFAULT_JOBS,
+    CheckoutItem,
+    checkout_files,
+    worktree_file_sha,
+    worktree_remove_empty_dirs,
+)
+from common.index import GitIndex, index_entry_from_stat, index_entry_mode, index_entry_sparse_dir
+from common.treediff import is_tree_mode
+
+# ------------------------------- SPARSE_START ------------------------------- #
+# Cone mode sparse checkout. The user lists directories; each one is checked
+# out recursively, and so are the files (only the files) sitting directly in
+# its parent directories and at the root. In .git/info/sparse-checkout,
+# `sparse-checkout set a/b` is spelled:
+#
+#   /*          every file at the root...
+#   !/*/        ...but no directory
+#   /a/         a's files...
+#   !/a/*/      ...but not its subdirectories
+#   /a/b/       all of a/b
+#
+# Since a cone is only made of whole directories, a directory outside it is
+# never read: the index keeps a single sparse directory entry for it.
+
+SPARSE_CHECKOUT_FILE = ("info", "sparse-checkout")
+
+SPARSE_RECURSIVE = "recursive"
+SPARSE_PARENT = "parent"
+
+
+class SparseCone:
+    def __init__(self, dirs: list[str]):
+        self.recursive = {d.strip("/") for d in dirs if d.strip("/")}
+        self.parents = set()
+        for d in self.recursive:
+            parent = os.path.dirname(d)
+            while parent:
+                self.parents.add(parent)
+                parent = os.path.dirname(parent)
+
+    def match_dir(self, path: str) -> str | None:
+        """
+        SPARSE_RECURSIVE if everything under path is checked out,
+        SPARSE_PARENT if only its files (and part of its subdirectories)
+        are, None if it's outside the cone
+        """
+        if path in self.parents:
+            return SPARSE_PARENT
+        while path:
+            if path in self.recursive:
+                return SPARSE_RECURSIVE
+            path = os.path.dirname(path)
+        return None
+
+    def includes_dir(self, path: str) -> bool:
+        return path == "" or self.match_dir(path) is not None
+
+    def includes_file(self, path: str) -> bool:
+        return self.includes_dir(os.path.dirname(path))
+
+    def patterns(self) -> list[str]:
+        ret = ["/*", "!/*/"]
+        for d in sorted(self.recursive | self.parents):
+            ret.append(f"/{d}/")
+            if d not in self.recursive:
+                ret.append(f"!/{d}/*/")
+        return ret
+
+
+def sparse_parse(lines: list[str]) -> SparseCone:
+    lines = [line.strip() for line in lines if line.strip() and not line.startswith("#")]
+    if lines[:2] != ["/*", "!/*/"]:
+        raise Exception("Only cone mode sparse-checkout patterns are supported")
+
+    dirs = set()
+    parents = set()
+    for line in lines[2:]:
+        if line.startswith("!/") and line.endswith("/*/"):
+            parents.add(line[2:-3])
+        elif line.startswith("/") and line.endswith("/"):
+            dirs.add(line[1:-1])
+        else:
+            raise Exception(f"Not a cone mode sparse-checkout pattern: {line}")
+    return SparseCone(sorted(dirs - parents))
+
+
+def sparse_enabled(repo: GitRepository) -> bool:
+    return repo.conf.getboolean("core", "sparsecheckout", fallback=False)
+
+
+def sparse_read(repo: GitRepository) -> SparseCone | None:
+    """
+    The repo's cone, or None when sparse checkout is off
+    """
+    if not sparse_enabled(repo):
+        return None
+
+    path = repo_file(repo, *SPARSE_CHECKOUT_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return sparse_parse(f.readlines())
+
+
+def sparse_write(repo: GitRepository, cone: SparseCone | None):
+    """
+    Save the cone (None turns sparse checkout off) and the matching config
+    """
+    if cone is not None:
+        with open(repo_file(repo, *SPARSE_CHECKOUT_FILE, mkdir=True), "w") as f:
+            f.write("\n".join(cone.patterns()) + "\n")
+
+    if not repo.conf.has_section("core"):
+        repo.conf.add_section("core")
+    repo.conf.set("core", "sparsecheckout", "true" if cone is not None else "false")
+    repo.conf.set("core", "sparsecheckoutcone", "true")
+    # Our index is a sparse one, tell git to keep it that way
+    if not repo.conf.has_section("index"):
+        repo.conf.add_section("index")
+    repo.conf.set("index", "sparse", "true" if cone is not None else "false")
+    with open(repo_file(repo, "config"), "w") as f:
+        repo.conf.write(f)
+
+
+def sparse_tree_walk(repo: GitRepository, tree: str, cone: SparseCone | None, prefix=""):
+    """
+    Yield (path, mode, sha) for every blob of tree inside the cone, and for
+    every directory outside of it (mode 040000) without reading it
+    """
+    obj = object_read(repo, tree)
+    for i in range(len(obj)):
+        path = f"{prefix}/{obj.path(i)}" if prefix else obj.path(i)
+        if obj.is_tree(i) and (cone is None or cone.includes_dir(path)):
+            yield from sparse_tree_walk(repo, obj.sha(i), cone, path)
+        else:
+            yield path, obj.mode(i), obj.sha(i)
+
+
+def sparse_dir_of(name: str, collapsed: set[str]) -> str | None:
+    """
+    The collapsed directory holding name, if any
+    """
+    parent = os.path.dirname(name.rstrip("/"))
+    while parent:
+        if parent in collapsed:
+            return parent
+        parent = os.path.dirname(parent)
+    return None
+
+
+def sparse_apply(repo: GitRepository, tree: str | None, index: GitIndex, cone: SparseCone | None,
+                 jobs=CHECKOUT_DEFAULT_JOBS, byte_budget=CHECKOUT_BYTE_BUDGET) -> int:
+    """
+    Make the worktree and index match cone (None: check out everything).
+    Files entering the cone are written, files leaving it are removed once
+    we know nothing would be lost. Returns the number of files touched.
+    """
+    if tree is None:
+        return 0
+
+    worktree = os.path.realpath(repo.worktree)
+    entries = {e.name: e for e in index.entries}
+    target = list(sparse_tree_walk(repo, tree, cone))
+    collapsed = {path: sha for path, mode, sha in target if is_tree_mode(mode)}
+
+    new_entries = dict()
+    items = list()
+    for path, mode, sha in target:
+        if path in collapsed:
+            new_entries[path + "/"] = index_entry_sparse_dir(path, sha)
+            continue
+
+        entry = entries.get(path)
+        if entry is not None and not entry.flag_skip_worktree:
+            new_entries[path] = entry  # Already there, staged changes and all
+            continue
+        if entry is not None:
+            mode, sha = index_entry_mode(entry), entry.sha
+
+        full_path = os.path.join(worktree, path)
+        if os.path.lexists(full_path):
+            if os.path.isdir(full_path) or worktree_file_sha(full_path) != sha:
+                raise Exception(f"Untracked working tree file {path} would be overwritten by sparse-checkout")
+            os.unlink(full_path)  # Same content, write it again to refresh its stat data
+        items.append((path, CheckoutItem(full_path, mode, sha)))
+
+    # Whatever is leaving the cone must be exactly what HEAD has there
+    head_files = dict()
+    leaving = list()
+    for name, entry in entries.items():
+        if name in new_entries or entry.is_sparse_dir:
+            continue
+        d = sparse_dir_of(name, collapsed)
+        if d is None:
+            new_entries[name] = entry  # Not in HEAD: a staged addition
+            continue
+        if entry.flag_skip_worktree:
+            continue
+
+        if d not in head_files:
+            head_files[d] = {p: s for p, _, s in sparse_tree_walk(repo, collapsed[d], None, d)}
+        full_path = os.path.join(worktree, name)
+        if head_files[d].get(name) != entry.sha:
+            raise Exception(f"Your staged changes to {name} would be lost by sparse-checkout")
+        if os.path.lexists(full_path) and not entry.stat_matches(os.lstat(full_path)) \
+                and worktree_file_sha(full_path) != entry.sha:
+            raise Exception(f"Your local changes to {name} would be lost by sparse-checkout")
+        leaving.append(full_path)
+
+    for full_path in leaving:
+        if os.path.lexists(full_path):
+            os.unlink(full_path)
+        worktree_remove_empty_dirs(worktree, full_path)
+
+    for d in sorted({os.path.dirname(item.path) for _, item in items}):
+        os.makedirs(d, exist_ok=True)
+    checkout_files(repo, [item for _, item in items], jobs, byte_budget)
+    for path, item in items:
+        new_entries[path] = index_entry_from_stat(path, item.sha, os.lstat(item.path), item.mode)
+
+    index.entries = [new_entries[name] for name in sorted(new_entries)]
+    return len(items) + len(leaving)
+
+
+# -------------------------------- SPARSE_END -------------------------------- #
@@ -0,0 +1,88 @@
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+# ------------------------------- TRACE_START -------------------------------- #
+# Opt-in tracing, off unless WYAG_TRACE is set:
+#   WYAG_TRACE=1 (or 2, or true)   JSON lines on stderr
+#   WYAG_TRACE=/some/file          JSON lines appended to that file
+#
+# Each line is one event: {"ts": ..., "pid": ..., "op": ..., "us": ...} plus
+# whatever fields the call site adds. "us" is how long the operation took.
+#
+# When tracing is off it costs nothing: @traced hands back the function
+# untouched, and the few explicit trace() calls sit behind `if TRACE:`, a
+# single global check. Fields are only formatted once we know they're wanted.
+
+TRACE_ENV = "WYAG_TRACE"
+TRACE_STDERR = ("1", "2", "true")
+
+TRACE_TARGET = os.environ.get(TRACE_ENV, "")
+TRACE = TRACE_TARGET.lower() not in ("", "0", "false")
+
+_trace_lock = threading.Lock()
+_trace_file = None
+
+
+def trace_file():
+    global _trace_file
+    if _trace_file is None:
+        if TRACE_TARGET.lower() in TRACE_STDERR:
+            _trace_file = sys.stderr
+        else:
+            _trace_file = open(TRACE_TARGET, "a", buffering=1)
+    return _trace_file
+
+
+def trace(op: str, start: float | None = None, **fields):
+    """
+    Record one event. With start (a time.perf_counter() value), its
+    duration too. Call it as `if TRACE: trace(...)`.
+    """
+    event = {"ts": round(time.time(), 6), "pid": os.getpid(), "op": op}
+    if start is not None:
+        event["us"] = round((time.perf_counter() - start) * 1e6)
+    event.update(fields)
+    line = json.dumps(event, default=str) + "\n"
+    with _trace_lock:
+        f = trace_file()
+        f.write(line)
+        f.flush()
+
+
+def traced(op: str, *arg_names: str):
+    """
+    Decorator timing every call of a function as op. The arguments named
+    in arg_names (taken by position) are recorded with it. Without
+    WYAG_TRACE, the function is returned as is.
+    """
+
+    def decorate(fn):
+        if not TRACE:
+            return fn
+
+        positions = fn.__code__.co_varnames[: fn.__code__.co_argcount]
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                fields = dict()
+                for name in arg_names:
+                    if name in kwargs:
+                        fields[name] = kwargs[name]
+                    elif name in positions and positions.index(name) < len(args):
+                        fields[name] = args[positions.index(name)]
+                trace(op, start, **fields)
+
+        return wrapper
+
+    return decorate
+
+
+# -------------------------------- TRACE_END --------------------------------- #
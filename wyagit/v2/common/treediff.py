@@ -0,0 +1,151 @@
+from typing import Iterator, NamedTuple
+
+from common.helper_classes import GitRepository, GitTreeLeaf, object_read
+from common.index import IndexTree
+
+# ------------------------------ TREE_DIFF_START ----------------------------- #
+# Two trees are compared the way git stores them: entries sorted by name,
+# with a trailing "/" for subtrees. Walking both lists side by side finds
+# every difference in one pass, and a subtree whose sha is the same on both
+# sides is skipped without being read at all.
+#
+# Either side may also be the index (an IndexTree): its directory shas are
+# hashed in memory, so comparing HEAD with the index only reads the HEAD
+# trees on the path to what was actually staged.
+
+
+class TreeChange(NamedTuple):
+    status: str  # "A"dded, "D"eleted, "M"odified, "R"enamed or "C"opied
+    path: str
+    old_mode: bytes | None
+    old_sha: str | None
+    new_mode: bytes | None
+    new_sha: str | None
+    old_path: str | None = None  # Renames and copies only, see common.renames
+    score: int | None = None  # Their similarity, in percent
+
+
+def is_tree_mode(mode: bytes) -> bool:
+    return mode.startswith(b"04")
+
+
+class TreeEntries:
+    """
+    One side of a diff. A tree object is read through its accessors, straight
+    from the raw buffer: no GitTreeLeaf is built for its entries. An index
+    directory (IndexTree) has its leaves.
+    """
+
+    def __init__(self, repo: GitRepository, tree: "str | IndexTree | None"):
+        self.tree = None
+        self.leaves: list[GitTreeLeaf] = list()
+        if isinstance(tree, IndexTree):
+            self.leaves = tree.leaves()
+        elif tree is not None:
+            self.tree = object_read(repo, tree)
+
+    def __len__(self) -> int:
+        return len(self.tree) if self.tree is not None else len(self.leaves)
+
+    def key(self, i: int) -> bytes:
+        """
+        Git's tree order: a subtree sorts as if its name ended with "/"
+        """
+        if self.tree is not None:
+            return self.tree.sort_key(i)
+        leaf = self.leaves[i]
+        if is_tree_mode(leaf.mode):
+            return leaf.path.encode("utf8") + b"/"
+        return leaf.path.encode("utf8")
+
+    def mode(self, i: int) -> bytes:
+        return self.tree.mode(i) if self.tree is not None else self.leaves[i].mode
+
+    def is_tree(self, i: int) -> bool:
+        return self.tree.is_tree(i) if self.tree is not None else is_tree_mode(self.leaves[i].mode)
+
+    def path(self, i: int) -> str:
+        return self.tree.path(i) if self.tree is not None else self.leaves[i].path
+
+    def oid(self, i: int) -> bytes:
+        return self.tree.oid(i) if self.tree is not None else bytes.fromhex(self.leaves[i].sha)
+
+    def sha(self, i: int) -> str:
+        return self.tree.sha(i) if self.tree is not None else self.leaves[i].sha
+
+    def side(self, i: int) -> "str | IndexTree":
+        """
+        What to recurse into for a subtree: an index directory, or a tree sha
+        """
+        if self.tree is not None:
+            return self.tree.sha(i)
+        leaf = self.leaves[i]
+        return getattr(leaf, "node", leaf.sha)
+
+
+def tree_sha(tree: "str | IndexTree | None") -> str | None:
+    if isinstance(tree, IndexTree):
+        return tree.sha()
+    return tree
+
+
+def diff_trees(repo: GitRepository, a: "str | IndexTree | None", b: "str | IndexTree | None", prefix="",
+               sparse=None) -> Iterator[TreeChange]:
+    """
+    Yield the blob-level changes going from tree a to tree b (either may be
+    None for "empty", a sha or an IndexTree), in path order. A changed
+    directory outside the sparse cone is yielded as a single change with
+    tree modes instead.
+    """
+    if tree_sha(a) == tree_sha(b):
+        return
+
+    old = TreeEntries(repo, a)
+    new = TreeEntries(repo, b)
+    old_len, new_len = len(old), len(new)
+    i = j = 0
+
+    while i < old_len or j < new_len:
+        old_key = old.key(i) if i < old_len else None
+        new_key = new.key(j) if j < new_len else None
+
+        if new_key is None or (old_key is not None and old_key < new_key):
+            yield from diff_entries(repo, old, i, None, None, prefix, sparse)
+            i += 1
+        elif old_key is None or new_key < old_key:
+            yield from diff_entries(repo, None, None, new, j, prefix, sparse)
+            j += 1
+        else:
+            if old.oid(i) != new.oid(j) or old.mode(i) != new.mode(j):
+                yield from diff_entries(repo, old, i, new, j, prefix, sparse)
+            i += 1
+            j += 1
+
+
+def diff_entries(repo: GitRepository, old: TreeEntries | None, i: int | None, new: TreeEntries | None,
+                 j: int | None, prefix: str, sparse=None) -> Iterator[TreeChange]:
+    """
+    Entry i of old and entry j of new share a name (and kind), or one of
+    them is missing
+    """
+    side, k = (old, i) if old is not None else (new, j)
+    name = side.path(k)
+    path = f"{prefix}/{name}" if prefix else name
+
+    if side.is_tree(k) and (sparse is None or sparse.includes_dir(path)):
+        yield from diff_trees(
+            repo,
+            old.side(i) if old is not None else None,
+            new.side(j) if new is not None else None,
+            path,
+            sparse,
+        )
+    elif old is None:
+        yield TreeChange("A", path, None, None, new.mode(j), new.sha(j))
+    elif new is None:
+        yield TreeChange("D", path, old.mode(i), old.sha(i), None, None)
+    else:
+        yield TreeChange("M", path, old.mode(i), old.sha(i), new.mode(j), new.sha(j))
+
+
+# ------------------------------- TREE_DIFF_END ------------------------------ #
@@ -1,36 +1,30 @@
-from common.parser import main_parsers
-from command.init import cmd_init
-from command.catfile import cmd_cat_file
-from command.hashobject import cmd_hash_object
-from command.log import cmd_log
-from command.lstree import cmd_ls_tree
-from command.checkout import cmd_checkout
-from command.showref import cmd_show_ref
-from command.tag import cmd_tag
-from command.revparse import cmd_rev_parse
-from loguru import logger
-
+import os
 import sys
+import time
+
+from common.trace import TRACE, trace
+
 
 def main(argv=sys.argv[1:]):
-    args = main_parsers.parse_args(argv)
-    match args.command:
-        case "add"          : cmd_add(args)
-        case "cat-file"     : cmd_cat_file(args)
-        case "check-ignore" : cmd_check_ignore(args)
-        case "checkout"     : cmd_checkout(args)
-        case "commit"       : cmd_commit(args)
-        case "hash-object"  : cmd_hash_object(args)
-        case "init"         : cmd_init(args)
-        case "log"          : cmd_log(args)
-        case "ls-files"     : cmd_ls_files(args)
-        case "ls-tree"      : cmd_ls_tree(args)
-        case "rev-parse"    : cmd_rev_parse(args)
-        case "rm"           : cmd_rm(args)
-        case "show-ref"     : cmd_show_ref(args)
-        case "status"       : cmd_status(args)
-        case "tag"          : cmd_tag(args)
-        case _              : print("Bad command.")
+    start = time.perf_counter()
+
+    # With WYAG_DAEMON=1, let a running `wyag daemon` answer if it can
+    if os.environ.get("WYAG_DAEMON") == "1":
+        from common.daemon import daemon_client_run
+
+        code = daemon_client_run(argv)
+        if code is not None:
+            sys.exit(code)
+
+    # Not before: a daemon client doesn't need argparse
+    from common.parser import command_parse
+
+    cmd, args = command_parse(argv)
+    try:
+        cmd(args)
+    finally:
+        if TRACE:
+            trace("command", start, argv=argv)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+
+from unittest import mock
+
+import common.checkout
+
+from command.init import repo_create
+from common.checkout import ByteBudget, blob_inflate
+from common.helper_classes import GitBlob, object_write
+from common.objbatch import ObjectBatch
+
+
+class RecordingBudget(ByteBudget):
+    def __init__(self, limit: int, events: list):
+        super().__init__(limit)
+        self.events = events
+
+    def acquire(self, n: int):
+        self.events.append(("acquire", n))
+        super().acquire(n)
+
+    def release(self, n: int):
+        self.events.append(("release", n))
+        super().release(n)
+
+
+class BlobInflateTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.repo = repo_create(os.path.realpath(self.tmp.name))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def inflate(self, sha: str) -> tuple[bytes, list]:
+        events = list()
+        budget = RecordingBudget(1 << 20, events)
+        read = common.checkout.pack_object_read
+
+        def recording_read(*args):
+            events.append(("read",))
+            return read(*args)
+
+        with mock.patch.object(common.checkout, "pack_object_read", recording_read):
+            data = blob_inflate(self.repo, sha, budget)
+        return data, events
+
+    def test_loose(self):
+        sha = object_write(GitBlob(b"loose\n"), self.repo)
+        self.assertEqual(self.inflate(sha), (b"loose\n", [("acquire", 6)]))
+
+    def test_packed_acquires_before_inflating(self):
+        content = b"packed\n" * 1000
+        with ObjectBatch(self.repo, pack=True):
+            sha = object_write(GitBlob(content), self.repo)
+        self.assertEqual(self.inflate(sha), (content, [("acquire", len(content)), ("read",)]))
+
+    def test_packed_not_a_blob_releases(self):
+        with ObjectBatch(self.repo, pack=True):
+            sha = object_write(GitBlob(b"x"), self.repo)
+        with mock.patch.object(common.checkout, "pack_object_read", return_value=(b"tree", b"x")):
+            events = list()
+            with self.assertRaises(Exception):
+                blob_inflate(self.repo, sha, RecordingBudget(1 << 20, events))
+        self.assertEqual(events, [("acquire", 1), ("release", 1)])
+
+
+if __name__ == "__main__":
+    unittest.main()
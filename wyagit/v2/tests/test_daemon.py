@@ -0,0 +1,34 @@
+import base64
+import os
+import tempfile
+import unittest
+
+from command.init import repo_create
+from common.daemon import daemon_run_command
+
+
+class DaemonRunCommandTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.realpath(self.tmp.name)
+        self.repo = repo_create(self.path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_each_request_gets_its_logs(self):
+        # An empty name makes object_resolve log a warning
+        for _ in range(2):
+            response = daemon_run_command(self.repo, ["rev-parse", " "], self.path)
+            self.assertIsNotNone(response["code"])
+            stderr = base64.b64decode(response["stderr"]).decode("utf8")
+            self.assertIn("WARNING", stderr)
+            self.assertNotIn("Logging error", stderr)
+
+    def test_outside_commands_are_refused(self):
+        response = daemon_run_command(self.repo, ["checkout", "HEAD"], self.path)
+        self.assertIsNone(response["code"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,17 @@
+import unittest
+
+from command.diff import rename_score_parse
+
+
+class RenameScoreTest(unittest.TestCase):
+    def test_digits_are_a_fraction(self):
+        for value, score in (("5", 50), ("57", 57), ("29", 29), ("575", 57), ("05", 5), ("100", 10)):
+            self.assertEqual(rename_score_parse(value), score, value)
+
+    def test_percent(self):
+        self.assertEqual(rename_score_parse("57%"), 57)
+        self.assertEqual(rename_score_parse("100%"), 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
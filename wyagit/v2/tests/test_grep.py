@@ -0,0 +1,33 @@
+import re
+import unittest
+
+from common.grep import grep_data
+
+
+def grep_lines(pattern: bytes, data: bytes) -> list[tuple[int, bytes]]:
+    regex = re.compile(pattern, re.MULTILINE)
+    return [(m.line_number, m.line) for m in grep_data(regex, data)]
+
+
+class GrepDataTest(unittest.TestCase):
+    def test_plain(self):
+        self.assertEqual(grep_lines(b"b", b"abc\nxyz\nbob\n"), [(1, b"abc"), (3, b"bob")])
+
+    def test_line_reported_once(self):
+        self.assertEqual(grep_lines(b"o", b"foo\nboo"), [(1, b"foo"), (2, b"boo")])
+
+    def test_newline_is_not_whitespace(self):
+        data = b"abc\ndef\nx y\nhello\n"
+        self.assertEqual(grep_lines(rb"\s", data), [(3, b"x y")])
+        self.assertEqual(grep_lines(rb"\W", data), [(3, b"x y")])
+
+    def test_match_across_lines(self):
+        self.assertEqual(grep_lines(rb"c\sd", b"abc\ndef\n"), [])
+        self.assertEqual(grep_lines(rb"[^a-z]", b"ab\ncd\ne-f"), [(3, b"e-f")])
+
+    def test_anchors(self):
+        self.assertEqual(grep_lines(rb"^d.*f$", b"abc\ndef\n"), [(2, b"def")])
+
+
+if __name__ == "__main__":
+    unittest.main()
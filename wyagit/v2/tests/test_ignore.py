@@ -0,0 +1,53 @@
+import unittest
+import warnings
+
+from common.ignore import GitIgnore, IgnoreRuleSet, gitignore_parse
+
+
+def ignored(patterns: list[str], path: str) -> bool:
+    return GitIgnore(absolute=[IgnoreRuleSet(gitignore_parse(patterns))]).is_ignored(path)
+
+
+class BracketTest(unittest.TestCase):
+    def setUp(self):
+        warnings.simplefilter("error", FutureWarning)  # Set operations like &&
+
+    def tearDown(self):
+        warnings.resetwarnings()
+
+    def test_ranges_and_negation(self):
+        self.assertTrue(ignored(["file[0-9].txt"], "file7.txt"))
+        self.assertFalse(ignored(["file[0-9].txt"], "filex.txt"))
+        self.assertTrue(ignored(["file[!0-9].txt"], "filex.txt"))
+        self.assertFalse(ignored(["file[^0-9].txt"], "file7.txt"))
+        self.assertFalse(ignored(["a[!x]b"], "a/b"))
+
+    def test_metacharacters_are_literal(self):
+        self.assertTrue(ignored(["[a-z&&b]"], "&"))
+        self.assertFalse(ignored(["[a-z&&b]"], "A"))
+        self.assertTrue(ignored(["x[~|]"], "x|"))
+        self.assertTrue(ignored(["x[[]"], "x["))
+        self.assertTrue(ignored(["x[a^]"], "x^"))
+
+    def test_backslash_escapes(self):
+        self.assertTrue(ignored(["x[\\]]"], "x]"))
+        self.assertTrue(ignored(["x[\\\\]"], "x\\"))
+        self.assertTrue(ignored(["x[a\\-z]"], "x-"))
+        self.assertFalse(ignored(["x[a\\-z]"], "xb"))
+
+    def test_leading_bracket_and_dash(self):
+        self.assertTrue(ignored(["x[]a]"], "x]"))
+        self.assertTrue(ignored(["x[-a]"], "x-"))
+        self.assertTrue(ignored(["x[a-]"], "x-"))
+
+    def test_bad_classes_still_compile(self):
+        # Never closed: a literal "[". A reversed range: only its first character
+        rules = ["x[\\]", "y[z-a]", "keep"]
+        self.assertTrue(ignored(rules, "keep"))
+        self.assertTrue(ignored(rules, "x[]"))
+        self.assertTrue(ignored(rules, "yz"))
+        self.assertFalse(ignored(rules, "yb"))
+
+
+if __name__ == "__main__":
+    unittest.main()
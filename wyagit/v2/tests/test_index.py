@@ -0,0 +1,52 @@
+import os
+import tempfile
+import unittest
+
+from unittest import mock
+
+from command.init import repo_create
+from common import index as index_module
+from common.helper_classes import GitBlob, object_write
+from common.index import GitIndex, index_entry_from_stat, index_read, index_tree, index_write
+from common.refs import LOCK_SUFFIX
+
+
+class IndexWriteTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.repo = repo_create(os.path.realpath(self.tmp.name))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_failed_write_leaves_no_lock(self):
+        path = os.path.join(self.repo.gitdir, "index")
+        with mock.patch.object(index_module, "lock_commit", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                index_write(self.repo, GitIndex())
+        self.assertFalse(os.path.exists(path + LOCK_SUFFIX))
+
+        index_write(self.repo, GitIndex())
+        self.assertEqual(index_read(self.repo).entries, [])
+
+
+class IndexTreeTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.repo = repo_create(os.path.realpath(self.tmp.name))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_each_tree_written_once(self):
+        sha = object_write(GitBlob(b"x\n"), self.repo)
+        st = os.stat(self.repo.gitdir)
+        index = GitIndex(entries=[index_entry_from_stat("a/b/c/x", sha, st, b"100644")])
+        with mock.patch.object(index_module, "object_write", wraps=object_write) as write:
+            root = index_tree(index).sha(self.repo)
+        self.assertEqual(write.call_count, 4)  # /, a, a/b, a/b/c
+        self.assertEqual(root, index_tree(index).sha())
+
+
+if __name__ == "__main__":
+    unittest.main()
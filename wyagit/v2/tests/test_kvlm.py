@@ -0,0 +1,43 @@
+import unittest
+
+from common.helper_classes import LazyKvlm, kvlm_parse
+
+COMMIT = (
+    b"tree 29ff16c9c14e2652b22f8b78bb08a5a07930c147\n"
+    b"parent 206941306e8a8af65b66eaaaea388a7ae24d49a0\n"
+    b"author Thibault Polge <thibault@thb.lt> 1527025023 +0200\n"
+    b"committer Thibault Polge <thibault@thb.lt> 1527025044 +0200\n"
+    b"\n"
+    b"Create first draft\n"
+)
+
+
+class LazyKvlmTest(unittest.TestCase):
+    def test_fresh_equals_parsed(self):
+        fresh, parsed = LazyKvlm(COMMIT), LazyKvlm(COMMIT)
+        parsed[b"author"]
+        self.assertEqual(fresh, parsed)
+        self.assertEqual(parsed, fresh)
+        self.assertFalse(fresh != parsed)
+
+    def test_equals_plain_dict(self):
+        plain = kvlm_parse(COMMIT)
+        self.assertEqual(LazyKvlm(COMMIT), plain)
+        self.assertEqual(plain, LazyKvlm(COMMIT))
+
+    def test_dict_operations_see_every_header(self):
+        kvlm = LazyKvlm(COMMIT)
+        self.assertIn(b"committer", dict(kvlm.items()))
+        self.assertIn(b"committer", kvlm | {})
+        self.assertIn(b"committer", {} | LazyKvlm(COMMIT))
+        self.assertIn(b"committer", LazyKvlm(COMMIT).copy())
+        self.assertEqual(list(reversed(LazyKvlm(COMMIT)))[0], None)  # The message comes last
+
+    def test_peek(self):
+        kvlm = LazyKvlm(COMMIT)
+        self.assertEqual(kvlm.peek(b"committer"), b"Thibault Polge <thibault@thb.lt> 1527025044 +0200")
+        self.assertIsNone(kvlm.peek(b"gpgsig"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import random
+import unittest
+
+from common.linediff import diff_hunks, split_lines
+
+
+def hunks_apply(old: list[bytes], hunks) -> list[bytes]:
+    out = list()
+    pos = 0
+    for hunk in hunks:
+        out += old[pos : hunk.a_start]
+        pos = hunk.a_start
+        for op, line in hunk.lines:
+            if op != "+":
+                assert old[pos] == line
+                pos += 1
+            if op != "-":
+                out.append(line)
+    return out + old[pos:]
+
+
+class DiffHunksTest(unittest.TestCase):
+    def test_insertion_slides_down(self):
+        old = split_lines(b"a\nb\n")
+        new = split_lines(b"a\nb\na\nb\n")
+        (hunk,) = diff_hunks(old, new)
+        self.assertEqual(hunk.lines, [(" ", b"a\n"), (" ", b"b\n"), ("+", b"a\n"), ("+", b"b\n")])
+
+    def test_slid_change_joins_the_next_one(self):
+        # The insertion slides through "b", "a" up against the deletion of
+        # the last "b": one change, removed lines first
+        old = split_lines(b"b\na\nb\n")
+        new = split_lines(b"a\nb\na\na\n")
+        (hunk,) = diff_hunks(old, new)
+        self.assertEqual(
+            hunk.lines,
+            [("+", b"a\n"), (" ", b"b\n"), (" ", b"a\n"), ("-", b"b\n"), ("+", b"a\n")],
+        )
+
+    def test_never_adds_before_removing(self):
+        rng = random.Random(1)
+        for _ in range(2000):
+            old = [rng.choice((b"a\n", b"b\n", b"c\n")) for _ in range(rng.randint(0, 10))]
+            new = [rng.choice((b"a\n", b"b\n", b"c\n")) for _ in range(rng.randint(0, 10))]
+            hunks = list(diff_hunks(old, new))
+            self.assertEqual(hunks_apply(old, hunks), new)
+            for hunk in hunks:
+                ops = "".join(op for op, _ in hunk.lines)
+                self.assertNotIn("+-", ops, (old, new))
+
+
+if __name__ == "__main__":
+    unittest.main()
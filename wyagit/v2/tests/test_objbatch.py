@@ -0,0 +1,44 @@
+import os
+import tempfile
+import unittest
+
+from command.init import repo_create
+from common.helper_classes import GitBlob, object_read, object_write
+from common.objbatch import ObjectBatch
+
+
+class ObjectBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.repo = repo_create(os.path.realpath(self.tmp.name))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_loose(self):
+        with ObjectBatch(self.repo):
+            sha = object_write(GitBlob(b"hello\n"), self.repo)
+            self.assertEqual(object_read(self.repo, sha).blobdata, b"hello\n")
+        self.assertTrue(os.path.isfile(os.path.join(self.repo.gitdir, "objects", sha[:2], sha[2:])))
+
+    def test_abort_installs_nothing(self):
+        with self.assertRaises(ValueError):
+            with ObjectBatch(self.repo):
+                sha = object_write(GitBlob(b"gone\n"), self.repo)
+                raise ValueError
+        self.assertIsNone(object_read(self.repo, sha))
+
+    def test_packed_objects_are_not_packed_again(self):
+        with ObjectBatch(self.repo, pack=True) as first:
+            old = object_write(GitBlob(b"old\n"), self.repo)
+        with ObjectBatch(self.repo, pack=True) as second:
+            object_write(GitBlob(b"old\n"), self.repo)
+            new = object_write(GitBlob(b"new\n"), self.repo)
+            self.assertEqual(list(second.pack.offsets), [new])
+        self.assertNotEqual(first.pack_name, second.pack_name)
+        self.assertEqual(object_read(self.repo, old).blobdata, b"old\n")
+        self.assertEqual(object_read(self.repo, new).blobdata, b"new\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
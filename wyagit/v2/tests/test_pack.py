@@ -0,0 +1,104 @@
+import hashlib
+import os
+import tempfile
+import unittest
+import zlib
+
+from command.init import repo_create
+from common.helper_classes import GitBlob, object_read, object_write, oid_index
+from common.pack import PACK_OFS_DELTA, PACK_REF_DELTA, PACK_TYPES, delta_apply, pack_index_write, pack_object_size
+
+
+def entry_header(type_num: int, size: int) -> bytes:
+    byte = type_num << 4 | size & 0x0F
+    size >>= 4
+    out = bytearray()
+    while size:
+        out.append(byte | 0x80)
+        byte = size & 0x7F
+        size >>= 7
+    out.append(byte)
+    return bytes(out)
+
+
+def ofs_encode(distance: int) -> bytes:
+    out = [distance & 0x7F]
+    distance >>= 7
+    while distance:
+        distance -= 1
+        out.insert(0, 0x80 | distance & 0x7F)
+        distance >>= 7
+    return bytes(out)
+
+
+class DeltaApplyTest(unittest.TestCase):
+    def test_copy_and_insert(self):
+        base = b"hello world\n"
+        # Copy "hello " (no offset byte: offset 0), insert, copy "world\n"
+        delta = bytes([12, 18, 0x90, 6, 6]) + b"there " + bytes([0x91, 6, 6])
+        self.assertEqual(delta_apply(base, delta), b"hello there world\n")
+
+    def test_size_zero_copies_64k(self):
+        base = bytes(range(256)) * 256
+        delta = bytes([0x80, 0x80, 0x04, 0x80, 0x80, 0x04, 0x80])
+        self.assertEqual(delta_apply(base, delta), base)
+
+    def test_bad_base_size(self):
+        with self.assertRaises(Exception):
+            delta_apply(b"short", bytes([12, 1, 1]) + b"x")
+
+
+class PackDeltaTest(unittest.TestCase):
+    """
+    A hand written pack: a blob, an OFS_DELTA against it, and a REF_DELTA
+    against a loose blob, the shapes git gc leaves behind
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.repo = repo_create(os.path.realpath(self.tmp.name))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def pack_write(self, entries: list[tuple[str, bytes]]):
+        pack = bytearray(b"PACK" + (2).to_bytes(4, "big") + len(entries).to_bytes(4, "big"))
+        index = list()
+        for sha, raw in entries:
+            index.append((bytes.fromhex(sha), zlib.crc32(raw), len(pack)))
+            pack += raw
+        pack_sha = hashlib.sha1(pack).digest()
+        pack += pack_sha
+        pack_dir = os.path.join(self.repo.gitdir, "objects", "pack")
+        os.makedirs(pack_dir, exist_ok=True)
+        path = os.path.join(pack_dir, f"pack-{pack_sha.hex()}")
+        with open(path + ".pack", "wb") as f:
+            f.write(pack)
+        with open(path + ".idx", "wb") as f:
+            pack_index_write(f, index, pack_sha)
+
+    def test_deltas(self):
+        base = b"hello world\n"
+        ofs_target = b"hello there world\n"
+        loose = b"loose base\n"
+        ref_target = b"loose base!\n"
+        # Only the REF_DELTA base is a loose object
+        loose_sha = object_write(GitBlob(loose), self.repo)
+        base_sha, ofs_sha, ref_sha = (object_write(GitBlob(data), None) for data in (base, ofs_target, ref_target))
+
+        base_entry = entry_header(PACK_TYPES[b"blob"], len(base)) + zlib.compress(base)
+        ofs_delta = bytes([12, 18, 0x90, 6, 6]) + b"there " + bytes([0x91, 6, 6])
+        ofs_entry = entry_header(PACK_OFS_DELTA, len(ofs_delta)) + ofs_encode(len(base_entry)) + zlib.compress(ofs_delta)
+        ref_delta = bytes([11, 12, 0x90, 10, 2]) + b"!\n"
+        ref_entry = entry_header(PACK_REF_DELTA, len(ref_delta)) + bytes.fromhex(loose_sha) + zlib.compress(ref_delta)
+        self.pack_write([(base_sha, base_entry), (ofs_sha, ofs_entry), (ref_sha, ref_entry)])
+
+        self.assertEqual(object_read(self.repo, ofs_sha).blobdata, ofs_target)
+        self.assertEqual(object_read(self.repo, ref_sha).blobdata, ref_target)
+        packs = oid_index(self.repo).packs()
+        self.assertEqual(pack_object_size(packs, base_sha), len(base))
+        self.assertEqual(pack_object_size(packs, ofs_sha), len(ofs_target))
+        self.assertEqual(pack_object_size(packs, ref_sha), len(ref_target))
+
+if __name__ == "__main__":
+    unittest.main()
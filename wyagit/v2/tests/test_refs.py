@@ -0,0 +1,50 @@
+import os
+import tempfile
+import unittest
+
+from unittest import mock
+
+from command.init import repo_create
+from common import refs
+from common.refs import LOCK_SUFFIX, FilesRefBackend, ReftableRefBackend
+
+
+class ReftableCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.repo = repo_create(os.path.realpath(self.tmp.name), ref_format="reftable")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_cache_follows_the_stack(self):
+        backend = ReftableRefBackend(self.repo.gitdir)
+        for i in range(200):
+            backend.commit({f"refs/heads/b{i % 5}": f"{i:040x}"}, dict())
+            self.assertEqual(backend.read_ref(f"refs/heads/b{i % 5}"), f"{i:040x}")
+        self.assertEqual(sorted(backend.cache), sorted(backend.stack()))
+
+
+class FilesCommitTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.repo = repo_create(os.path.realpath(self.tmp.name))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_failed_commit_leaves_no_lock(self):
+        backend = FilesRefBackend(self.repo.gitdir)
+        updates = {"refs/heads/a": "1" * 40, "refs/heads/b": "2" * 40}
+        with mock.patch.object(refs, "lock_commit", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                backend.commit(updates, dict())
+        for name in updates:
+            self.assertFalse(os.path.exists(os.path.join(self.repo.gitdir, name + LOCK_SUFFIX)))
+
+        backend.commit(updates, dict())
+        self.assertEqual(backend.read_ref("refs/heads/b"), "2" * 40)
+
+
+if __name__ == "__main__":
+    unittest.main()
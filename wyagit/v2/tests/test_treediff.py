@@ -0,0 +1,49 @@
+import os
+import tempfile
+import unittest
+
+from command.init import repo_create
+from common.helper_classes import GitBlob, GitTree, GitTreeLeaf, object_read, object_write, repo_cache_enable
+from common.treediff import diff_trees
+
+
+class DiffTreesTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.repo = repo_create(os.path.realpath(self.tmp.name))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def tree(self, entries: dict) -> str:
+        """
+        Write a tree of {name: content or {subtree}}
+        """
+        tree = GitTree()
+        leaves = list()
+        for name, value in entries.items():
+            if isinstance(value, dict):
+                leaves.append(GitTreeLeaf(b"040000", name, self.tree(value)))
+            else:
+                leaves.append(GitTreeLeaf(b"100644", name, object_write(GitBlob(value), self.repo)))
+        leaves.sort(key=lambda leaf: leaf.path + "/" if leaf.mode == b"040000" else leaf.path)
+        tree.items = leaves
+        return object_write(tree, self.repo)
+
+    def test_changes_in_path_order(self):
+        old = self.tree({"a": b"1", "d": {"x": b"1", "y": b"1"}, "d.txt": b"1", "gone": b"1"})
+        new = self.tree({"a": b"2", "d": {"x": b"1", "z": b"1"}, "d.txt": b"1", "new": b"1"})
+        changes = [(c.status, c.path) for c in diff_trees(self.repo, old, new)]
+        self.assertEqual(changes, [("M", "a"), ("D", "d/y"), ("A", "d/z"), ("D", "gone"), ("A", "new")])
+
+    def test_trees_are_not_expanded_into_leaves(self):
+        old = self.tree({"a": b"1", "b": {"c": b"1"}})
+        new = self.tree({"a": b"2", "b": {"c": b"2"}})
+        repo_cache_enable(self.repo)  # To look at the very trees the diff read
+        list(diff_trees(self.repo, old, new))
+        for tree in (old, new, object_read(self.repo, old).sha(1)):
+            self.assertIsNone(object_read(self.repo, tree)._items)
+
+
+if __name__ == "__main__":
+    unittest.main()